@@ -0,0 +1,103 @@
+"""Compare approximate index types of `kth_sr.FAISS` with the flat baseline.
+
+Reports recall@k against exact search, search latency, index memory and build time
+on synthetic 512-d speaker embeddings.
+
+Run:
+    python benchmarks/ann_backends.py --n-vectors 100000 --n-queries 1000
+"""
+
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from kth_sr.vectorstore import FAISS
+
+CONFIGS = [
+    ("flat", {}, [{}]),
+    ("ivf_flat", {}, [{"nprobe": 1}, {"nprobe": 8}, {"nprobe": 32}]),
+    ("ivf_pq", {}, [{"nprobe": 8}, {"nprobe": 32}]),
+    ("hnsw", {}, [{"ef_search": 16}, {"ef_search": 64}, {"ef_search": 256}]),
+    ("sq_fp16", {}, [{}]),
+    ("sq8", {}, [{}]),
+]
+"""Index type, index parameters and search parameters to evaluate."""
+
+
+def synthetic_embeddings(
+    n_vectors: int, n_speakers: int, dimension: int, rng: np.random.Generator
+) -> tuple[np.ndarray, np.ndarray]:
+    """Unit vectors scattered around random speaker centres.
+
+    Returns:
+        tuple: Tuple of `vectors` (n_vectors, dimension) and `speakers` (n_vectors,).
+    """
+    centres = rng.normal(size=(n_speakers, dimension)).astype(np.float32)
+    speakers = rng.integers(0, n_speakers, size=n_vectors)
+    noise = rng.normal(scale=0.8, size=(n_vectors, dimension)).astype(np.float32)
+    vectors = centres[speakers] + noise
+    faiss.normalize_L2(vectors)
+    return vectors, speakers
+
+
+def recall_at_k(found: np.ndarray, expected: np.ndarray) -> float:
+    """Share of the exact k nearest neighbours found by the approximate search."""
+    hits = [len(np.intersect1d(f, e)) for f, e in zip(found, expected)]
+    return float(np.sum(hits)) / expected.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--n-vectors", type=int, default=100_000)
+    parser.add_argument("--n-speakers", type=int, default=6_000)
+    parser.add_argument("--n-queries", type=int, default=1_000)
+    parser.add_argument("--dimension", type=int, default=512)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    vectors, _ = synthetic_embeddings(
+        args.n_vectors + args.n_queries, args.n_speakers, args.dimension, rng
+    )
+    vectors, queries = vectors[: args.n_vectors], vectors[args.n_vectors :]
+    # metadata are vector positions, so results can be compared with exact search
+    metadata = list(range(args.n_vectors))
+
+    print(
+        f"{args.n_vectors} vectors, {args.n_queries} queries, "
+        f"d={args.dimension}, k={args.k}"
+    )
+    print(
+        f"{'index':<10} {'search params':<16} {'recall@k':>8} {'ms/query':>9} "
+        f"{'memory MB':>10} {'build s':>8}"
+    )
+
+    expected = None
+    for index_type, index_params, search_params_list in CONFIGS:
+        vstore = FAISS(args.dimension, index_type, **index_params)
+        start = time.perf_counter()
+        vstore.build(vectors, metadata)
+        build_s = time.perf_counter() - start
+        memory_mb = faiss.serialize_index(vstore._vstore).nbytes / 2**20
+
+        for search_params in search_params_list:
+            vstore.set_search_params(**search_params)
+            start = time.perf_counter()
+            _, found = vstore.search(queries, args.k)
+            ms_per_query = (time.perf_counter() - start) * 1000 / args.n_queries
+
+            found = np.array(found)
+            if expected is None:
+                expected = found
+            params = ",".join(f"{k}={v}" for k, v in search_params.items()) or "-"
+            print(
+                f"{index_type:<10} {params:<16} {recall_at_k(found, expected):>8.3f} "
+                f"{ms_per_query:>9.3f} {memory_mb:>10.1f} {build_s:>8.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Compare per-request `predict` calls with `BatchedPredictor` under concurrent load.
+
+Uses a randomly initialised `DeepSpeakerModel`, so it runs offline.
+
+Run:
+    python benchmarks/batching.py --concurrency 1 4 16 32
+"""
+
+import argparse
+import threading
+import time
+
+import numpy as np
+from deep_speaker.conv_models import DeepSpeakerModel
+
+from kth_sr.batching import BatchedPredictor
+
+
+def run_clients(predict, concurrency: int, n_requests: int, windows: np.ndarray):
+    """Send `n_requests` requests from each of `concurrency` threads.
+
+    Returns:
+        tuple: Tuple of requests per second and latencies of all requests in ms.
+    """
+    latencies = []
+
+    def client():
+        for _ in range(n_requests):
+            start = time.perf_counter()
+            predict(windows)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    return concurrency * n_requests / elapsed, np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 32])
+    parser.add_argument("--requests", type=int, default=10, help="per client")
+    parser.add_argument("--windows", type=int, default=10, help="per request")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    model = DeepSpeakerModel()
+    windows = np.random.default_rng(0).random(
+        (args.windows, 160, 64, 1), dtype=np.float32
+    )
+    # trace the model once, so the first measurement is not skewed
+    model.m.predict(windows, verbose=0)
+
+    print(f"{args.windows} windows per request, {args.requests} requests per client")
+    print(f"{'mode':<8} {'clients':>7} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8}")
+    for concurrency in args.concurrency:
+        results = {
+            "direct": run_clients(
+                lambda w: model.m.predict(w, verbose=0),
+                concurrency,
+                args.requests,
+                windows,
+            )
+        }
+        with BatchedPredictor(model, args.batch_size, args.max_wait_ms) as predictor:
+            results["batched"] = run_clients(
+                predictor.predict, concurrency, args.requests, windows
+            )
+
+        for mode, (throughput, latencies) in results.items():
+            p50, p95 = np.percentile(latencies, [50, 95])
+            print(
+                f"{mode:<8} {concurrency:>7} {throughput:>7.1f} {p50:>8.1f} {p95:>8.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
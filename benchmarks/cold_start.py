@@ -0,0 +1,84 @@
+"""Measure cold start of the demo app: import, time to ready and first requests.
+
+Every measurement runs in a fresh process started in the directory holding the
+demo's `data` folder. The process imports the app, waits until it is ready to
+identify speakers and posts the same recording to /findmatch twice, the second
+request shows the latency of a warm server.
+
+Run:
+    python benchmarks/cold_start.py --data-dir . --audio recording.wav --runs 3
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+
+COLD_START_SCRIPT = """
+import json, sys, time
+begin = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import app as demo
+imported = time.perf_counter()
+if hasattr(demo, "startup"):
+    demo.startup.start()
+    demo.startup.wait()
+ready = time.perf_counter()
+client = demo.app.test_client()
+audio = open(sys.argv[2], "rb").read()
+latencies = []
+for i in range(2):
+    # a distinct upload each time, so the embedding cache does not answer the second
+    audio = audio[:-2] + bytes([i, i])
+    t = time.perf_counter()
+    response = client.post("/findmatch", data={"audio": (__import__("io").BytesIO(audio), "a.wav")})
+    latencies.append(time.perf_counter() - t)
+    assert response.get_json()["status"] == 200, response.get_json()
+print(json.dumps({
+    "import": imported - begin,
+    "ready": ready - begin,
+    "first request": latencies[0],
+    "second request": latencies[1],
+}))
+"""
+"""Prints seconds spent importing, until ready and in the first two requests."""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--data-dir", type=Path, default=Path("."), help="directory with data/"
+    )
+    parser.add_argument("--audio", type=Path, required=True, help="recording to post")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    demo_dir = Path(__file__).resolve().parents[1] / "src" / "demo"
+    results = []
+    for _ in range(args.runs):
+        output = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                COLD_START_SCRIPT,
+                str(demo_dir),
+                str(args.audio.resolve()),
+            ],
+            cwd=args.data_dir,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        results.append(json.loads(output.strip().split("\n")[-1]))
+
+    print(f"{'stage':>16} {'median (s)':>11} {'max (s)':>8}")
+    for stage in results[0]:
+        times = [r[stage] for r in results]
+        print(f"{stage:>16} {np.median(times):11.3f} {max(times):8.3f}")
+
+
+if __name__ == "__main__":
+    main()
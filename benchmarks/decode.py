@@ -0,0 +1,95 @@
+"""Compare in-memory `decode_audio` with saving uploads to a temp file for librosa.
+
+Inputs are synthetic recordings encoded to WAV, MP3 and WebM, the latter two need
+`ffmpeg` on the PATH.
+
+Run:
+    python benchmarks/decode.py --seconds 10 --repeat 20
+"""
+
+import argparse
+import io
+import subprocess
+import tempfile
+import time
+import warnings
+from pathlib import Path
+
+import librosa
+import numpy as np
+import soundfile
+
+from kth_sr.audio import decode_audio
+
+SAMPLE_RATE = 16000
+
+
+def encode_ffmpeg(audio: np.ndarray, rate: int, codec: str, container: str) -> bytes:
+    """Encode float32 audio with ffmpeg."""
+    return subprocess.run(
+        ["ffmpeg", "-loglevel", "error", "-f", "f32le", "-ar", str(rate), "-ac", "1"]
+        + ["-i", "pipe:0", "-c:a", codec, "-f", container, "pipe:1"],
+        input=audio.astype(np.float32).tobytes(),
+        capture_output=True,
+        check=True,
+    ).stdout
+
+
+def encode_wav(audio: np.ndarray, rate: int) -> bytes:
+    """Encode audio as 16 bit PCM WAV."""
+    buffer = io.BytesIO()
+    soundfile.write(buffer, audio, rate, format="WAV", subtype="PCM_16")
+    return buffer.getvalue()
+
+
+def decode_tempfile(data: bytes) -> np.ndarray:
+    """Decoding path of the demo before in-memory decoding."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_wav_path = Path(temp_dir) / "temp_audio.wav"
+        temp_wav_path.write_bytes(data)
+        # librosa warns about the audioread fallback for WebM
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            audio, _ = librosa.load(str(temp_wav_path), sr=SAMPLE_RATE, mono=True)
+    return audio
+
+
+def median_ms(decode, data: bytes, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        decode(data)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+
+    def recording(rate: int) -> np.ndarray:
+        n = int(args.seconds * rate)
+        t = np.arange(n) / rate
+        return 0.3 * np.sin(2 * np.pi * 220 * t) + 0.05 * rng.normal(size=n)
+
+    inputs = {
+        "wav 16k": encode_wav(recording(16000), 16000),
+        "wav 44.1k": encode_wav(recording(44100), 44100),
+        "mp3 44.1k": encode_ffmpeg(recording(44100), 44100, "libmp3lame", "mp3"),
+        "webm 48k": encode_ffmpeg(recording(48000), 48000, "libopus", "webm"),
+    }
+
+    print(f"{args.seconds:g} s recordings, median of {args.repeat} runs")
+    print(f"{'input':<10} {'tempfile ms':>12} {'in-memory ms':>13}")
+    for name, data in inputs.items():
+        old = median_ms(decode_tempfile, data, args.repeat)
+        new = median_ms(lambda d: decode_audio(d, SAMPLE_RATE), data, args.repeat)
+        print(f"{name:<10} {old:>12.1f} {new:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Compare cold start and memory of loading a `kth_sr.FAISS` store.
+
+Every load runs in a fresh process, which reports the load time and its resident
+memory (anonymous memory is private to the process, file-backed memory is shared
+through the OS page cache).
+
+Run:
+    python benchmarks/load_store.py --n-vectors 1000000
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from kth_sr.vectorstore import FAISS
+
+LOAD_SCRIPT = """
+import sys, time
+t = time.perf_counter()
+from kth_sr.vectorstore import FAISS
+{load}
+t = time.perf_counter() - t
+status = dict(l.split(":") for l in open("/proc/self/status") if l.startswith("Rss"))
+print(t, int(status["RssAnon"].split()[0]), int(status["RssFile"].split()[0]))
+"""
+"""Loads the store and prints load time, anonymous and file-backed memory in kB."""
+
+MODES = {
+    "legacy json": "import json, faiss\n"
+    "index = faiss.read_index(sys.argv[1] + '/vector_store.index')\n"
+    "metadata = json.load(open(sys.argv[1] + '/metadata.json'))",
+    "columnar": "vstore = FAISS.load(sys.argv[1])",
+    "columnar mmap": "vstore = FAISS.load(sys.argv[1], mmap=True)",
+}
+"""Load modes to compare, the legacy mode mirrors the loader before columnar metadata."""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--n-vectors", type=int, default=1_000_000)
+    parser.add_argument("--n-speakers", type=int, default=6_000)
+    parser.add_argument("--dimension", type=int, default=512)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as path:
+        vstore = FAISS(args.dimension)
+        labels = [f"id{i:05d}" for i in range(args.n_speakers)]
+        metadata = [labels[i] for i in rng.integers(0, args.n_speakers, args.n_vectors)]
+        for start in range(0, args.n_vectors, 100_000):
+            chunk = min(100_000, args.n_vectors - start)
+            vectors = rng.random((chunk, args.dimension), dtype=np.float32)
+            vstore.add(vectors, metadata[start : start + chunk])
+        vstore.save(path)
+        with open(Path(path) / "metadata.json", "w") as f:
+            json.dump(metadata, f)
+        del vstore
+
+        print(f"{args.n_vectors} vectors, d={args.dimension}")
+        print(f"{'mode':<14} {'load s':>7} {'private MB':>11} {'shared MB':>10}")
+        for mode, load in MODES.items():
+            out = subprocess.run(
+                [sys.executable, "-c", LOAD_SCRIPT.format(load=load), path],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.split("\n")[-2]
+            load_s, anon_kb, file_kb = out.split()
+            print(
+                f"{mode:<14} {float(load_s):>7.2f} {int(anon_kb) / 1024:>11.0f} "
+                f"{int(file_kb) / 1024:>10.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
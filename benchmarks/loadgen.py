@@ -0,0 +1,134 @@
+"""Generate concurrent load on the demo `/findmatch` endpoint.
+
+Sends a WAV recording (synthetic by default) from several client threads and
+reports requests per second and latency percentiles. The last bytes of every upload
+are rewritten with the concurrency level, client and request index, so the embedding cache of the server
+does not answer them, unless `--repeat-upload` measures cache hits on purpose.
+
+Run:
+    python benchmarks/loadgen.py --url http://localhost:8000/findmatch \\
+        --concurrency 1 8 32 --requests 20
+"""
+
+import argparse
+import io
+import struct
+import threading
+import time
+import urllib.request
+import uuid
+
+import numpy as np
+import soundfile
+
+
+def synthetic_wav(seconds: float, sample_rate: int = 16000) -> bytes:
+    """Noisy harmonic signal encoded as 16 bit WAV."""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    audio = 0.3 * np.sin(2 * np.pi * 140 * t) * (1 + np.sin(2 * np.pi * 3 * t))
+    audio += 0.05 * rng.normal(size=len(t))
+    buffer = io.BytesIO()
+    soundfile.write(buffer, audio, sample_rate, format="WAV", subtype="PCM_16")
+    return buffer.getvalue()
+
+
+def multipart(field: str, data: bytes) -> tuple[bytes, str]:
+    """Encode a file upload as multipart/form-data."""
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; filename="audio.wav"\r\n'
+        "Content-Type: audio/wav\r\n\r\n"
+    ).encode()
+    body += data + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def unique_upload(data: bytes, *indices: int) -> bytes:
+    """Rewrite the last bytes of a recording, so every request has other content."""
+    return data[: -2 * len(indices)] + struct.pack(
+        f"<{len(indices)}H", *(i % 2**16 for i in indices)
+    )
+
+
+def run(url: str, data: bytes, concurrency: int, n: int, repeat: bool = False):
+    """Send `n` requests from each of `concurrency` threads.
+
+    Args:
+        url (str): URL of the endpoint.
+        data (bytes): Recording to upload.
+        concurrency (int): Number of client threads.
+        n (int): Number of requests of each client.
+        repeat (bool, optional): Upload the same bytes in every request, so all but
+        the first are answered by the embedding cache. Defaults to False.
+
+    Returns:
+        tuple: Requests per second, latencies in ms and number of failed requests.
+    """
+    latencies = []
+    errors = []
+
+    def client(index: int):
+        for i in range(n):
+            upload = data if repeat else unique_upload(data, concurrency, index, i)
+            body, content_type = multipart("audio", upload)
+            req = urllib.request.Request(
+                url, data=body, headers={"Content-Type": content_type}
+            )
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(req) as response:
+                    ok = b'"status":200' in response.read().replace(b" ", b"")
+            except OSError:
+                ok = False
+            latencies.append((time.perf_counter() - start) * 1000)
+            if not ok:
+                errors.append(1)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return concurrency * n / elapsed, np.array(latencies), len(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--url", default="http://localhost:8000/findmatch")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=20, help="per client")
+    parser.add_argument("--audio", help="WAV/MP3/WebM file to send")
+    parser.add_argument("--seconds", type=float, default=10, help="synthetic audio")
+    parser.add_argument(
+        "--repeat-upload",
+        action="store_true",
+        help="send identical uploads, measuring embedding cache hits",
+    )
+    args = parser.parse_args()
+
+    if args.audio:
+        with open(args.audio, "rb") as f:
+            data = f.read()
+    else:
+        data = synthetic_wav(args.seconds)
+
+    print(
+        f"{'clients':>7} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} errors"
+    )
+    for concurrency in args.concurrency:
+        throughput, latencies, errors = run(
+            args.url, data, concurrency, args.requests, args.repeat_upload
+        )
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        print(
+            f"{concurrency:>7} {throughput:>7.1f} {p50:>8.1f} {p95:>8.1f} "
+            f"{p99:>8.1f} {errors:>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Compare reading rows of some speakers from the metadata CSV and a columnar table.
+
+A synthetic `dev.csv` with the columns and size of the VoxCeleb2 dev metadata is
+converted with `convert_metadata`. The CSV path parses the whole file and filters it
+with pandas, like `get_celeb_data` did, the columnar path is `read_metadata`. Both
+read the first video of `--speakers` random speakers. Files are in the page cache,
+reads from disk favour the columnar table further.
+
+Run:
+    python benchmarks/metadata.py --rows 1092009 --speakers 20 200 2000
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from kth_sr.loaddata import convert_metadata, read_metadata
+
+
+def timed(fn, repeat: int) -> float:
+    """Median seconds of the calls."""
+    times = []
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - begin)
+    return float(np.median(times))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--rows", type=int, default=1_092_009)
+    parser.add_argument("--n-speakers", type=int, default=5_994)
+    parser.add_argument("--speakers", type=int, nargs="+", default=[20, 200, 2000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    start_time = rng.random(args.rows) * 100
+    length = rng.random(args.rows) * 10 + 4
+    dev = pd.DataFrame(
+        {
+            "speaker": [
+                f"id{s:05d}" for s in rng.integers(0, args.n_speakers, args.rows)
+            ],
+            "video": [f"{v:011x}" for v in rng.integers(0, 2**44, args.rows)],
+            "start_time": start_time.round(2),
+            "end_time": (start_time + length).round(2),
+            "length": length.round(2),
+            "txt_file": [f"{i % 1000:05d}.txt" for i in range(args.rows)],
+        }
+    )
+    ids = dev["speaker"].unique()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        dev.to_csv(Path(data_dir) / "dev.csv", index=False)
+        begin = time.perf_counter()
+        convert_metadata(data_dir)
+        convert = time.perf_counter() - begin
+        csv_mb = (Path(data_dir) / "dev.csv").stat().st_size / 2**20
+        print(f"{args.rows} rows, {csv_mb:.0f} MB CSV, converted in {convert:.1f} s")
+        print(f"{'speakers':>9} {'csv (ms)':>10} {'columnar (ms)':>14} {'speedup':>8}")
+
+        for n in args.speakers:
+            speakers = rng.choice(ids, n, replace=False).tolist()
+
+            def from_csv(speakers=speakers):
+                df = pd.read_csv(Path(data_dir) / "dev.csv")
+                df = df[df["speaker"].isin(speakers)]
+                return df[["speaker", "video", "start_time"]].drop_duplicates(
+                    subset=["speaker"], keep="first"
+                )
+
+            def from_table(speakers=speakers):
+                return read_metadata(
+                    "dev", speakers, ["video", "start_time"], True, data_dir
+                )
+
+            assert len(from_csv()) == len(from_table())
+            csv = timed(from_csv, args.repeat)
+            table = timed(from_table, args.repeat)
+            print(f"{n:>9} {csv * 1000:10.1f} {table * 1000:14.2f} {csv / table:7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
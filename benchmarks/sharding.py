@@ -0,0 +1,66 @@
+"""Measure search throughput of a sharded store with a growing number of shards.
+
+Random vectors of `--n-speakers` speakers are split across the shards by speaker,
+then batches of random queries are searched. The in-process `FAISS` store is the
+baseline, each shard count uses the same total number of threads.
+
+Run:
+    python benchmarks/sharding.py --n-vectors 200000 --shards 1 2 4
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+from kth_sr.sharding import ShardedFAISS
+from kth_sr.vectorstore import FAISS
+
+
+def throughput(vstore, queries: np.ndarray, batch_size: int, k: int) -> float:
+    """Return queries per second searching the queries in batches."""
+    vstore.search(queries[:batch_size], k)  # warm up
+    begin = time.perf_counter()
+    for i in range(0, len(queries), batch_size):
+        vstore.search(queries[i : i + batch_size], k)
+    return len(queries) / (time.perf_counter() - begin)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--n-vectors", type=int, default=200_000)
+    parser.add_argument("--n-speakers", type=int, default=6_000)
+    parser.add_argument("--dimension", type=int, default=512)
+    parser.add_argument("--n-queries", type=int, default=2_000)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((args.n_vectors, args.dimension), dtype=np.float32)
+    metadata = (np.arange(args.n_vectors) % args.n_speakers).tolist()
+    queries = rng.standard_normal((args.n_queries, args.dimension), dtype=np.float32)
+    cpus = os.cpu_count() or 1
+
+    single = FAISS(args.dimension)
+    single.add(vectors, metadata)
+    baseline = throughput(single, queries, args.batch_size, args.k)
+    print(f"{cpus} cores, {args.n_vectors} vectors, batches of {args.batch_size}")
+    print(f"{'store':>12} {'queries/s':>10} {'speedup':>8}")
+    print(f"{'in-process':>12} {baseline:10.0f} {1:8.2f}")
+    del single
+
+    for n_shards in args.shards:
+        threads = max(cpus // n_shards, 1)
+        with ShardedFAISS(
+            n_shards, args.dimension, threads_per_shard=threads
+        ) as vstore:
+            vstore.add(vectors, metadata)
+            qps = throughput(vstore, queries, args.batch_size, args.k)
+        print(f"{f'{n_shards} shards':>12} {qps:10.0f} {qps / baseline:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""Benchmark the identification pipeline and flag regressions against a baseline.
+
+Runs offline on synthetic data: noisy harmonic recordings, stores of random vectors
+of each of `--sizes` and the demo app serving a randomly initialised
+`DeepSpeakerModel`. Every case is timed `--repeat` times after a warm-up call and
+the results are written to a JSON file keyed by case name. Given the results of an
+earlier run as `--baseline`, cases whose median time grew by more than `--tolerance`
+are flagged and the script exits with status 1.
+
+Run:
+    python benchmarks/suite.py --sizes 1000 100000 1000000 --output baseline.json
+    python benchmarks/suite.py --sizes 1000 100000 1000000 --baseline baseline.json
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+import pandas as pd
+import soundfile
+
+from kth_sr.mfcc import first_k_windows
+from kth_sr.vectorstore import FAISS
+
+SAMPLE_RATE = 16000
+NUM_FRAMES = 160
+CASES = ("first_k_windows", "search", "apply_threshold", "load", "findmatch")
+
+
+def synthetic_audio(seconds: float, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """Noisy harmonic signal with a slow amplitude modulation, like voiced speech."""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    audio = 0.3 * np.sin(2 * np.pi * 140 * t) * (1 + np.sin(2 * np.pi * 3 * t))
+    return (audio + 0.05 * rng.normal(size=len(t))).astype(np.float32)
+
+
+def random_store(n_vectors: int, n_speakers: int, dimension: int) -> FAISS:
+    """Flat store of random vectors labelled with `n_speakers` speakers."""
+    rng = np.random.default_rng(0)
+    vstore = FAISS(dimension)
+    for start in range(0, n_vectors, 100_000):
+        n = min(100_000, n_vectors - start)
+        vectors = rng.standard_normal((n, dimension), dtype=np.float32)
+        speakers = np.arange(start, start + n) % n_speakers
+        vstore.add(vectors, [f"id{s:05d}" for s in speakers])
+    return vstore
+
+
+def timed(fn, repeat: int) -> dict:
+    """Time `repeat` calls of fn after one warm-up call."""
+    fn()
+    times = []
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - begin)
+    return {
+        "median_s": float(np.median(times)),
+        "min_s": float(np.min(times)),
+        "max_s": float(np.max(times)),
+        "repeat": repeat,
+    }
+
+
+def bench_first_k_windows(args) -> dict:
+    results = {}
+    for seconds in args.audio_seconds:
+        audio = synthetic_audio(seconds)
+        results[f"first_k_windows/seconds={seconds:g}"] = timed(
+            lambda audio=audio: first_k_windows(
+                audio, SAMPLE_RATE, NUM_FRAMES, args.windows
+            ),
+            args.repeat,
+        )
+    return results
+
+
+def bench_apply_threshold(args) -> dict:
+    rng = np.random.default_rng(0)
+    results = {}
+    for rows in args.threshold_rows:
+        distances = np.sort(rng.random((rows, args.k), dtype=np.float32), axis=1)
+        metadata = rng.integers(0, args.n_speakers, (rows, args.k)).tolist()
+        results[f"apply_threshold/rows={rows}"] = timed(
+            lambda distances=distances, metadata=metadata: FAISS.apply_threshold(
+                distances, metadata, 0.5
+            ),
+            args.repeat,
+        )
+    return results
+
+
+def bench_store(args, cases: set) -> dict:
+    """Time searching and loading a store of every size, built once per size."""
+    queries = np.random.default_rng(1).standard_normal(
+        (args.windows, args.dimension), dtype=np.float32
+    )
+    results = {}
+    for size in args.sizes:
+        vstore = random_store(size, args.n_speakers, args.dimension)
+        if "search" in cases:
+            results[f"search/n={size}"] = timed(
+                lambda vstore=vstore: vstore.search(queries, args.k), args.repeat
+            )
+        if "load" in cases:
+            with tempfile.TemporaryDirectory() as path:
+                vstore.save(path)
+                # at most one copy of the vectors in memory while loading
+                del vstore
+                results[f"load/n={size}"] = timed(
+                    lambda path=path: FAISS.load(path), args.repeat
+                )
+        vstore = None
+    return results
+
+
+def bench_findmatch(args) -> dict:
+    """Time /findmatch of the demo app in-process, with a random model and store."""
+    from deep_speaker.conv_models import DeepSpeakerModel
+
+    demo_dir = Path(__file__).resolve().parents[1] / "src" / "demo"
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as data_dir:
+        # the demo loads everything from paths relative to the working directory
+        os.chdir(data_dir)
+        try:
+            sys.path.insert(0, str(demo_dir))
+            import app as demo
+
+            Path("data").mkdir()
+            DeepSpeakerModel().m.save_weights(demo.CHECKPOINT)
+            random_store(args.findmatch_vectors, args.n_speakers, 512).save(
+                demo.STORE_PATH
+            )
+            ids = [f"id{s:05d}" for s in range(args.n_speakers)]
+            pd.DataFrame(
+                {
+                    "VoxCeleb2_ID": ids,
+                    "Name": [f"Speaker {s}" for s in ids],
+                    "video": "",
+                    "start_time": 0,
+                    "image_url": "",
+                    "wiki_description": "",
+                    "wiki_url": "",
+                }
+            ).to_csv("data/celeb_data_with_wiki.csv", index=False)
+
+            demo.startup.start()
+            if not demo.startup.wait():
+                raise RuntimeError(f"Demo failed to start: {demo.startup.error}")
+
+            buffer = io.BytesIO()
+            soundfile.write(
+                buffer,
+                synthetic_audio(args.findmatch_seconds),
+                SAMPLE_RATE,
+                format="WAV",
+                subtype="PCM_16",
+            )
+            audio = buffer.getvalue()
+            client = demo.app.test_client()
+            n_requests = iter(range(sys.maxsize))
+
+            def post():
+                # a distinct upload each time, so the embedding cache never answers
+                i = next(n_requests)
+                upload = audio[:-4] + i.to_bytes(4, "little")
+                response = client.post(
+                    "/findmatch", data={"audio": (io.BytesIO(upload), "audio.wav")}
+                )
+                assert response.get_json()["status"] == 200, response.get_json()
+
+            name = f"findmatch/n={args.findmatch_vectors}"
+            return {name: timed(post, args.repeat)}
+        finally:
+            os.chdir(cwd)
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Return names of the cases slower than the baseline by more than tolerance."""
+    print(f"{'case':>32} {'median (ms)':>12} {'baseline (ms)':>14} {'ratio':>7}")
+    regressions = []
+    for name, result in results.items():
+        median = result["median_s"] * 1000
+        if name not in baseline:
+            print(f"{name:>32} {median:12.2f} {'-':>14} {'-':>7}")
+            continue
+        base = baseline[name]["median_s"] * 1000
+        ratio = median / base
+        flag = ""
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+            flag = "  regression"
+        print(f"{name:>32} {median:12.2f} {base:14.2f} {ratio:7.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=list(CASES))
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--n-speakers", type=int, default=200)
+    parser.add_argument("--dimension", type=int, default=512)
+    parser.add_argument("--windows", type=int, default=100, help="windows per query")
+    parser.add_argument("--k", type=int, default=6)
+    parser.add_argument(
+        "--audio-seconds", type=float, nargs="+", default=[5.0, 30.0, 120.0]
+    )
+    parser.add_argument(
+        "--threshold-rows", type=int, nargs="+", default=[100, 10_000, 100_000]
+    )
+    parser.add_argument("--findmatch-vectors", type=int, default=9_000)
+    parser.add_argument("--findmatch-seconds", type=float, default=10.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", type=Path, default=Path("benchmark_results.json"))
+    parser.add_argument("--baseline", type=Path, help="results of an earlier run")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="relative slowdown of the median flagged as a regression",
+    )
+    args = parser.parse_args()
+
+    cases = set(args.cases)
+    results = {}
+    if "first_k_windows" in cases:
+        results.update(bench_first_k_windows(args))
+    if cases & {"search", "load"}:
+        results.update(bench_store(args, cases))
+    if "apply_threshold" in cases:
+        results.update(bench_apply_threshold(args))
+    if "findmatch" in cases:
+        results.update(bench_findmatch(args))
+
+    with open(args.output, "w") as f:
+        json.dump(
+            {
+                "machine": {
+                    "platform": platform.platform(),
+                    "python": platform.python_version(),
+                    "cpus": os.cpu_count(),
+                    "numpy": np.__version__,
+                    "faiss": faiss.__version__,
+                },
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+
+    baseline = {}
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"{len(regressions)} regressions over {args.tolerance:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Measure real-time factor and memory of `speaker_timeline` on long recordings.
+
+Recordings of alternating synthetic speakers, tones with noise, are generated chunk by
+chunk and labelled with a randomly initialised `DeepSpeakerModel` against a random
+store, so it runs offline. The real-time factor is processing time divided by audio
+duration, below 1 is faster than real time. Peak memory allocated by the timeline,
+traced in a second run, should not grow with the duration.
+
+Run:
+    python benchmarks/timeline.py --minutes 1 10 30
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+from deep_speaker.conv_models import DeepSpeakerModel
+
+from kth_sr.embeddings import compile_inference
+from kth_sr.timeline import speaker_timeline
+from kth_sr.vectorstore import FAISS
+
+SAMPLE_RATE = 16000
+NUM_FRAMES = 160
+
+
+def recording(minutes: float, chunk_s: float, turn_s: float):
+    """Yield chunks of a recording whose speaker changes every `turn_s` seconds."""
+    rng = np.random.default_rng(0)
+    n_chunks = int(minutes * 60 / chunk_s)
+    t = np.arange(int(chunk_s * SAMPLE_RATE)) / SAMPLE_RATE
+    for i in range(n_chunks):
+        freq = 200 if int(i * chunk_s / turn_s) % 2 == 0 else 2000
+        tone = 0.3 * np.sin(2 * np.pi * freq * (t + i * chunk_s))
+        yield (tone + 0.05 * rng.standard_normal(len(t))).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--minutes", type=float, nargs="+", default=[1, 10, 30])
+    parser.add_argument("--chunk-s", type=float, default=10.0)
+    parser.add_argument("--turn-s", type=float, default=30.0, help="seconds per turn")
+    parser.add_argument("--n-speakers", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--hop-frames", type=int, default=80)
+    args = parser.parse_args()
+
+    predict = compile_inference(DeepSpeakerModel(), NUM_FRAMES)
+    rng = np.random.default_rng(0)
+    storage = FAISS()
+    storage.add(
+        rng.standard_normal((args.n_speakers * 10, 512)).astype(np.float32),
+        [f"id{i:05d}" for i in range(args.n_speakers) for _ in range(10)],
+    )
+    # trace the model and build the speaker index before timing
+    warmup = recording(0.1, 2, 3)
+    list(speaker_timeline(warmup, predict, storage, SAMPLE_RATE, NUM_FRAMES))
+
+    def run(minutes: float) -> list:
+        return list(
+            speaker_timeline(
+                recording(minutes, args.chunk_s, args.turn_s),
+                predict,
+                storage,
+                SAMPLE_RATE,
+                NUM_FRAMES,
+                hop_frames=args.hop_frames,
+                batch_size=args.batch_size,
+            )
+        )
+
+    print(f"{'minutes':>8} {'segments':>9} {'seconds':>8} {'RTF':>7} {'peak MB':>8}")
+    for minutes in args.minutes:
+        begin = time.perf_counter()
+        segments = run(minutes)
+        elapsed = time.perf_counter() - begin
+
+        tracemalloc.start()
+        run(minutes)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(
+            f"{minutes:>8g} {len(segments):>9} {elapsed:>8.1f} "
+            f"{elapsed / (minutes * 60):>7.4f} {peak / 2**20:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Compare the cost of updating one speaker with a full save and a delta save.
+
+A store of random vectors is saved, then one speaker is re-enrolled with `upsert`
+and the store is saved again, once as a whole and once as a delta segment.
+
+Run:
+    python benchmarks/updates.py --n-vectors 1000000
+"""
+
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from kth_sr.vectorstore import FAISS
+
+
+def timed(fn, *args, **kwargs) -> float:
+    begin = time.perf_counter()
+    fn(*args, **kwargs)
+    return time.perf_counter() - begin
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--n-vectors", type=int, default=1_000_000)
+    parser.add_argument("--n-speakers", type=int, default=6_000)
+    parser.add_argument("--dimension", type=int, default=512)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vstore = FAISS(args.dimension)
+    for start in range(0, args.n_vectors, 100_000):
+        n = min(100_000, args.n_vectors - start)
+        vectors = rng.standard_normal((n, args.dimension), dtype=np.float32)
+        vstore.add(vectors, (np.arange(start, start + n) % args.n_speakers).tolist())
+    speaker_vectors = rng.standard_normal(
+        (args.n_vectors // args.n_speakers, args.dimension), dtype=np.float32
+    )
+
+    with tempfile.TemporaryDirectory() as path:
+        vstore.save(path)
+
+        upsert = timed(vstore.upsert, 0, speaker_vectors)
+        delta_save = timed(vstore.save, path, delta=True)
+        vstore.upsert(0, speaker_vectors)
+        full_save = timed(vstore.save, path)
+        load = timed(FAISS.load, path)
+
+    print(f"{args.n_vectors} vectors, {len(speaker_vectors)} vectors per speaker")
+    print(f"{'upsert in memory':>20}: {upsert * 1000:9.1f} ms")
+    print(f"{'delta save':>20}: {delta_save * 1000:9.1f} ms")
+    print(f"{'full save':>20}: {full_save * 1000:9.1f} ms")
+    print(f"{'load':>20}: {load * 1000:9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
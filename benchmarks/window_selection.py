@@ -0,0 +1,102 @@
+"""Compare identification accuracy of `first_k_windows` and `best_k_windows` by k.
+
+The clips of the held-out `data/test.csv` speakers, named like the clips of
+`kth_sr.enroll`, are split per speaker: the first `--enroll-clips` clips are enrolled
+with five `first_k_windows` each, the remaining clips are queries. Each query is
+identified from k windows picked by either function, and top-1 and top-5 accuracy
+are reported against the number of windows embedded, with the time spent on
+features and on the model.
+
+Run:
+    python benchmarks/window_selection.py data/test_clips --k 1 2 3 5 10
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+
+from kth_sr.audio import decode_audio
+from kth_sr.embeddings import compile_inference, get_embedding_model
+from kth_sr.loaddata import read_metadata
+from kth_sr.mfcc import best_k_windows, first_k_windows
+from kth_sr.utils import get_df_by_downloaded_folder
+from kth_sr.vectorstore import FAISS
+
+SELECTIONS = {"first": first_k_windows, "best": best_k_windows}
+"""Window selection functions to compare."""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("clips", help="folder with the clips of the test speakers")
+    parser.add_argument("--pattern", default="*.mp3", help="glob pattern of the clips")
+    parser.add_argument("--data-dir", default="./data", help="directory of test.csv")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 2, 3, 5, 10])
+    parser.add_argument("--enroll-clips", type=int, default=3, help="per speaker")
+    parser.add_argument("--checkpoint", help="weights of the embedding model")
+    parser.add_argument("--sample-rate", type=int, default=16000)
+    parser.add_argument("--num-frames", type=int, default=160)
+    args = parser.parse_args()
+
+    clips = get_df_by_downloaded_folder(args.clips, args.pattern)
+    test_speakers = read_metadata(
+        "test", columns=[], first=True, data_dir=args.data_dir
+    )
+    clips = clips[clips["speaker"].isin(test_speakers["speaker"])]
+    clips = clips.sort_values(["speaker", "sample_number"])
+    enrolled = clips.groupby("speaker").cumcount() < args.enroll_clips
+    queries = clips[~enrolled & clips["speaker"].isin(clips[enrolled]["speaker"])]
+    print(
+        f"{clips['speaker'].nunique()} speakers, {enrolled.sum()} enrolled and "
+        f"{len(queries)} query clips"
+    )
+
+    model = (
+        get_embedding_model(args.checkpoint)
+        if args.checkpoint
+        else get_embedding_model()
+    )
+    predict = compile_inference(model, args.num_frames)
+    audio = {
+        path: decode_audio(Path(path).read_bytes(), args.sample_rate)
+        for path in clips["path"]
+    }
+
+    vstore = FAISS(512)
+    for path, speaker in zip(clips[enrolled]["path"], clips[enrolled]["speaker"]):
+        windows = first_k_windows(audio[path], args.sample_rate, args.num_frames, 5)
+        vstore.add(predict(windows), [speaker] * len(windows))
+
+    print(
+        f"{'selection':<10} {'k':>3} {'windows':>8} {'top-1':>6} {'top-5':>6} "
+        f"{'features s':>11} {'model s':>8}"
+    )
+    for k in args.k:
+        for name, select in SELECTIONS.items():
+            begin = time.perf_counter()
+            windows = [
+                select(audio[path], args.sample_rate, args.num_frames, k)
+                for path in queries["path"]
+            ]
+            features = time.perf_counter() - begin
+
+            begin = time.perf_counter()
+            embeddings = predict(np.concatenate(windows))
+            model_s = time.perf_counter() - begin
+
+            _, ranked = vstore.search_speakers(
+                embeddings, 5, lengths=[len(w) for w in windows]
+            )
+            truth = queries["speaker"].tolist()
+            top1 = np.mean([r[0] == s for r, s in zip(ranked, truth)])
+            top5 = np.mean([s in r for r, s in zip(ranked, truth)])
+            print(
+                f"{name:<10} {k:>3} {len(embeddings):>8} {top1:>6.1%} {top5:>6.1%} "
+                f"{features:>11.2f} {model_s:>8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,28 @@
-import tempfile
+from __future__ import annotations
+
+import io
+import json
+import threading
+import time
+import wave
+from concurrent.futures import Executor, ThreadPoolExecutor
+from contextlib import ExitStack
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import NamedTuple
 
-import librosa
-import pandas as pd
-from flask import Flask, jsonify, render_template, request
+import numpy as np
+from flask import Flask, Response, jsonify, render_template, request
 
-from kth_sr import FAISS, embeddings, first_k_windows, loaddata
+from kth_sr import FAISS, embeddings, loaddata
+from kth_sr.audio import StreamDecoder
+from kth_sr.batching import BatchedPredictor
+from kth_sr.cache import EmbeddingCache
+from kth_sr.metrics import metrics, traced
+from kth_sr.pipeline import extract_features, feature_executor
+from kth_sr.reload import VersionedStore
+from kth_sr.startup import Startup
+from kth_sr.streaming import StreamingIdentifier
 
 # Note to run this file do
 
@@ -13,12 +30,199 @@ app = Flask(__name__)
 
 SAMPLE_RATE = 16000
 NUM_FRAMES = 160
+N_WINDOWS = 100
+"""Number of windows embedded per uploaded recording."""
+TRACE_HEADER = "X-Debug-Trace"
+"""Requests with this header set to 1 get the timings of their stages in the response."""
+STORE_PATH = "./data/filtered_celebs_data/celebs_200_9_clips"
+STORE_ROOT = "./data/filtered_celebs_data"
+"""Directory of the stores `/reload` may switch to."""
+RELOAD_INTERVAL_S = 10.0
+"""Seconds between checks of the store directory for a newly saved store."""
+CHECKPOINT = embeddings.DEFAULT_CHECKPOINT
+
+# Model, store and speaker information are loaded by the startup steps below, in the
+# background, so importing the app is fast and the readiness endpoint answers while
+# they load.
+predictor: BatchedPredictor | None = None
+# retried and repeated uploads are not embedded again
+embedding_cache = EmbeddingCache(max_items=512)
+
+startup = Startup()
+
+# Executors of the pipeline stages, None runs the stage on the request thread.
+# Configured by `configure_workers` when served by serve.py.
+feature_pool: Executor | None = None
+search_pool: Executor | None = None
+n_feature_workers = 0
+
+STREAM_TIMEOUT_S = 120
+"""Streaming sessions without a new chunk for this long are dropped."""
+
+
+@dataclass
+class StreamSession:
+    """State of one streamed recording."""
+
+    identifier: StreamingIdentifier
+    celeb_records: loaddata.SpeakerRecords
+    """Information of the speakers of the store the session started with."""
+    store: ExitStack
+    """Holds the acquired store version until the session ends."""
+    decoder: StreamDecoder = field(default_factory=lambda: StreamDecoder(SAMPLE_RATE))
+    """Decoder of the recording, chunks of a recording are not decodable alone."""
+    last_seen: float = field(default_factory=time.monotonic)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def close(self):
+        """Stop the decoder and release the store version, called once it ends."""
+        self.decoder.kill()
+        self.store.close()
+
+
+stream_sessions: dict[str, StreamSession] = {}
+stream_sessions_lock = threading.Lock()
+
+
+def configure_workers(feature_workers: int, search_threads: int):
+    """Run feature extraction in worker processes and search in a thread pool.
+
+    Args:
+        feature_workers (int): Processes decoding uploads and computing features.
+        search_threads (int): Threads searching the vector store.
+    """
+    global feature_pool, search_pool, n_feature_workers
+    n_feature_workers = feature_workers
+    feature_pool = feature_executor(feature_workers) if feature_workers > 0 else None
+    search_pool = ThreadPoolExecutor(search_threads) if search_threads > 0 else None
+
+
+@startup.step("model")
+def load_model():
+    global predictor
+    # coalesces windows of concurrent requests into shared model calls
+    predictor = BatchedPredictor(embeddings.get_embedding_model())
+    embeddings.warmup(predictor.predict, NUM_FRAMES, batch_sizes=(1, N_WINDOWS))
+
+
+class StoreVersion(NamedTuple):
+    """Vector store and speaker information loaded from one store directory."""
+
+    storage: FAISS
+    celeb_records: loaddata.SpeakerRecords
+
+
+def load_store_version(path: str) -> StoreVersion:
+    """Load a store and the information of its speakers, ready to be searched."""
+    storage = FAISS.load(path)
+    storage.build_speaker_index()
+    # the first search of a store pages in its centroids, embeddings have 512 values
+    storage.search_speakers(np.zeros((1, 512), dtype=np.float32), 1)
+    return StoreVersion(storage, loaddata.get_speaker_records(path))
+
+
+# in-flight requests finish on the store they started with while a new one is swapped
+# in, see `VersionedStore`
+stores = VersionedStore(load_store_version)
+
+
+@startup.step("store")
+def load_store():
+    stores.load(STORE_PATH)
+    stores.watch(RELOAD_INTERVAL_S)
+
+
+@startup.step("features")
+def warmup_features():
+    # one second of silence through every feature worker, so the first request does
+    # not wait for the worker processes to start and import the audio libraries
+    silence = io.BytesIO()
+    with wave.open(silence, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(bytes(2 * SAMPLE_RATE))
+    args = (silence.getvalue(), SAMPLE_RATE, NUM_FRAMES, 1, CHECKPOINT)
+    if feature_pool is None:
+        extract_features(*args)
+    else:
+        futures = [
+            feature_pool.submit(extract_features, *args)
+            for _ in range(n_feature_workers)
+        ]
+        for future in futures:
+            future.result()
 
-model = embeddings.get_embedding_model()
-storage = FAISS.load("./data/filtered_celebs_data/celebs_200_9_clips")
-celeb_information = loaddata.get_celeb_data(
-    "./data/filtered_celebs_data/celebs_200_9_clips"
-)
+
+def run_stage(pool: Executor | None, fn, *args, **kwargs):
+    """Run a pipeline stage on its executor, or on the current thread if None."""
+    if pool is None:
+        return fn(*args, **kwargs)
+    return pool.submit(fn, *args, **kwargs).result()
+
+
+def json_response(result: dict, data: str | None = None) -> Response:
+    """Respond with the result as JSON and the serialized data as its `data` field.
+
+    Speaker records are serialized once at startup, so they are spliced into the
+    response instead of being parsed and serialized again.
+    """
+    body = json.dumps(result)
+    if data is not None:
+        body = f'{body[:-1]}, "data": {data}}}'
+    return Response(body, mimetype="application/json")
+
+
+@app.before_request
+def require_ready():
+    """Start loading on the first request and refuse identification until ready."""
+    startup.start()
+    if request.endpoint in ("findmatch", "findmatch_stream") and not startup.ready:
+        response = jsonify({"status": 503, "message": "Service is starting up"})
+        response.status_code = 503
+        response.headers["Retry-After"] = "1"
+        return response
+
+
+@app.route("/ready")
+def ready():
+    """Report the startup state, with status 503 until the models are loaded."""
+    status = {**startup.status(), "store": stores.status()}
+    return jsonify(status), 200 if startup.ready else 503
+
+
+@app.route("/reload", methods=["POST"])
+def reload_store():
+    """Load a store in the background and swap it in once loaded.
+
+    The form field `path` selects another store directory under `STORE_ROOT`,
+    without it the current directory is loaded again. Progress is reported by
+    `/ready`.
+    """
+    path = request.form.get("path")
+    if path is not None and not Path(path).resolve().is_relative_to(
+        Path(STORE_ROOT).resolve()
+    ):
+        response = jsonify({"status": 400, "message": f"{path} is not a store"})
+        response.status_code = 400
+        return response
+    try:
+        stores.reload(path)
+    except ValueError:
+        # no store is loaded yet, so there is no directory to load again
+        response = jsonify({"status": 503, "message": "Service is starting up"})
+        response.status_code = 503
+        response.headers["Retry-After"] = "1"
+        return response
+    response = jsonify({"status": 202, "message": "Reloading the store"})
+    response.status_code = 202
+    return response
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    """Report latency histograms of the pipeline stages and counters for Prometheus."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 
 @app.route("/")
@@ -31,44 +235,129 @@ def findmatch():
     file = request.files["audio"]
     print("Received file:", file.filename, file.content_type)  # Debug info
 
-    with tempfile.TemporaryDirectory() as temp_dir:
-        temp_wav_path = Path(temp_dir) / "temp_audio.wav"
+    with metrics.trace() as trace:
+        try:
+            with metrics.timer("findmatch"):
+                with metrics.timer("upload"):
+                    data = file.read()
+                # Decode the upload in memory, resample to required sample rate and
+                # compute the features, CPU-bound work which runs in worker processes
+                # when configured, so their timings come back as a trace
+                with metrics.timer("features"):
+                    (key, mfcc_features), feature_trace = run_stage(
+                        feature_pool,
+                        traced,
+                        extract_features,
+                        data,
+                        SAMPLE_RATE,
+                        NUM_FRAMES,
+                        N_WINDOWS,
+                        CHECKPOINT,
+                    )
+                metrics.record(feature_trace)
+                metrics.count("windows", len(mfcc_features))
+                # the model call itself is timed as "model" on the batching thread
+                with metrics.timer("embed"):
+                    embedd = embedding_cache.get_or_compute(
+                        key, lambda: predictor.predict(mfcc_features)
+                    )
+                with stores.acquire() as version:
+                    # combine all windows into one ranked list of speakers
+                    with metrics.timer("search"):
+                        _, metadata = run_stage(
+                            search_pool,
+                            version.storage.search_speakers,
+                            embeddings=embedd,
+                            k=6,
+                        )
+                    with metrics.timer("records"):
+                        records = version.celeb_records.json(metadata[0])
 
-        # Save and process the audio file
-        file.save(temp_wav_path)
+            result = {"status": 200, "message": "File processed successfully"}
 
-        # Load audio data with librosa and resample to required sample rate
-        try:
-            audio_data, _ = librosa.load(str(temp_wav_path), sr=SAMPLE_RATE, mono=True)
-            mfcc_features = first_k_windows(audio_data, SAMPLE_RATE, NUM_FRAMES, k=100)
-            embedd = model.m.predict(mfcc_features, verbose=None)
-            distances, metadata = storage.search(embeddings=embedd, k=6)
-            filterd_dev = celeb_information[
-                celeb_information["VoxCeleb2_ID"].isin(metadata[0])
-            ]
-
-            order_df = pd.DataFrame(
-                {"VoxCeleb2_ID": metadata[0], "order": range(len(metadata[0]))}
-            )
+        except Exception as e:
+            print("Error processing audio:", str(e))  # Debug info
+            metrics.count("errors")
+            result, records = {"status": 500, "message": str(e)}, None
+
+    if request.headers.get(TRACE_HEADER) == "1":
+        result["trace"] = trace.to_dict()
+    return json_response(result, records)
 
-            filterd_dev = (
-                pd.merge(filterd_dev, order_df, on="VoxCeleb2_ID")
-                .sort_values("order")
-                .drop("order", axis=1)
-            )
 
-            return jsonify(
-                {
-                    "status": 200,
-                    "message": "File processed successfully",
-                    "data": filterd_dev.to_dict(orient="records"),
-                }
+@app.route("/findmatch/stream/<session_id>", methods=["POST"])
+def findmatch_stream(session_id: str):
+    """Identify the speaker from chunks of a recording as they are recorded.
+
+    Chunks are posted in order, the last one with form field `final` set. Each
+    response contains the ranking for the audio received so far and `done` once the
+    ranking is stable and further chunks are not needed.
+    """
+    now = time.monotonic()
+    with stream_sessions_lock:
+        expired = [
+            stream_sessions.pop(key)
+            for key, value in list(stream_sessions.items())
+            if now - value.last_seen > STREAM_TIMEOUT_S
+        ]
+        session = stream_sessions.get(session_id)
+        if session is None:
+            # a session keeps the store it started with, the old store is freed
+            # when its last session ends
+            store = ExitStack()
+            version = store.enter_context(stores.acquire())
+            session = stream_sessions[session_id] = StreamSession(
+                StreamingIdentifier(
+                    predictor.predict, version.storage, SAMPLE_RATE, NUM_FRAMES
+                ),
+                version.celeb_records,
+                store,
             )
+    for expired_session in expired:
+        with expired_session.lock:
+            expired_session.close()
+    final = request.form.get("final") == "1"
 
-        except Exception as e:
-            print("Error processing audio:", str(e))  # Debug info
-            return jsonify({"status": 500, "message": str(e)})
+    try:
+        with session.lock:
+            session.last_seen = now
+            identifier = session.identifier
+            if not identifier.done:
+                # only the new bytes are decoded, by the ffmpeg of the session
+                identifier.feed(session.decoder.feed(request.files["audio"].read()))
+            if final and not identifier.done:
+                identifier.feed(session.decoder.close())
+                identifier.finish()
+            if identifier.done:
+                session.decoder.kill()
+            _, speakers = identifier.ranking
+            records = session.celeb_records.json(speakers)
+            if final:
+                session.close()
+
+        if final:
+            with stream_sessions_lock:
+                stream_sessions.pop(session_id, None)
+
+        return json_response(
+            {
+                "status": 200,
+                "message": "Chunk processed successfully",
+                "done": identifier.done,
+                "n_windows": identifier.n_windows,
+            },
+            records,
+        )
+
+    except Exception as e:
+        print("Error processing audio:", str(e))  # Debug info
+        with stream_sessions_lock:
+            stream_sessions.pop(session_id, None)
+        with session.lock:
+            session.close()
+        return jsonify({"status": 500, "message": str(e)})
 
 
 if __name__ == "__main__":
+    startup.start()
     app.run(debug=True)
@@ -0,0 +1,57 @@
+"""Serve the demo with a production server.
+
+HTTP connections are handled by waitress' non-blocking I/O loop and requests run on
+a pool of HTTP threads. Decoding and feature extraction run in worker processes,
+inference on the batching thread of `BatchedPredictor` and search on a thread pool.
+Thread budgets of TensorFlow, FAISS and OpenMP are set before the libraries load, so
+the processes do not oversubscribe the cores.
+
+Run:
+    python src/demo/serve.py --port 8000 --feature-workers 4 --compute-threads 2
+"""
+
+import argparse
+import os
+
+from kth_sr.pipeline import limit_threads
+
+
+def main():
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--http-threads", type=int, default=16, help="threads handling requests"
+    )
+    parser.add_argument(
+        "--feature-workers",
+        type=int,
+        default=max(cpus // 2, 1),
+        help="processes decoding audio and computing features, 0 runs them inline",
+    )
+    parser.add_argument(
+        "--search-threads", type=int, default=2, help="threads searching the store"
+    )
+    parser.add_argument(
+        "--compute-threads",
+        type=int,
+        default=max(cpus - cpus // 2, 1),
+        help="threads of TensorFlow and FAISS in the server process",
+    )
+    args = parser.parse_args()
+
+    # before TensorFlow and FAISS are imported by the app
+    limit_threads(args.compute_threads)
+
+    import app as demo
+    from waitress import serve
+
+    demo.configure_workers(args.feature_workers, args.search_threads)
+    # load the model and store in the background, /ready reports when done
+    demo.startup.start()
+    serve(demo.app, host=args.host, port=args.port, threads=args.http_threads)
+
+
+if __name__ == "__main__":
+    main()
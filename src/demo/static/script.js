@@ -12,6 +12,9 @@ const ctx = visualizer.getContext('2d');
 const celebrityList = document.getElementById('celebrityList');
 let audioContext, analyser, source;
 
+// recording is sent in chunks of this length while it is recorded
+const CHUNK_MS = 1000;
+
 let freqs = [];
 
 if (navigator.mediaDevices.getUserMedia) {
@@ -20,7 +23,9 @@ if (navigator.mediaDevices.getUserMedia) {
     let onMediaSetupSuccess = function(stream) {
         console.log('MediaRecorder started.');
         const mediaRecorder = new MediaRecorder(stream);
-        let audioChunks = [];
+        let sessionId = null;
+        // chunks are posted one after another, so the server receives them in order
+        let pendingChunks = Promise.resolve();
         
         const audioContext = new AudioContext();
         const analyser = audioContext.createAnalyser();
@@ -87,27 +92,30 @@ if (navigator.mediaDevices.getUserMedia) {
                 mediaRecorder.stop();
                 recordText.innerHTML = 'Record';
             } else {
-                mediaRecorder.start();
+                sessionId = Date.now().toString(36) + Math.random().toString(36).slice(2);
+                mediaRecorder.start(CHUNK_MS);
                 recordText.innerHTML = 'Stop';
             }
         });
 
         mediaRecorder.ondataavailable = function(event) {
-            if (event.data.size > 0) {
-                audioChunks.push(event.data);
+            // the last chunk arrives after the recorder stopped
+            const final = mediaRecorder.state === 'inactive';
+            if (event.data.size > 0 || final) {
+                const currentSession = sessionId;
+                pendingChunks = pendingChunks.then(
+                    () => send_chunk(currentSession, event.data, final)
+                );
             }
         };
 
-        mediaRecorder.onstop = function() {
-            let audioBlob = new Blob(audioChunks, {type: 'audio/wav'});
-            audioChunks = [];
-
+        function send_chunk(currentSession, chunk, final) {
             let formData = new FormData();
-            formData.append('audio',audioBlob);
+            formData.append('audio', chunk);
+            formData.append('final', final ? '1' : '0');
 
-
-            output.innerHTML = "Processing...";
-            fetch('/findmatch', {
+            output.innerHTML = final ? "Processing..." : "Listening...";
+            return fetch(`/findmatch/stream/${currentSession}`, {
                 method: 'POST',
                 body: formData
             })
@@ -116,10 +124,14 @@ if (navigator.mediaDevices.getUserMedia) {
                 console.log(data)
                 if (data.status === 200) {
                     render_celebrity_list(data.data);
-                    output.innerHTML = "";
+                    output.innerHTML = final || data.done ? "" : "Listening...";
+                    // the ranking is stable, no need to record further
+                    if (data.done && mediaRecorder.state === 'recording') {
+                        mediaRecorder.stop();
+                        recordText.innerHTML = 'Record';
+                    }
                 } else {
                     output.innerHTML = data.message;
-                    
                 }
             });
         }
@@ -1,4 +1,25 @@
-from kth_sr.mfcc import first_k_windows
-from kth_sr.vectorstore import FAISS
+from __future__ import annotations
+
+import importlib
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from kth_sr.mfcc import first_k_windows
+    from kth_sr.vectorstore import FAISS
 
 __all__ = ["first_k_windows", "FAISS"]
+
+# Attributes imported on first access, so importing the package or one of its light
+# submodules does not load FAISS and the audio libraries.
+_LAZY_ATTRIBUTES = {
+    "first_k_windows": "kth_sr.mfcc",
+    "FAISS": "kth_sr.vectorstore",
+}
+
+
+def __getattr__(name: str):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name]), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,400 @@
+from __future__ import annotations
+
+import io
+import shutil
+import struct
+import subprocess
+import threading
+from typing import BinaryIO, Iterator
+
+import librosa
+import numpy as np
+import soundfile
+
+from kth_sr.metrics import metrics
+
+SIGNATURES = [
+    (b"RIFF", 0, "wav"),
+    (b"\x1a\x45\xdf\xa3", 0, "webm"),
+    (b"OggS", 0, "ogg"),
+    (b"fLaC", 0, "flac"),
+    (b"ID3", 0, "mp3"),
+    (b"\xff\xfb", 0, "mp3"),
+    (b"\xff\xf3", 0, "mp3"),
+    (b"\xff\xf2", 0, "mp3"),
+    (b"ftyp", 4, "mp4"),
+]
+"""Magic bytes, their offset and the container they identify."""
+
+WAV_FORMATS = {
+    (1, 8): "u1",
+    (1, 16): "<i2",
+    (1, 24): "<i4",
+    (1, 32): "<i4",
+    (3, 32): "<f4",
+}
+"""Numpy dtype of WAV samples by format tag (1 = PCM, 3 = float) and bit depth, 24 bit
+samples are widened to 32 bit. Other formats are decoded by libsndfile or ffmpeg."""
+
+
+def detect_format(data: bytes | memoryview) -> str:
+    """Detect the container of encoded audio from its first bytes.
+
+    Args:
+        data (bytes | memoryview): Encoded audio.
+
+    Returns:
+        str: One of `wav`, `webm`, `ogg`, `flac`, `mp3`, `mp4` or `unknown`.
+    """
+    header = bytes(data[:12])
+    for signature, offset, container in SIGNATURES:
+        if header[offset : offset + len(signature)] == signature:
+            return container
+    return "unknown"
+
+
+def decode_audio(
+    data: bytes | memoryview | BinaryIO, sample_rate: int = 16000
+) -> np.ndarray:
+    """Decode audio from memory to a mono float32 array.
+
+    PCM and float WAV files are read straight from the buffer, other WAV encodings
+    (e.g. 64 bit float, A-law or µ-law) and OGG/FLAC/MP3 through libsndfile and
+    other containers (e.g. WebM from the browser `MediaRecorder`) through an `ffmpeg`
+    pipe. No temporary files are written and the audio is resampled only if its sample
+    rate differs from `sample_rate`.
+
+    Args:
+        data (bytes | memoryview | BinaryIO): Encoded audio or a file-like object.
+        sample_rate (int, optional): Sample rate of the result. Defaults to 16000.
+
+    Raises:
+        ValueError: The audio can not be decoded.
+
+    Returns:
+        np.ndarray: Mono audio. Float32 mono WAV input at `sample_rate` is returned
+        as a read-only view of the input buffer.
+    """
+    if hasattr(data, "read"):
+        data = data.read()
+    data = memoryview(data).cast("B")
+
+    container = detect_format(data)
+    with metrics.timer("decode"):
+        decoded = _decode_wav(data) if container == "wav" else None
+        if decoded is not None:
+            audio, source_rate = decoded
+        elif container in ("wav", "ogg", "flac", "mp3"):
+            try:
+                audio, source_rate = soundfile.read(
+                    io.BytesIO(data), dtype="float32", always_2d=True
+                )
+            except soundfile.LibsndfileError:
+                # e.g. OGG with Opus codec from older libsndfile versions
+                return _decode_ffmpeg(data, sample_rate)
+        else:
+            # ffmpeg resamples while decoding
+            return _decode_ffmpeg(data, sample_rate)
+
+        if audio.shape[1] > 1:
+            audio = audio.mean(axis=1, dtype=np.float32)
+        else:
+            audio = audio[:, 0]
+
+    if source_rate != sample_rate:
+        with metrics.timer("resample"):
+            audio = librosa.resample(audio, orig_sr=source_rate, target_sr=sample_rate)
+    return audio
+
+
+def stream_audio(
+    path: str, sample_rate: int = 16000, chunk_s: float = 10.0
+) -> Iterator[np.ndarray]:
+    """Decode an audio file chunk by chunk to mono float32 arrays.
+
+    The file is decoded and resampled by an `ffmpeg` process, so only one chunk is
+    in memory at a time, whatever the length of the recording.
+
+    Args:
+        path (str): Path to the audio file, any format ffmpeg understands.
+        sample_rate (int, optional): Sample rate of the result. Defaults to 16000.
+        chunk_s (float, optional): Seconds of audio per chunk, the last one can be
+        shorter. Defaults to 10.
+
+    Raises:
+        ValueError: ffmpeg is not installed or can not decode the file.
+
+    Yields:
+        np.ndarray: Consecutive chunks of the audio.
+    """
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise ValueError("Streaming audio requires ffmpeg.")
+
+    chunk_bytes = int(chunk_s * sample_rate) * np.dtype(np.float32).itemsize
+    process = subprocess.Popen(
+        [
+            ffmpeg,
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-i",
+            str(path),
+            "-f",
+            "f32le",
+            "-ac",
+            "1",
+            "-ar",
+            str(sample_rate),
+            "pipe:1",
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    try:
+        while data := process.stdout.read(chunk_bytes):
+            yield np.frombuffer(data, dtype=np.float32)
+        if process.wait() != 0:
+            raise ValueError(f"ffmpeg failed: {process.stderr.read().decode().strip()}")
+    finally:
+        process.kill()
+        process.wait()
+        process.stdout.close()
+        process.stderr.close()
+
+
+class StreamDecoder:
+    """Decode a recording arriving in chunks with one long-lived `ffmpeg` process.
+
+    Chunks of a recording, e.g. from the browser `MediaRecorder`, are not decodable
+    alone. Each chunk is written to the pipe of the same process, so decoding costs
+    the same per chunk however long the recording gets. Decoded samples are collected
+    in the background and returned by the next `feed` or by `close`.
+
+    Examples:
+        >>> decoder = StreamDecoder(16000)
+        >>> for chunk in chunks:
+        ...     audio = decoder.feed(chunk)
+        >>> audio = decoder.close()
+    """
+
+    _process: subprocess.Popen | None
+    """The ffmpeg process, started by the first chunk."""
+    _output: bytearray
+    """Decoded bytes not returned yet."""
+
+    def __init__(self, sample_rate: int = 16000):
+        """Create the decoder, ffmpeg is started by the first chunk.
+
+        Args:
+            sample_rate (int, optional): Sample rate of the result. Defaults to 16000.
+        """
+        self.sample_rate = sample_rate
+        self._process = None
+        self._output = bytearray()
+        self._errors = bytearray()
+        self._lock = threading.Lock()
+        self._readers = []
+
+    def feed(self, data: bytes | memoryview) -> np.ndarray:
+        """Decode the next chunk of the recording.
+
+        Args:
+            data (bytes | memoryview): Next bytes of the encoded recording.
+
+        Raises:
+            ValueError: ffmpeg is not installed or stopped on a decoding error.
+
+        Returns:
+            np.ndarray: Mono audio decoded since the last call, the samples of a chunk
+            can arrive with the next one.
+        """
+        if self._process is None:
+            self._start()
+        try:
+            self._process.stdin.write(data)
+            self._process.stdin.flush()
+        except BrokenPipeError:
+            self.kill()
+            raise ValueError(f"ffmpeg failed: {self._errors.decode().strip()}")
+        return self._take()
+
+    def close(self) -> np.ndarray:
+        """Finish the recording and return the samples not returned yet.
+
+        Raises:
+            ValueError: ffmpeg can not decode the recording.
+
+        Returns:
+            np.ndarray: Mono audio decoded since the last call.
+        """
+        if self._process is None:
+            return np.empty(0, dtype=np.float32)
+        try:
+            self._process.stdin.close()
+        except BrokenPipeError:
+            pass
+        for reader in self._readers:
+            reader.join()
+        returncode = self._process.wait()
+        self._process = None
+        if returncode != 0:
+            raise ValueError(f"ffmpeg failed: {self._errors.decode().strip()}")
+        return self._take()
+
+    def kill(self):
+        """Stop decoding without waiting for the rest of the recording."""
+        if self._process is None:
+            return
+        self._process.kill()
+        self._process.wait()
+        for reader in self._readers:
+            reader.join()
+        self._process.stdin.close()
+        self._process = None
+
+    def _start(self):
+        """Start ffmpeg reading the recording from stdin."""
+        ffmpeg = shutil.which("ffmpeg")
+        if ffmpeg is None:
+            raise ValueError("Decoding a streamed recording requires ffmpeg.")
+        self._process = subprocess.Popen(
+            [
+                ffmpeg,
+                "-hide_banner",
+                "-loglevel",
+                "error",
+                # decode as soon as the header arrives instead of buffering seconds
+                # of audio to probe the stream
+                "-probesize",
+                "32",
+                "-analyzeduration",
+                "0",
+                "-i",
+                "pipe:0",
+                "-f",
+                "f32le",
+                "-ac",
+                "1",
+                "-ar",
+                str(self.sample_rate),
+                "-flush_packets",
+                "1",
+                "pipe:1",
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        # both pipes are drained, so ffmpeg never blocks on a full one
+        self._readers = [
+            threading.Thread(
+                target=self._drain, args=(pipe, buffer), name="ffmpeg", daemon=True
+            )
+            for pipe, buffer in [
+                (self._process.stdout, self._output),
+                (self._process.stderr, self._errors),
+            ]
+        ]
+        for reader in self._readers:
+            reader.start()
+
+    def _drain(self, pipe: BinaryIO, buffer: bytearray):
+        """Append everything ffmpeg writes to a pipe to a buffer."""
+        with pipe:
+            while data := pipe.read1(1 << 16):
+                with self._lock:
+                    buffer.extend(data)
+
+    def _take(self) -> np.ndarray:
+        """Return the complete decoded samples and keep a partial one."""
+        with self._lock:
+            n_bytes = len(self._output) - len(self._output) % 4
+            data = bytes(self._output[:n_bytes])
+            del self._output[:n_bytes]
+        return np.frombuffer(data, dtype=np.float32)
+
+
+def _decode_wav(data: memoryview) -> tuple[np.ndarray, int] | None:
+    """Read samples of a RIFF/WAVE buffer without copying them.
+
+    Raises:
+        ValueError: The buffer has no audio data.
+
+    Returns:
+        tuple | None: Samples with dimensions (n_samples, n_channels) and the sample
+        rate, None for formats not in `WAV_FORMATS`, e.g. 64 bit float or A-law.
+    """
+    fmt = None
+    position = 12
+    while position + 8 <= len(data):
+        chunk_id = bytes(data[position : position + 4])
+        (chunk_size,) = struct.unpack_from("<I", data, position + 4)
+        body = data[position + 8 : position + 8 + chunk_size]
+
+        if chunk_id == b"fmt ":
+            format_tag, channels, rate = struct.unpack_from("<HHI", body)
+            (bits,) = struct.unpack_from("<H", body, 14)
+            if format_tag == 0xFFFE:  # WAVE_FORMAT_EXTENSIBLE
+                (format_tag,) = struct.unpack_from("<H", body, 24)
+            fmt = (format_tag, channels, rate, bits)
+        elif chunk_id == b"data" and fmt is not None:
+            format_tag, channels, rate, bits = fmt
+            if (format_tag, bits) not in WAV_FORMATS:
+                return None
+            dtype = np.dtype(WAV_FORMATS[(format_tag, bits)])
+            # streamed WAVs (e.g. from browsers) may declare a wrong data size
+            n_bytes = len(body) - len(body) % (bits // 8 * channels)
+            if bits == 24:
+                # 3 byte samples to the upper bytes of int32, scaled as 32 bit PCM
+                widened = np.zeros((n_bytes // 3, 4), dtype=np.uint8)
+                widened[:, 1:] = np.frombuffer(body[:n_bytes], np.uint8).reshape(-1, 3)
+                samples = widened.view(dtype)[:, 0]
+            else:
+                samples = np.frombuffer(body[:n_bytes], dtype=dtype)
+            return _to_float32(samples).reshape(-1, channels), rate
+
+        # chunks are padded to even size
+        position += 8 + chunk_size + chunk_size % 2
+
+    raise ValueError("WAV file has no audio data.")
+
+
+def _to_float32(samples: np.ndarray) -> np.ndarray:
+    """Scale integer samples to [-1, 1], float32 samples are returned as they are."""
+    if samples.dtype == np.float32:
+        return samples
+    if samples.dtype == np.uint8:
+        return (samples.astype(np.float32) - 128) / 128
+    # a float32 scale, 2**31 as an integer would promote the result to float64
+    return samples.astype(np.float32) / np.float32(-np.iinfo(samples.dtype).min)
+
+
+def _decode_ffmpeg(data: memoryview, sample_rate: int) -> np.ndarray:
+    """Decode any container ffmpeg understands, resampling in the same pass."""
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise ValueError("Decoding this audio format requires ffmpeg.")
+
+    result = subprocess.run(
+        [
+            ffmpeg,
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-i",
+            "pipe:0",
+            "-f",
+            "f32le",
+            "-ac",
+            "1",
+            "-ar",
+            str(sample_rate),
+            "pipe:1",
+        ],
+        input=data,
+        capture_output=True,
+    )
+    if result.returncode != 0:
+        raise ValueError(f"ffmpeg failed: {result.stderr.decode().strip()}")
+    return np.frombuffer(result.stdout, dtype=np.float32)
@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import TYPE_CHECKING, Callable
+
+import numpy as np
+
+from kth_sr.embeddings import compile_inference
+from kth_sr.metrics import metrics
+
+if TYPE_CHECKING:
+    from deep_speaker.conv_models import DeepSpeakerModel
+
+
+class BatchedPredictor:
+    """Coalesce embedding requests of concurrent callers into larger model batches.
+
+    Windows submitted by different threads are gathered into one batch of at most
+    `batch_size` windows, or whatever arrived within `max_wait_ms` after the first
+    request, embedded with a single model call and scattered back to the callers.
+    Batches are padded with silent windows to exactly `batch_size`, so the model always
+    runs on one input shape.
+
+    Examples:
+        >>> from kth_sr.batching import BatchedPredictor
+        >>> from kth_sr.embeddings import get_embedding_model
+        >>> with BatchedPredictor(get_embedding_model(), batch_size=256) as predictor:
+        ...     embeddings = predictor.predict(windows)  # called from many threads
+    """
+
+    _predict: Callable[[np.ndarray], np.ndarray]
+    """Forward pass of the embedding model on one batch."""
+    _queue: queue.Queue
+    """Pending requests, tuples of windows and the future for their embeddings."""
+    _worker: threading.Thread
+    """Thread running the model on the gathered batches."""
+
+    def __init__(
+        self,
+        model: DeepSpeakerModel,
+        batch_size: int = 256,
+        max_wait_ms: float = 5.0,
+        compiled: bool = True,
+    ):
+        """Start the batching worker.
+
+        Args:
+            model (DeepSpeakerModel): Embedding model.
+            batch_size (int, optional): Maximal number of windows in one model call.
+            Requests larger than that are embedded in several calls. Defaults to 256.
+            max_wait_ms (float, optional): How long to wait for more requests after the
+            first one arrives. Defaults to 5.0.
+            compiled (bool, optional): Run the model through `compile_inference`
+            instead of `predict_on_batch`. Defaults to True.
+        """
+        self._predict = (
+            compile_inference(model) if compiled else model.m.predict_on_batch
+        )
+        self.batch_size = batch_size
+        self.max_wait_ms = max_wait_ms
+        self.n_batches = 0
+        """Number of model calls made."""
+        self.n_requests = 0
+        """Number of requests served."""
+
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(
+            target=self._run, name="BatchedPredictor", daemon=True
+        )
+        self._worker.start()
+
+    def submit(self, windows: np.ndarray) -> Future:
+        """Queue windows for embedding.
+
+        Args:
+            windows (np.ndarray): Feature windows, dimensions are (n, 160, 64, 1).
+
+        Returns:
+            Future: Future resolving to embeddings of the windows.
+        """
+        future = Future()
+        self._queue.put((np.asarray(windows, dtype=np.float32), future))
+        return future
+
+    def predict(self, windows: np.ndarray) -> np.ndarray:
+        """Embed windows, blocking until their batch is processed.
+
+        Args:
+            windows (np.ndarray): Feature windows, dimensions are (n, 160, 64, 1).
+
+        Returns:
+            np.ndarray: Embeddings of the windows.
+        """
+        return self.submit(windows).result()
+
+    def close(self):
+        """Process the pending requests and stop the worker."""
+        self._queue.put(None)
+        self._worker.join()
+
+    def __enter__(self) -> BatchedPredictor:
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _run(self):
+        """Gather requests into batches until `close` is called."""
+        carry = None
+        while True:
+            request = carry if carry is not None else self._queue.get()
+            carry = None
+            if request is None:
+                return
+
+            batch = [request]
+            n_windows = len(request[0])
+            deadline = time.monotonic() + self.max_wait_ms / 1000
+            while n_windows < self.batch_size:
+                try:
+                    request = self._queue.get(
+                        timeout=max(deadline - time.monotonic(), 0)
+                    )
+                except queue.Empty:
+                    break
+                # keep the request for the next batch if it does not fit
+                if request is None or n_windows + len(request[0]) > self.batch_size:
+                    carry = request
+                    break
+                batch.append(request)
+                n_windows += len(request[0])
+
+            self._predict_batch(batch)
+
+    def _predict_batch(self, batch: list):
+        """Embed all windows of the batch and resolve the futures of its requests."""
+        windows = np.concatenate([w for w, _ in batch])
+        try:
+            with metrics.timer("model"):
+                embeddings = np.concatenate(
+                    [
+                        self._predict_padded(windows[i : i + self.batch_size])
+                        for i in range(0, len(windows), self.batch_size)
+                    ]
+                )
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        self.n_batches += 1
+        self.n_requests += len(batch)
+        splits = np.cumsum([len(w) for w, _ in batch])[:-1]
+        for (_, future), result in zip(batch, np.split(embeddings, splits)):
+            future.set_result(result)
+
+    def _predict_padded(self, windows: np.ndarray) -> np.ndarray:
+        """Embed at most `batch_size` windows as one batch of exactly that size."""
+        n_windows = len(windows)
+        if n_windows < self.batch_size:
+            padding = np.zeros(
+                (self.batch_size - n_windows, *windows.shape[1:]), dtype=windows.dtype
+            )
+            windows = np.concatenate([windows, padding])
+        return self._predict(windows)[:n_windows]
@@ -0,0 +1,291 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """Content-addressed cache of embeddings with a memory and an optional disk tier.
+
+    Entries are keyed by a hash of the decoded audio and the parameters of the
+    feature extraction and model (see `key`), so the same audio embedded with the same
+    settings is never run through the model twice. The memory tier is a bounded LRU,
+    the disk tier stores one `.npy` file per entry and evicts the least recently used
+    files once it grows over `max_disk_bytes`.
+
+    Examples:
+        >>> from kth_sr.cache import EmbeddingCache
+        >>> cache = EmbeddingCache(max_items=512, disk_path="data/embedding_cache")
+        >>> key = EmbeddingCache.key(audio, 16000, 160, 100, "ResCNN_265")
+        >>> embeddings = cache.get_or_compute(key, lambda: embed(audio))
+        >>> cache.stats()
+        {'hits': 0, 'disk_hits': 0, 'misses': 1, 'items': 1, 'disk_bytes': 51328}
+    """
+
+    _memory: OrderedDict
+    """Memory tier, ordered from the least recently used entry."""
+    _disk_path: Path | None
+    """Directory of the disk tier, None if disabled."""
+    _disk_bytes: int
+    """Total size of the files in the disk tier."""
+    _lock: threading.Lock
+    """Lock guarding the memory tier, the bookkeeping of both tiers and the counters.
+    Disk reads and writes run outside of it."""
+    _in_flight: dict[str, Future]
+    """Futures of the entries being read from disk or computed, by key."""
+    _writing: set
+    """Keys of the files being written to the disk tier."""
+
+    def __init__(
+        self,
+        max_items: int = 1024,
+        disk_path: str | None = None,
+        max_disk_bytes: int = 2**30,
+    ):
+        """Create the cache.
+
+        Args:
+            max_items (int, optional): Capacity of the memory tier. Defaults to 1024.
+            disk_path (str, optional): Directory of the disk tier. Defaults to None,
+            which disables the disk tier.
+            max_disk_bytes (int, optional): Size limit of the disk tier.
+            Defaults to 1 GiB.
+        """
+        self.max_items = max_items
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        """Number of lookups served from memory."""
+        self.disk_hits = 0
+        """Number of lookups served from disk."""
+        self.misses = 0
+        """Number of lookups not found in any tier."""
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._writing = set()
+        self._evict_lock = threading.Lock()
+        self._disk_path = None
+        self._disk_bytes = 0
+        if disk_path is not None:
+            self._disk_path = Path(disk_path)
+            self._disk_path.mkdir(parents=True, exist_ok=True)
+            self._disk_bytes = sum(
+                f.stat().st_size for f in self._disk_path.glob("*.npy")
+            )
+
+    @staticmethod
+    def key(
+        audio: np.ndarray, sample_rate: int, num_frames: int, k: int, checkpoint: str
+    ) -> str:
+        """Hash the decoded audio together with the feature and model parameters.
+
+        Args:
+            audio (np.ndarray): Decoded audio.
+            sample_rate (int): Sample rate of the audio.
+            num_frames (int): Number of frames in each window.
+            k (int): Number of windows.
+            checkpoint (str): Identifier of the model weights.
+
+        Returns:
+            str: Hex digest identifying the embeddings.
+        """
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(np.ascontiguousarray(audio, dtype=np.float32).data)
+        digest.update(f"{sample_rate}:{num_frames}:{k}:{checkpoint}".encode())
+        return digest.hexdigest()
+
+    def get(self, key: str) -> np.ndarray | None:
+        """Look up embeddings, promoting disk entries to memory.
+
+        Args:
+            key (str): Key created by `key`.
+
+        Returns:
+            np.ndarray | None: Cached embeddings or None if not cached.
+        """
+        return self._lookup(key, None)
+
+    def put(self, key: str, embeddings: np.ndarray):
+        """Store a read-only copy of embeddings in both tiers.
+
+        Args:
+            key (str): Key created by `key`.
+            embeddings (np.ndarray): Embeddings to cache.
+        """
+        value = self._frozen(embeddings)
+        if self._disk_path is not None:
+            self._put_disk(key, value)
+        with self._lock:
+            self._put_memory(key, value)
+
+    def get_or_compute(self, key: str, compute: Callable[[], np.ndarray]) -> np.ndarray:
+        """Return cached embeddings or compute and cache them.
+
+        Concurrent calls with the same key compute the embeddings once, the others
+        wait for the result.
+
+        Args:
+            key (str): Key created by `key`.
+            compute (Callable[[], np.ndarray]): Function computing the embeddings.
+
+        Returns:
+            np.ndarray: Read-only embeddings.
+        """
+        return self._lookup(key, compute)
+
+    def _lookup(
+        self, key: str, compute: Callable[[], np.ndarray] | None
+    ) -> np.ndarray | None:
+        """Look up embeddings and compute missing ones, if `compute` is given.
+
+        Only memory hits are served under the lock. The first request for another
+        key registers a future and reads the disk and computes outside the lock, so a
+        slow disk or model does not block lookups of other keys. Later requests for
+        the same key wait for the future.
+        """
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+            future = self._in_flight.get(key)
+            if future is None:
+                future = self._in_flight[key] = Future()
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            try:
+                value = future.result()
+            except Exception:
+                # the computation of the other request failed, try it again below
+                value = None
+            with self._lock:
+                if value is not None:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+            if value is None and compute is not None:
+                value = self._frozen(compute())
+                self.put(key, value)
+            return value
+
+        try:
+            value = self._get_disk(key)
+            from_disk = value is not None
+            if value is None and compute is not None:
+                value = self._frozen(compute())
+                if self._disk_path is not None:
+                    self._put_disk(key, value)
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[key]
+                self.misses += 1
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._in_flight[key]
+            if from_disk:
+                self.disk_hits += 1
+            else:
+                self.misses += 1
+            if value is not None:
+                self._put_memory(key, value)
+        future.set_result(value)
+        return value
+
+    def stats(self) -> dict:
+        """Counters for sizing the cache."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "items": len(self._memory),
+                "disk_bytes": self._disk_bytes,
+            }
+
+    @staticmethod
+    def _frozen(embeddings: np.ndarray) -> np.ndarray:
+        """Read-only copy of embeddings, cached arrays are shared between callers."""
+        value = np.array(embeddings)
+        value.setflags(write=False)
+        return value
+
+    def _put_memory(self, key: str, value: np.ndarray):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def _get_disk(self, key: str) -> np.ndarray | None:
+        """Read an entry of the disk tier, without holding the lock."""
+        if self._disk_path is None:
+            return None
+        file_path = self._disk_path / f"{key}.npy"
+        try:
+            value = np.load(file_path)
+            # mark the file as recently used for the eviction
+            os.utime(file_path)
+        except FileNotFoundError:
+            return None
+        value.setflags(write=False)
+        return value
+
+    def _put_disk(self, key: str, value: np.ndarray):
+        """Write an entry of the disk tier, without holding the lock."""
+        file_path = self._disk_path / f"{key}.npy"
+        with self._lock:
+            if key in self._writing or file_path.exists():
+                return
+            self._writing.add(key)
+
+        try:
+            # write to a temporary file first, so readers never see partial files
+            tmp_path = self._disk_path / f"{key}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, value)
+            os.replace(tmp_path, file_path)
+            size = file_path.stat().st_size
+        finally:
+            with self._lock:
+                self._writing.discard(key)
+
+        with self._lock:
+            self._disk_bytes += size
+            full = self._disk_bytes > self.max_disk_bytes
+        # one eviction at a time, a running one makes room for this file too
+        if full and self._evict_lock.acquire(blocking=False):
+            try:
+                self._evict_disk()
+            finally:
+                self._evict_lock.release()
+
+    def _evict_disk(self):
+        """Remove least recently used files until the tier is 90 % full."""
+        files = []
+        for file_path in self._disk_path.glob("*.npy"):
+            try:
+                stat = file_path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime_ns, stat.st_size, file_path))
+        files.sort()
+
+        target = 0.9 * self.max_disk_bytes
+        for _, size, file_path in files:
+            if self._disk_bytes <= target:
+                break
+            file_path.unlink(missing_ok=True)
+            with self._lock:
+                self._disk_bytes -= size
@@ -1,11 +1,22 @@
+from __future__ import annotations
+
 from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Sequence
+
+import numpy as np
+
+from kth_sr.cache import EmbeddingCache
+from kth_sr.mfcc import first_k_windows
+
+if TYPE_CHECKING:
+    from deep_speaker.conv_models import DeepSpeakerModel
 
-import gdown
-from deep_speaker.conv_models import DeepSpeakerModel
+DEFAULT_CHECKPOINT = "data/ResCNN_triplet_training_checkpoint_265.h5"
+"""Path of the pre-trained Deep Speaker weights."""
 
 
 def get_embedding_model(
-    model_out_path: str = "data/ResCNN_triplet_training_checkpoint_265.h5",
+    model_out_path: str = DEFAULT_CHECKPOINT,
 ) -> DeepSpeakerModel:
     """Load pre-trained embedding model Deep Speaker from Google Drive.
 
@@ -15,6 +26,10 @@ def get_embedding_model(
     Returns:
         DeepSpeakerModel: Pre-trained model.
     """
+    # TensorFlow takes seconds to import, load it only once the model is needed
+    import gdown
+    from deep_speaker.conv_models import DeepSpeakerModel
+
     if not Path(model_out_path).exists():
         file_url = "https://drive.google.com/uc?id=1F9NvdrarWZNktdX9KlRYWWHDwRkip_aP"
         gdown.download(file_url, model_out_path, quiet=False)
@@ -24,3 +39,92 @@ def get_embedding_model(
 
     model.m.load_weights(model_out_path, by_name=True)
     return model
+
+
+def compile_inference(
+    model: DeepSpeakerModel, num_frames: int = 160, n_filters: int = 64
+) -> Callable[[np.ndarray], np.ndarray]:
+    """Compile the forward pass of the model for feature windows of a fixed shape.
+
+    The graph is traced once for any batch size, so calls skip the per-call overhead
+    of `predict` and do not retrace when the batch size changes.
+
+    Args:
+        model (DeepSpeakerModel): Embedding model.
+        num_frames (int, optional): Number of frames in each window. Defaults to 160.
+        n_filters (int, optional): Number of filter banks of the features. Defaults
+        to 64.
+
+    Returns:
+        Callable[[np.ndarray], np.ndarray]: Function embedding windows of dimensions
+        (n, num_frames, n_filters, 1).
+    """
+    import tensorflow as tf
+
+    forward = tf.function(
+        lambda windows: model.m(windows, training=False),
+        input_signature=[
+            tf.TensorSpec([None, num_frames, n_filters, 1], dtype=tf.float32)
+        ],
+    ).get_concrete_function()
+
+    def predict(windows: np.ndarray) -> np.ndarray:
+        return forward(tf.constant(windows, dtype=tf.float32)).numpy()
+
+    return predict
+
+
+def warmup(
+    predict: Callable[[np.ndarray], np.ndarray],
+    num_frames: int = 160,
+    n_filters: int = 64,
+    batch_sizes: Sequence[int] = (1,),
+):
+    """Embed silent windows, so the first request does not pay for initialization.
+
+    Args:
+        predict (Callable[[np.ndarray], np.ndarray]): Function embedding feature
+        windows.
+        num_frames (int, optional): Number of frames in each window. Defaults to 160.
+        n_filters (int, optional): Number of filter banks of the features. Defaults
+        to 64.
+        batch_sizes (Sequence[int], optional): Batch sizes to run. Defaults to (1,).
+    """
+    for batch_size in batch_sizes:
+        predict(np.zeros((batch_size, num_frames, n_filters, 1), dtype=np.float32))
+
+
+def embed_audio(
+    predict: Callable[[np.ndarray], np.ndarray],
+    audio: np.ndarray,
+    sample_rate: int,
+    num_frames: int,
+    k: int = 5,
+    cache: EmbeddingCache | None = None,
+    checkpoint: str = DEFAULT_CHECKPOINT,
+) -> np.ndarray:
+    """Embed the first k windows of the audio, reusing cached embeddings.
+
+    Args:
+        predict (Callable[[np.ndarray], np.ndarray]): Function embedding feature
+        windows, e.g. `model.m.predict` or `BatchedPredictor.predict`.
+        audio (np.ndarray): Audio array.
+        sample_rate (int): Sample rate of the audio.
+        num_frames (int): Number of frames in each window.
+        k (int): Number of windows to embed.
+        cache (EmbeddingCache, optional): Cache of embeddings. Defaults to None.
+        checkpoint (str, optional): Identifier of the model weights, part of the cache
+        key. Defaults to DEFAULT_CHECKPOINT.
+
+    Returns:
+        np.ndarray: Embeddings of the windows, dimensions are (k, 512).
+    """
+
+    def compute():
+        return predict(first_k_windows(audio, sample_rate, num_frames, k))
+
+    if cache is None:
+        return compute()
+
+    key = cache.key(audio, sample_rate, num_frames, k, checkpoint)
+    return cache.get_or_compute(key, compute)
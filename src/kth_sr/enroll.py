@@ -0,0 +1,356 @@
+"""Build a vector store from a folder of clips named `{speaker}_{sample}_{duration}`.
+
+Clips are processed in chunks. Worker processes decode the clips of the next chunk
+and compute their features while the model embeds the current chunk in fixed-size
+batches, and the embeddings are added to the store. Every finished chunk is saved to
+the work directory, so an enrollment restarted after a crash re-adds the saved chunks
+and continues with the first unfinished one instead of starting over.
+
+Run:
+    python -m kth_sr.enroll data/clips data/filtered_celebs_data/celebs_200_9_clips
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Callable, Iterator
+
+import numpy as np
+
+from kth_sr.audio import decode_audio
+from kth_sr.mfcc import first_k_windows
+from kth_sr.pipeline import feature_executor
+from kth_sr.utils import get_df_by_downloaded_folder
+from kth_sr.vectorstore import FAISS
+
+STAGES = ("features", "embed", "index", "total")
+"""Stages reported by `enroll`."""
+
+
+def clip_features(
+    path: str, sample_rate: int, num_frames: int, k: int
+) -> tuple[np.ndarray | None, str | None, float]:
+    """Decode a clip and compute its feature windows.
+
+    Picklable entry point for worker processes of `enroll`.
+
+    Args:
+        path (str): Path to the clip.
+        sample_rate (int): Sample rate of the features.
+        num_frames (int): Number of frames in each window.
+        k (int): Number of windows.
+
+    Returns:
+        tuple: Tuple of the windows, None if the clip cannot be decoded, the error
+        message and the seconds spent.
+    """
+    begin = time.perf_counter()
+    try:
+        audio = decode_audio(Path(path).read_bytes(), sample_rate)
+        windows, error = first_k_windows(audio, sample_rate, num_frames, k), None
+    except Exception as e:
+        windows, error = None, str(e)
+    return windows, error, time.perf_counter() - begin
+
+
+def enroll(
+    paths: list,
+    speakers: list,
+    store_path: str,
+    predict: Callable[[np.ndarray], np.ndarray],
+    work_dir: str | None = None,
+    workers: int = 4,
+    chunk_clips: int = 1000,
+    batch_size: int = 256,
+    sample_rate: int = 16000,
+    num_frames: int = 160,
+    k: int = 5,
+    train_size: int = 100_000,
+    index_type: str = "flat",
+    checkpoint: str = "",
+    **index_params,
+) -> tuple[FAISS, dict]:
+    """Embed clips into a new `FAISS` store and save it, resuming an interrupted run.
+
+    Each clip contributes its first k windows, labelled with its speaker. Indexes
+    which need training are trained on the first `train_size` embeddings.
+
+    Args:
+        paths (list): Paths to the clips, in a fixed order.
+        speakers (list): Speaker of each clip.
+        store_path (str): Directory to save the store to.
+        predict (Callable[[np.ndarray], np.ndarray]): Function embedding feature
+        windows, e.g. `compile_inference(model)`.
+        work_dir (str, optional): Directory of the finished chunks. Defaults to None,
+        `{store_path}/enrollment`, which is removed once the store is saved.
+        workers (int, optional): Processes computing features, 0 computes them in
+        the current process. Defaults to 4.
+        chunk_clips (int, optional): Number of clips per checkpointed chunk.
+        Defaults to 1000.
+        batch_size (int, optional): Number of windows per model call. Defaults
+        to 256.
+        sample_rate (int, optional): Sample rate of the features. Defaults to 16000.
+        num_frames (int, optional): Number of frames in each window. Defaults to 160.
+        k (int, optional): Number of windows per clip. Defaults to 5.
+        train_size (int, optional): Number of embeddings to train the index on.
+        Defaults to 100_000.
+        index_type (str, optional): Index type of the store. Defaults to "flat".
+        checkpoint (str, optional): Identifier of the model weights, chunks
+        embedded with other weights are not resumed. Defaults to "".
+        **index_params: Parameters of the index, see `FAISS`.
+
+    Raises:
+        ValueError: If lengths of paths and speakers differ, or the work directory
+        belongs to an enrollment with other clips or parameters.
+
+    Returns:
+        tuple: Tuple of the store and the throughput of each stage of `STAGES`, in
+        clips per second. Clips of chunks restored from the work directory count
+        only for the index stage.
+    """
+    if len(paths) != len(speakers):
+        raise ValueError("Paths and speakers must have the same length.")
+
+    remove_work_dir = work_dir is None
+    work_dir = Path(store_path) / "enrollment" if work_dir is None else Path(work_dir)
+    work_dir.mkdir(parents=True, exist_ok=True)
+    _check_manifest(
+        work_dir,
+        {
+            "clips": [[str(p), str(s)] for p, s in zip(paths, speakers)],
+            "params": {
+                "chunk_clips": chunk_clips,
+                "sample_rate": sample_rate,
+                "num_frames": num_frames,
+                "k": k,
+                "checkpoint": checkpoint,
+            },
+        },
+    )
+
+    begin = time.perf_counter()
+    seconds = dict.fromkeys(STAGES, 0.0)
+    counts = dict.fromkeys(STAGES, 0)
+    store = FAISS(index_type=index_type, **index_params)
+    pending = []  # chunks waiting for the index to be trained
+
+    def add(embeddings: np.ndarray, labels: list):
+        if len(embeddings):
+            pending.append((embeddings, labels))
+        flush(force=False)
+
+    def flush(force: bool):
+        n_pending = sum(len(e) for e, _ in pending)
+        if not pending or (
+            not store.is_trained and n_pending < train_size and not force
+        ):
+            return
+        t = time.perf_counter()
+        if not store.is_trained:
+            store.train(np.concatenate([e for e, _ in pending])[:train_size])
+        for chunk_embeddings, chunk_labels in pending:
+            store.add(chunk_embeddings, chunk_labels)
+        pending.clear()
+        seconds["index"] += time.perf_counter() - t
+
+    chunks = [
+        range(start, min(start + chunk_clips, len(paths)))
+        for start in range(0, len(paths), chunk_clips)
+    ]
+    chunk_files = [work_dir / f"chunk_{i:06d}.npz" for i in range(len(chunks))]
+    todo = [i for i, file in enumerate(chunk_files) if not file.exists()]
+
+    # chunks finished by a previous run only need to be added to the store
+    for i, file in enumerate(chunk_files):
+        if i not in todo:
+            with np.load(file) as chunk:
+                add(chunk["embeddings"], chunk["labels"].tolist())
+            counts["index"] += len(chunks[i])
+
+    todo_chunks = [chunks[i] for i in todo]
+    with closing(
+        clip_feature_chunks(paths, todo_chunks, workers, sample_rate, num_frames, k)
+    ) as chunk_features:
+        for i, features in zip(todo, chunk_features):
+            windows, labels = [], []
+            for j, (clip_windows, error, clip_seconds) in zip(chunks[i], features):
+                seconds["features"] += clip_seconds / max(workers, 1)
+                if clip_windows is None:
+                    print(f"Skipping {paths[j]}: {error}")
+                    continue
+                windows.append(clip_windows)
+                labels.extend([str(speakers[j])] * len(clip_windows))
+            counts["features"] += len(chunks[i])
+
+            t = time.perf_counter()
+            embeddings = embed_batches(predict, windows, batch_size)
+            seconds["embed"] += time.perf_counter() - t
+            counts["embed"] += len(chunks[i])
+
+            _save_chunk(chunk_files[i], embeddings, labels)
+            add(embeddings, labels)
+            counts["index"] += len(chunks[i])
+
+    # fewer embeddings than train_size, the index is trained on all of them
+    flush(force=True)
+    store.save(store_path)
+    if remove_work_dir:
+        shutil.rmtree(work_dir)
+
+    seconds["total"] = time.perf_counter() - begin
+    counts["total"] = counts["index"]
+    throughput = {
+        stage: counts[stage] / seconds[stage] if seconds[stage] > 0 else 0.0
+        for stage in STAGES
+    }
+    return store, throughput
+
+
+def clip_feature_chunks(
+    paths: list,
+    chunks: list,
+    workers: int,
+    sample_rate: int,
+    num_frames: int,
+    k: int,
+) -> Iterator[list]:
+    """Yield the `clip_features` of the clips of each chunk, in order.
+
+    Worker processes compute the features of the next chunk while the caller
+    processes the current one. Close the generator, e.g. with `contextlib.closing`,
+    to stop the workers when the caller stops early.
+
+    Args:
+        paths (list): Paths to the clips.
+        chunks (list): Ranges of indices into `paths`, one per chunk.
+        workers (int): Processes computing features, 0 computes them in the
+        current process.
+        sample_rate (int): Sample rate of the features.
+        num_frames (int): Number of frames in each window.
+        k (int): Number of windows per clip.
+
+    Yields:
+        list: Result of `clip_features` for every clip of the chunk.
+    """
+    pool = feature_executor(workers) if workers > 0 and chunks else None
+
+    def extract(chunk: range):
+        chunk_paths = [str(paths[j]) for j in chunk]
+        n = len(chunk_paths)
+        args = ([sample_rate] * n, [num_frames] * n, [k] * n)
+        if pool is None:
+            return map(clip_features, chunk_paths, *args)
+        return pool.map(
+            clip_features,
+            chunk_paths,
+            *args,
+            chunksize=max(1, n // (4 * workers)),
+        )
+
+    try:
+        next_features = extract(chunks[0]) if chunks else None
+        for i in range(len(chunks)):
+            features = list(next_features)
+            # the workers compute the next chunk while this one is processed
+            if i + 1 < len(chunks):
+                next_features = extract(chunks[i + 1])
+            yield features
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+
+def embed_batches(
+    predict: Callable[[np.ndarray], np.ndarray], windows: list, batch_size: int
+) -> np.ndarray:
+    """Embed the windows of all clips in batches of `batch_size` windows."""
+    if not windows:
+        return np.empty((0, 0), dtype=np.float32)
+    windows = np.concatenate(windows)
+    return np.concatenate(
+        [
+            np.asarray(predict(windows[i : i + batch_size]), dtype=np.float32)
+            for i in range(0, len(windows), batch_size)
+        ]
+    )
+
+
+def _save_chunk(path: Path, embeddings: np.ndarray, labels: list):
+    """Write a finished chunk atomically, so a crash never leaves a partial file."""
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "wb") as f:
+        np.savez(f, embeddings=embeddings, labels=np.array(labels, dtype=str))
+    os.replace(tmp_path, path)
+
+
+def _check_manifest(work_dir: Path, manifest: dict):
+    """Record the clips and parameters of the enrollment, or check they match."""
+    manifest_path = work_dir / "manifest.json"
+    if not manifest_path.exists():
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f)
+        return
+
+    with open(manifest_path) as f:
+        if json.load(f) != manifest:
+            raise ValueError(
+                f"{work_dir} contains chunks of an enrollment with other clips or "
+                "parameters, remove it or choose another work directory."
+            )
+
+
+def main():
+    from kth_sr.embeddings import (
+        DEFAULT_CHECKPOINT,
+        compile_inference,
+        get_embedding_model,
+    )
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("clips", help="folder with the clips")
+    parser.add_argument("store", help="directory to save the store to")
+    parser.add_argument("--pattern", default="*.mp3", help="glob pattern of the clips")
+    parser.add_argument("--work-dir", help="directory of the finished chunks")
+    parser.add_argument(
+        "--workers", type=int, default=max((os.cpu_count() or 1) - 1, 1)
+    )
+    parser.add_argument("--chunk-clips", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--k", type=int, default=5, help="windows per clip")
+    parser.add_argument("--index-type", default="flat", choices=FAISS.INDEX_TYPES)
+    parser.add_argument("--checkpoint", help="weights of the embedding model")
+    args = parser.parse_args()
+
+    clips = get_df_by_downloaded_folder(args.clips, args.pattern).sort_values("path")
+    print(f"Enrolling {len(clips)} clips of {clips['speaker'].nunique()} speakers")
+    model = (
+        get_embedding_model(args.checkpoint)
+        if args.checkpoint
+        else get_embedding_model()
+    )
+
+    _, throughput = enroll(
+        clips["path"].tolist(),
+        clips["speaker"].tolist(),
+        args.store,
+        compile_inference(model),
+        work_dir=args.work_dir,
+        workers=args.workers,
+        chunk_clips=args.chunk_clips,
+        batch_size=args.batch_size,
+        k=args.k,
+        index_type=args.index_type,
+        checkpoint=args.checkpoint or DEFAULT_CHECKPOINT,
+    )
+    for stage, clips_per_s in throughput.items():
+        print(f"{stage:>10}: {clips_per_s:8.1f} clips/s")
+
+
+if __name__ == "__main__":
+    main()
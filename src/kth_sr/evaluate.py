@@ -0,0 +1,330 @@
+"""Evaluate speaker identification on held-out clips against a saved vector store.
+
+Clips named `{speaker}_{sample}_{duration}` are decoded and their features computed
+in worker processes, chunk by chunk, while the model embeds the previous chunk in
+fixed-size batches. All queries are then ranked with one batched
+`FAISS.search_speakers` call. Query embeddings are cached with the clips and
+parameters they were computed for, so runs with other windows per clip (up to the
+cached number), aggregations or thresholds skip decoding and inference entirely.
+
+Run:
+    python -m kth_sr.evaluate data/test_clips data/filtered_celebs_data/celebs_200_9_clips
+"""
+
+from __future__ import annotations
+
+import argparse
+import functools
+import json
+import os
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+
+from kth_sr.enroll import clip_feature_chunks, embed_batches
+from kth_sr.utils import get_df_by_downloaded_folder
+from kth_sr.vectorstore import FAISS
+
+STAGES = ("features", "embed")
+"""Stages reported by `embed_clips`."""
+
+
+def embed_clips(
+    paths: list,
+    predict: Callable[[np.ndarray], np.ndarray],
+    cache_path: str | None = None,
+    workers: int = 4,
+    chunk_clips: int = 1000,
+    batch_size: int = 256,
+    sample_rate: int = 16000,
+    num_frames: int = 160,
+    k: int = 5,
+    checkpoint: str = "",
+) -> tuple[np.ndarray, np.ndarray, dict]:
+    """Embed the first k windows of every clip, or load them from the cache.
+
+    Args:
+        paths (list): Paths to the clips.
+        predict (Callable[[np.ndarray], np.ndarray]): Function embedding feature
+        windows, e.g. `compile_inference(model)`.
+        cache_path (str, optional): `.npz` file caching the embeddings. Defaults to
+        None, no cache.
+        workers (int, optional): Processes computing features, 0 computes them in
+        the current process. Defaults to 4.
+        chunk_clips (int, optional): Number of clips whose features are computed
+        while the previous ones are embedded. Defaults to 1000.
+        batch_size (int, optional): Number of windows per model call. Defaults
+        to 256.
+        sample_rate (int, optional): Sample rate of the features. Defaults to 16000.
+        num_frames (int, optional): Number of frames in each window. Defaults to 160.
+        k (int, optional): Number of windows per clip. Defaults to 5.
+        checkpoint (str, optional): Identifier of the model weights, embeddings
+        cached for other weights are not used. Defaults to "".
+
+    Returns:
+        tuple: Tuple of `embeddings`, `lengths` and `throughput`.
+        - embeddings (np.ndarray): Embeddings of the windows of all clips.
+        - lengths (np.ndarray): Number of windows of each clip, 0 if the clip could
+        not be decoded.
+        - throughput (dict): Clips per second of each stage of `STAGES`, empty if
+        the embeddings were loaded from the cache.
+    """
+    clips = [_clip_id(path) for path in paths]
+    params = {
+        "sample_rate": sample_rate,
+        "num_frames": num_frames,
+        "checkpoint": checkpoint,
+    }
+    if cache_path is not None and Path(cache_path).exists():
+        with np.load(cache_path) as cache:
+            manifest = json.loads(str(cache["manifest"]))
+            # windows of a clip are the same for any k, fewer are a prefix of more
+            if (
+                manifest["clips"] == clips
+                and manifest["params"] == params
+                and manifest["k"] >= k
+            ):
+                embeddings, lengths = _first_windows(
+                    cache["embeddings"], cache["lengths"], k
+                )
+                return embeddings, lengths, {}
+
+    seconds = dict.fromkeys(STAGES, 0.0)
+    chunks = [
+        range(start, min(start + chunk_clips, len(paths)))
+        for start in range(0, len(paths), chunk_clips)
+    ]
+    all_embeddings, lengths = [], np.zeros(len(paths), dtype=np.int64)
+    with closing(
+        clip_feature_chunks(paths, chunks, workers, sample_rate, num_frames, k)
+    ) as chunk_features:
+        for chunk, features in zip(chunks, chunk_features):
+            windows = []
+            for j, (clip_windows, error, clip_seconds) in zip(chunk, features):
+                seconds["features"] += clip_seconds / max(workers, 1)
+                if clip_windows is None:
+                    print(f"Skipping {paths[j]}: {error}")
+                    continue
+                windows.append(clip_windows)
+                lengths[j] = len(clip_windows)
+
+            t = time.perf_counter()
+            if windows:
+                all_embeddings.append(embed_batches(predict, windows, batch_size))
+            seconds["embed"] += time.perf_counter() - t
+
+    embeddings = (
+        np.concatenate(all_embeddings)
+        if all_embeddings
+        else np.empty((0, 0), dtype=np.float32)
+    )
+    if cache_path is not None:
+        manifest = {"clips": clips, "params": params, "k": k}
+        _save_cache(Path(cache_path), embeddings, lengths, manifest)
+
+    throughput = {
+        stage: len(paths) / seconds[stage] if seconds[stage] > 0 else 0.0
+        for stage in STAGES
+    }
+    return embeddings, lengths, throughput
+
+
+def score(
+    store: FAISS,
+    embeddings: np.ndarray,
+    lengths: np.ndarray,
+    speakers: list,
+    k: int | None = None,
+    aggregation: str = "mean",
+    threshold: float | None = None,
+) -> dict:
+    """Identify the speaker of every clip and measure the accuracy.
+
+    Clips which could not be decoded and clips of speakers missing from the store
+    are left out of the accuracy.
+
+    Args:
+        store (FAISS): Store of the enrolled speakers.
+        embeddings (np.ndarray): Embeddings of the windows of all clips, see
+        `embed_clips`.
+        lengths (np.ndarray): Number of windows of each clip.
+        speakers (list): Speaker of each clip.
+        k (int, optional): Number of windows per clip to use, the first ones.
+        Defaults to None, all windows.
+        aggregation (str, optional): How to combine windows of a clip, see
+        `FAISS.search_speakers`. Defaults to "mean".
+        threshold (float, optional): Clips whose best speaker has a mean distance
+        above the threshold, or a vote share below it, are rejected and count as
+        misidentified. Defaults to None, no clip is rejected.
+
+    Raises:
+        ValueError: If lengths of lengths and speakers differ.
+
+    Returns:
+        dict: Dictionary of `n_clips`, `n_failed` (not decoded), `n_unknown`
+        (speaker not in the store), `top1` and `top5` accuracy, `rejected` share of
+        the scored clips and `search_s`, seconds spent searching.
+    """
+    if len(lengths) != len(speakers):
+        raise ValueError("Lengths and speakers must have the same length.")
+    if k is not None:
+        embeddings, lengths = _first_windows(embeddings, lengths, k)
+
+    lengths = np.asarray(lengths)
+    known = set(store.metadata)
+    in_store = np.array([s in known for s in speakers], dtype=bool)
+    scored = (lengths > 0) & in_store
+    # windows of the scored clips, in the order of the clips
+    window_mask = np.repeat(scored, lengths)
+    truth = [s for s, keep in zip(speakers, scored) if keep]
+
+    begin = time.perf_counter()
+    if truth:
+        scores, ranked = store.search_speakers(
+            embeddings[window_mask], 5, aggregation, lengths[scored].tolist()
+        )
+    else:
+        scores, ranked = [], []
+    search_s = time.perf_counter() - begin
+
+    best = np.array([row[0] for row in scores])
+    rejected = np.zeros(len(truth), dtype=bool)
+    if threshold is not None and len(truth):
+        rejected = best > threshold if aggregation == "mean" else best < threshold
+    top1 = [not r and row[0] == s for row, s, r in zip(ranked, truth, rejected)]
+    top5 = [not r and s in row for row, s, r in zip(ranked, truth, rejected)]
+
+    return {
+        "n_clips": len(speakers),
+        "n_failed": int((lengths == 0).sum()),
+        "n_unknown": int(((lengths > 0) & ~in_store).sum()),
+        "top1": float(np.mean(top1)) if truth else 0.0,
+        "top5": float(np.mean(top5)) if truth else 0.0,
+        "rejected": float(rejected.mean()) if truth else 0.0,
+        "search_s": search_s,
+    }
+
+
+def _clip_id(path) -> list:
+    """Path, size and modification time of a clip, changed clips are embedded again."""
+    stat = os.stat(path)
+    return [str(path), stat.st_size, stat.st_mtime_ns]
+
+
+def _first_windows(
+    embeddings: np.ndarray, lengths: np.ndarray, k: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """Keep the first k windows of every clip."""
+    lengths = np.asarray(lengths, dtype=np.int64)
+    kept = np.minimum(lengths, k)
+    if (kept == lengths).all():
+        return embeddings, lengths
+    starts = np.cumsum(lengths) - lengths
+    offsets = np.arange(kept.sum()) - np.repeat(np.cumsum(kept) - kept, kept)
+    return embeddings[np.repeat(starts, kept) + offsets], kept
+
+
+def _save_cache(path: Path, embeddings: np.ndarray, lengths: np.ndarray, manifest):
+    """Write the cache atomically, so a crash never leaves a partial file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "wb") as f:
+        np.savez(
+            f,
+            embeddings=embeddings,
+            lengths=lengths,
+            manifest=np.array(json.dumps(manifest)),
+        )
+    os.replace(tmp_path, path)
+
+
+def main():
+    from kth_sr.embeddings import (
+        DEFAULT_CHECKPOINT,
+        compile_inference,
+        get_embedding_model,
+    )
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("clips", help="folder with the held-out clips")
+    parser.add_argument("store", help="directory of the saved store")
+    parser.add_argument("--pattern", default="*.mp3", help="glob pattern of the clips")
+    parser.add_argument("--cache", help="file caching the query embeddings")
+    parser.add_argument(
+        "--workers", type=int, default=max((os.cpu_count() or 1) - 1, 1)
+    )
+    parser.add_argument("--chunk-clips", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument(
+        "--k", type=int, nargs="+", default=[5], help="windows per clip"
+    )
+    parser.add_argument(
+        "--aggregation", nargs="+", default=["mean"], choices=FAISS.AGGREGATIONS
+    )
+    parser.add_argument("--threshold", type=float, nargs="+", default=[None])
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT)
+    args = parser.parse_args()
+
+    clips = get_df_by_downloaded_folder(args.clips, args.pattern).sort_values("path")
+    store = FAISS.load(args.store)
+    print(f"Evaluating {len(clips)} clips of {clips['speaker'].nunique()} speakers")
+
+    # the model is loaded only if the embeddings are not cached
+    @functools.cache
+    def model() -> Callable[[np.ndarray], np.ndarray]:
+        return compile_inference(get_embedding_model(args.checkpoint))
+
+    def predict(windows: np.ndarray) -> np.ndarray:
+        return model()(windows)
+
+    begin = time.perf_counter()
+    embeddings, lengths, throughput = embed_clips(
+        clips["path"].tolist(),
+        predict,
+        cache_path=args.cache,
+        workers=args.workers,
+        chunk_clips=args.chunk_clips,
+        batch_size=args.batch_size,
+        k=max(args.k),
+        checkpoint=args.checkpoint,
+    )
+    elapsed = time.perf_counter() - begin
+    if throughput:
+        for stage, clips_per_s in throughput.items():
+            print(f"{stage:>10}: {clips_per_s:8.1f} clips/s")
+    else:
+        print(f"Loaded cached embeddings in {elapsed:.2f} s")
+
+    print(
+        f"{'k':>3} {'aggregation':<11} {'threshold':>9} {'top-1':>6} {'top-5':>6} "
+        f"{'rejected':>8} {'search clips/s':>14}"
+    )
+    for k in args.k:
+        for aggregation in args.aggregation:
+            for threshold in args.threshold:
+                result = score(
+                    store,
+                    embeddings,
+                    lengths,
+                    clips["speaker"].tolist(),
+                    k,
+                    aggregation,
+                    threshold,
+                )
+                clips_per_s = len(clips) / max(result["search_s"], 1e-9)
+                print(
+                    f"{k:>3} {aggregation:<11} {str(threshold):>9} "
+                    f"{result['top1']:>6.1%} {result['top5']:>6.1%} "
+                    f"{result['rejected']:>8.1%} {clips_per_s:>14.0f}"
+                )
+    print(
+        f"{result['n_failed']} clips could not be decoded, {result['n_unknown']} "
+        "clips are of speakers not in the store"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,410 @@
+"""Store of the feature windows of a corpus, for embedding it with other models.
+
+The `first_k_windows` of every clip are appended to one binary file of float32
+windows, memory-mapped for reading, with the offset of the windows of each clip,
+its path and speaker in index files. Embedding the corpus with a new checkpoint
+streams batches of windows from the file instead of decoding the clips again.
+The description `store.json` is written last, so windows and index entries of an
+interrupted append past the recorded counts are ignored and overwritten by the next
+append.
+
+Run:
+    python -m kth_sr.features data/clips data/features --workers 8
+    python -m kth_sr.features data/clips data/features --embed data/new_store \\
+        --checkpoint data/new_checkpoint.h5
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Callable, Iterator
+
+import numpy as np
+
+from kth_sr.enroll import clip_feature_chunks
+from kth_sr.utils import get_df_by_downloaded_folder
+from kth_sr.vectorstore import FAISS
+
+
+class FeatureStore:
+    """Append-only, memory-mapped feature windows of clips, indexed by clip.
+
+    Examples:
+        >>> from kth_sr.features import FeatureStore
+        >>> features = FeatureStore("data/features", k=5)
+        >>> features.append(["a.mp3"], ["id00001"], [windows])
+        >>> windows, lengths = features.speaker_windows("id00001")
+        >>> for windows, labels in features.batches(256):
+        ...     store.add(predict(windows), labels)
+    """
+
+    def __init__(
+        self,
+        path: str,
+        sample_rate: int = 16000,
+        num_frames: int = 160,
+        k: int = 5,
+        n_filters: int = 64,
+    ):
+        """Open the store in a directory, creating it if it does not exist.
+
+        Args:
+            path (str): Directory of the store.
+            sample_rate (int, optional): Sample rate of the features. Defaults to
+            16000.
+            num_frames (int, optional): Number of frames in each window. Defaults
+            to 160.
+            k (int, optional): Maximum number of windows per clip. Defaults to 5.
+            n_filters (int, optional): Number of filter banks of the features.
+            Defaults to 64.
+
+        Raises:
+            ValueError: The store exists with other parameters.
+        """
+        self.path = Path(path)
+        self.params = {
+            "sample_rate": sample_rate,
+            "num_frames": num_frames,
+            "k": k,
+            "n_filters": n_filters,
+        }
+        self.n_clips = 0
+        """Number of clips in the store."""
+        self.n_windows = 0
+        """Number of windows of all clips."""
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._paths = np.zeros(0, dtype=str)
+        self._speakers = np.zeros(0, dtype=str)
+        self._windows = None
+
+        description_path = self.path / "store.json"
+        if description_path.exists():
+            with open(description_path) as f:
+                description = json.load(f)
+            if description["params"] != self.params:
+                raise ValueError(
+                    f"{path} stores features with parameters "
+                    f"{description['params']}, not {self.params}."
+                )
+            self.n_clips = description["n_clips"]
+            self.n_windows = description["n_windows"]
+            # entries of an interrupted append are past the recorded counts
+            self._offsets = np.load(self.path / "offsets.npy")[: self.n_clips + 1]
+            self._paths = np.load(self.path / "paths.npy")[: self.n_clips]
+            self._speakers = np.load(self.path / "speakers.npy")[: self.n_clips]
+
+    @property
+    def window_shape(self) -> tuple:
+        """Dimensions of one window, as returned by `first_k_windows`."""
+        return (self.params["num_frames"], self.params["n_filters"], 1)
+
+    @property
+    def paths(self) -> list:
+        """Path of each clip, in the order they were appended."""
+        return self._paths.tolist()
+
+    @property
+    def speakers(self) -> list:
+        """Speaker of each clip, in the order they were appended."""
+        return self._speakers.tolist()
+
+    @property
+    def windows(self) -> np.ndarray:
+        """Memory-mapped windows of all clips, dimensions are
+        (n_windows, num_frames, n_filters, 1)."""
+        if self._windows is None or len(self._windows) != self.n_windows:
+            if self.n_windows == 0:
+                return np.zeros((0, *self.window_shape), dtype=np.float32)
+            self._windows = np.memmap(
+                self.path / "windows.bin",
+                dtype=np.float32,
+                mode="r",
+                shape=(self.n_windows, *self.window_shape),
+            )
+        return self._windows
+
+    def append(self, paths: list, speakers: list, windows: list):
+        """Append the windows of clips and save the store.
+
+        Args:
+            paths (list): Paths of the clips.
+            speakers (list): Speaker of each clip.
+            windows (list): Windows of each clip, dimensions are (n, num_frames,
+            n_filters, 1) with n up to k.
+
+        Raises:
+            ValueError: If lengths of the arguments differ or windows have another
+            shape.
+        """
+        if not len(paths) == len(speakers) == len(windows):
+            raise ValueError("Paths, speakers and windows must have the same length.")
+        for clip_windows in windows:
+            if (
+                clip_windows.shape[1:] != self.window_shape
+                or len(clip_windows) > self.params["k"]
+            ):
+                raise ValueError(
+                    f"Windows of shape {clip_windows.shape} do not fit the store, "
+                    f"expected up to {self.params['k']} windows of {self.window_shape}."
+                )
+        if not len(paths):
+            return
+
+        self.path.mkdir(parents=True, exist_ok=True)
+        lengths = np.array([len(w) for w in windows], dtype=np.int64)
+        window_bytes = np.prod(self.window_shape) * np.dtype(np.float32).itemsize
+        with open(self.path / "windows.bin", "ab") as f:
+            # drop windows of an interrupted append
+            f.truncate(self.n_windows * window_bytes)
+            for clip_windows in windows:
+                f.write(np.ascontiguousarray(clip_windows, dtype=np.float32).data)
+
+        self._offsets = np.concatenate(
+            (self._offsets, self.n_windows + np.cumsum(lengths))
+        )
+        self._paths = np.concatenate((self._paths, np.asarray(paths, dtype=str)))
+        self._speakers = np.concatenate(
+            (self._speakers, np.asarray(speakers, dtype=str))
+        )
+        self.n_clips += len(paths)
+        self.n_windows += int(lengths.sum())
+
+        for name, array in [
+            ("offsets", self._offsets),
+            ("paths", self._paths),
+            ("speakers", self._speakers),
+        ]:
+            tmp_path = self.path / f"{name}.tmp.npy"
+            np.save(tmp_path, array)
+            os.replace(tmp_path, self.path / f"{name}.npy")
+        # the appended clips are part of the store once its description is written
+        tmp_path = self.path / "store.json.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {
+                    "params": self.params,
+                    "n_clips": self.n_clips,
+                    "n_windows": self.n_windows,
+                },
+                f,
+            )
+        os.replace(tmp_path, self.path / "store.json")
+
+    def clip_windows(self, i: int) -> np.ndarray:
+        """Return the windows of the i-th clip, a view of the memory-mapped file."""
+        if not 0 <= i < self.n_clips:
+            raise IndexError(f"Clip {i} is not in the store of {self.n_clips} clips.")
+        return self.windows[self._offsets[i] : self._offsets[i + 1]]
+
+    def speaker_windows(self, speaker) -> tuple[np.ndarray, np.ndarray]:
+        """Return the windows of all clips of a speaker.
+
+        Args:
+            speaker: Speaker of the clips.
+
+        Returns:
+            tuple: Tuple of `windows` and `lengths`.
+            - windows (np.ndarray): Windows of the clips, in the order they were
+            appended.
+            - lengths (np.ndarray): Number of windows of each clip.
+        """
+        clips = np.flatnonzero(self._speakers == str(speaker))
+        starts, ends = self._offsets[clips], self._offsets[clips + 1]
+        lengths = ends - starts
+        if len(clips) == 0:
+            return np.zeros((0, *self.window_shape), dtype=np.float32), lengths
+        rows = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(
+            lengths.sum()
+        )
+        return np.asarray(self.windows[rows]), lengths
+
+    def batches(self, batch_size: int = 256) -> Iterator[tuple[np.ndarray, list]]:
+        """Stream the windows of all clips from disk in batches.
+
+        Args:
+            batch_size (int, optional): Number of windows per batch. Defaults to 256.
+
+        Yields:
+            tuple: Tuple of a batch of consecutive windows, a view of the
+            memory-mapped file, and the speaker of each window.
+        """
+        window_speakers = np.repeat(self._speakers, np.diff(self._offsets))
+        windows = self.windows
+        for start in range(0, self.n_windows, batch_size):
+            end = min(start + batch_size, self.n_windows)
+            yield windows[start:end], window_speakers[start:end].tolist()
+
+
+def extract_corpus(
+    paths: list,
+    speakers: list,
+    features: FeatureStore,
+    workers: int = 4,
+    chunk_clips: int = 1000,
+) -> int:
+    """Append the windows of the clips missing from a feature store.
+
+    Each chunk of clips is appended once its features are computed, so an
+    interrupted run continues with the first chunk not appended.
+
+    Args:
+        paths (list): Paths to the clips.
+        speakers (list): Speaker of each clip.
+        features (FeatureStore): Store to append to.
+        workers (int, optional): Processes computing features, 0 computes them in
+        the current process. Defaults to 4.
+        chunk_clips (int, optional): Number of clips per appended chunk. Defaults
+        to 1000.
+
+    Raises:
+        ValueError: If lengths of paths and speakers differ.
+
+    Returns:
+        int: Number of clips appended, clips which cannot be decoded are skipped.
+    """
+    if len(paths) != len(speakers):
+        raise ValueError("Paths and speakers must have the same length.")
+
+    stored = set(features.paths)
+    new = [i for i, path in enumerate(paths) if str(path) not in stored]
+    chunks = [
+        new[start : start + chunk_clips] for start in range(0, len(new), chunk_clips)
+    ]
+    chunk_paths = [str(path) for path in paths]
+    params = features.params
+
+    n_appended = 0
+    with closing(
+        clip_feature_chunks(
+            chunk_paths,
+            chunks,
+            workers,
+            params["sample_rate"],
+            params["num_frames"],
+            params["k"],
+        )
+    ) as chunk_features:
+        for chunk, results in zip(chunks, chunk_features):
+            new_paths, new_speakers, new_windows = [], [], []
+            for i, (clip_windows, error, _) in zip(chunk, results):
+                if clip_windows is None:
+                    print(f"Skipping {paths[i]}: {error}")
+                    continue
+                new_paths.append(chunk_paths[i])
+                new_speakers.append(str(speakers[i]))
+                new_windows.append(clip_windows)
+            features.append(new_paths, new_speakers, new_windows)
+            n_appended += len(new_paths)
+    return n_appended
+
+
+def embed_features(
+    features: FeatureStore,
+    store_path: str,
+    predict: Callable[[np.ndarray], np.ndarray],
+    batch_size: int = 256,
+    train_size: int = 100_000,
+    index_type: str = "flat",
+    **index_params,
+) -> tuple[FAISS, float]:
+    """Embed all windows of a feature store into a new `FAISS` store and save it.
+
+    Args:
+        features (FeatureStore): Windows to embed.
+        store_path (str): Directory to save the store to.
+        predict (Callable[[np.ndarray], np.ndarray]): Function embedding feature
+        windows, e.g. `compile_inference(model)`.
+        batch_size (int, optional): Number of windows per model call. Defaults
+        to 256.
+        train_size (int, optional): Number of embeddings to train the index on.
+        Defaults to 100_000.
+        index_type (str, optional): Index type of the store. Defaults to "flat".
+        **index_params: Parameters of the index, see `FAISS`.
+
+    Returns:
+        tuple: Tuple of the store and the throughput in clips per second.
+    """
+    begin = time.perf_counter()
+    store = FAISS(index_type=index_type, **index_params)
+    pending, n_pending = [], 0  # batches waiting for the index to be trained
+
+    for windows, labels in features.batches(batch_size):
+        embeddings = np.asarray(predict(np.asarray(windows)), dtype=np.float32)
+        if store.is_trained:
+            store.add(embeddings, labels)
+            continue
+        pending.append((embeddings, labels))
+        n_pending += len(embeddings)
+        if n_pending >= train_size:
+            store.train(np.concatenate([e for e, _ in pending])[:train_size])
+
+        if store.is_trained:
+            for embeddings, labels in pending:
+                store.add(embeddings, labels)
+            pending.clear()
+
+    if pending:
+        # fewer embeddings than train_size, the index is trained on all of them
+        store.train(np.concatenate([e for e, _ in pending]))
+        for embeddings, labels in pending:
+            store.add(embeddings, labels)
+    store.save(store_path)
+    return store, features.n_clips / (time.perf_counter() - begin)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("clips", help="folder with the clips")
+    parser.add_argument("features", help="directory of the feature store")
+    parser.add_argument("--pattern", default="*.mp3", help="glob pattern of the clips")
+    parser.add_argument(
+        "--workers", type=int, default=max((os.cpu_count() or 1) - 1, 1)
+    )
+    parser.add_argument("--chunk-clips", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=5, help="windows per clip")
+    parser.add_argument("--embed", help="directory to save a store embedded from it")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--index-type", default="flat", choices=FAISS.INDEX_TYPES)
+    parser.add_argument("--checkpoint", help="weights of the embedding model")
+    args = parser.parse_args()
+
+    clips = get_df_by_downloaded_folder(args.clips, args.pattern).sort_values("path")
+    features = FeatureStore(args.features, k=args.k)
+    begin = time.perf_counter()
+    n_appended = extract_corpus(
+        clips["path"].tolist(),
+        clips["speaker"].tolist(),
+        features,
+        workers=args.workers,
+        chunk_clips=args.chunk_clips,
+    )
+    print(
+        f"Appended {n_appended} clips in {time.perf_counter() - begin:.1f} s, "
+        f"{features.n_clips} clips and {features.n_windows} windows stored"
+    )
+
+    if args.embed:
+        from kth_sr.embeddings import compile_inference, get_embedding_model
+
+        model = (
+            get_embedding_model(args.checkpoint)
+            if args.checkpoint
+            else get_embedding_model()
+        )
+        _, clips_per_s = embed_features(
+            features,
+            args.embed,
+            compile_inference(model),
+            batch_size=args.batch_size,
+            index_type=args.index_type,
+        )
+        print(f"Embedded into {args.embed} at {clips_per_s:.1f} clips/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,26 @@
+from __future__ import annotations
+
 import json
+import math
 import os
 from pathlib import Path
+from types import MappingProxyType
 
 import pandas as pd
-import wptools
+
+from kth_sr.columnar import read_table, write_table
+from kth_sr.vectorstore import FAISS
+from kth_sr.wiki import WikiFetcher
+
+WIKI_CACHE_PATH = "./data/wiki_cache.jsonl"
+"""Wikipedia information of every name fetched so far."""
+METADATA_KEYS = {
+    "dev": "speaker",
+    "test": "speaker",
+    "celebs_dev": "speaker",
+    "vox2_meta": "VoxCeleb2_ID",
+}
+"""Speaker column of each VoxCeleb metadata table."""
 
 
 def get_wiki_info(name: str) -> dict:
@@ -14,66 +31,68 @@ def get_wiki_info(name: str) -> dict:
         name (str): Name of the person to search for
 
     Returns:
-        dict: Dictionary containing image_url and description, or None values if not found
+        dict: Dictionary containing image_url, wiki_description and wiki_url, or
+        empty strings if not found
     """
-    try:
-        # Clean the name
-        clean_name = name
-
-        # Get page info
-        page = wptools.page(clean_name)
-        page.get()
-
-        result = {
-            "image_url": None,
-            "wiki_description": None,
-            "url": None,
-        }
-
-        # Get the first image URL if available
-        if hasattr(page, "data") and "image" in page.data:
-            images = page.data["image"]
-            if images and len(images) > 0:
-                # Get the first image that's not an icon or logo
-                for img in images:
-                    if isinstance(img, dict) and "url" in img:
-                        img = img["url"]
-                    if isinstance(img, str) and any(
-                        ext in img.lower() for ext in [".jpg", ".jpeg", ".png"]
-                    ):
-                        result["image_url"] = img
-                        break
-        else:
-            result["image_url"] = ""
-
-        # Get the description
-        if hasattr(page, "data") and "extract" in page.data:
-            description = page.data["extract"][:500]
-            description = description.replace("<p>", "").replace("</p>", "")
-            description = description.replace("<b>", "").replace("</b>", "")
-            description = description.replace("<i>", "").replace("</i>", "")
-            description = description[28:] + "..."
-            result["wiki_description"] = " ".join(description.split())
-        else:
-            result["wiki_description"] = ""
-
-        # Get the Wikipedia URL
-        if hasattr(page, "data") and "url" in page.data:
-            result["wiki_url"] = page.data["url"]
-        else:
-            result["wiki_url"] = ""
-
-        print(
-            f"Processed {clean_name}: {'Found' if result['wiki_description'] else 'No'} description, {'Found' if result['image_url'] else 'No'} image"
-        )
+    return WikiFetcher(workers=1).fetch(name)
+
+
+def convert_metadata(data_dir: str = "./data"):
+    """Convert the metadata CSVs to columnar tables sorted by speaker.
+
+    Each `{name}.csv` of `METADATA_KEYS` found in the directory is written to the
+    table `{name}/`, which `read_metadata` reads instead of the CSV.
 
-        # Add a small delay to avoid hitting rate limits
-        # time.sleep(0.5)
-        return result
+    Args:
+        data_dir (str, optional): Directory of the CSVs. Defaults to "./data".
+    """
+    for name, key in METADATA_KEYS.items():
+        csv_path = Path(data_dir) / f"{name}.csv"
+        if csv_path.exists():
+            write_table(pd.read_csv(csv_path), str(Path(data_dir) / name), key)
 
-    except Exception as e:
-        print(f"Error searching Wikipedia for {name}: {e}")
-        return {"image_url": "", "wiki_description": "", "wiki_url": ""}
+
+def read_metadata(
+    name: str,
+    speakers: list | None = None,
+    columns: list | None = None,
+    first: bool = False,
+    data_dir: str = "./data",
+) -> pd.DataFrame:
+    """Read the rows of some speakers from a VoxCeleb metadata table.
+
+    The columnar table written by `convert_metadata` is read if it exists, which
+    reads only the requested rows and columns. Otherwise the whole CSV is parsed
+    and filtered, with the same result.
+
+    Args:
+        name (str): Name of the table, one of `METADATA_KEYS`, e.g. "dev".
+        speakers (list, optional): Speakers to read the rows of. Defaults to None,
+        all speakers.
+        columns (list, optional): Columns to read besides the speaker column.
+        Defaults to None, all columns.
+        first (bool, optional): Read only the first row of each speaker, e.g. their
+        first video. Defaults to False.
+        data_dir (str, optional): Directory of the tables. Defaults to "./data".
+
+    Returns:
+        pd.DataFrame: Rows sorted by speaker, rows of a speaker in the order of
+        the CSV.
+    """
+    table_path = Path(data_dir) / name
+    if (table_path / "table.json").exists():
+        return read_table(str(table_path), speakers, columns, first)
+
+    key = METADATA_KEYS[name]
+    usecols = None if columns is None else [key] + [c for c in columns if c != key]
+    df = pd.read_csv(table_path.with_suffix(".csv"), usecols=usecols)
+    if usecols is not None:
+        df = df[usecols]
+    if speakers is not None:
+        df = df[df[key].isin(speakers)]
+    if first:
+        df = df.drop_duplicates(subset=[key], keep="first")
+    return df.sort_values(key, kind="stable").reset_index(drop=True)
 
 
 def append_data():
@@ -82,13 +101,13 @@ def append_data():
     if os.path.exists(cache_path):
         og = pd.read_csv(cache_path)
 
-    df_videos = pd.read_csv("./data/celebs_dev.csv")
-
     og = og.drop(columns=["video", "start_time"])
-    df_videos = df_videos.drop(columns=["end_time", "length", "txt_file"])
+    df_videos = read_metadata(
+        "celebs_dev", og["VoxCeleb2_ID"], ["video", "start_time"], first=True
+    )
 
     merged_df = og.merge(
-        df_videos[["speaker", "video", "start_time"]],
+        df_videos,
         left_on="VoxCeleb2_ID",
         right_on="speaker",
         how="left",
@@ -97,43 +116,145 @@ def append_data():
     return ""
 
 
-def get_celeb_data(path_to_known_ids: str):
+def get_celeb_data(path_to_known_ids: str, fetcher: WikiFetcher | None = None):
+    """Return names, videos and Wikipedia information of the speakers of a store.
 
-    cache_path = "./data/celeb_data_with_wiki.csv"
-    if os.path.exists(cache_path):
-        return pd.read_csv(cache_path)
+    The table is cached. Once speakers are added to the store it is built again,
+    fetching Wikipedia information only for names missing from `WIKI_CACHE_PATH`.
 
-    df_with_names = pd.read_csv("./data/vox2_meta.csv")
-    id_list = []
-    dir_path = Path(path_to_known_ids)
-    with open(dir_path / "metadata.json", "r") as f:
-        id_list = list(json.load(f))
+    Args:
+        path_to_known_ids (str): Path of the vector store with the known speakers.
+        fetcher (WikiFetcher, optional): Fetcher of the Wikipedia information.
+        Defaults to None, which fetches concurrently and caches in WIKI_CACHE_PATH.
 
-    df_dev = pd.read_csv("./data/dev.csv")
+    Returns:
+        pd.DataFrame: One row per speaker.
+    """
+    cache_path = "./data/celeb_data_with_wiki.csv"
+    id_list = FAISS.read_labels(path_to_known_ids)
+    if os.path.exists(cache_path):
+        cached = pd.read_csv(cache_path)
+        if set(id_list) <= set(cached["VoxCeleb2_ID"]):
+            return cached
 
-    # Filter out rows based ids in id_list based on the VoxCeleb2_ID column
-    filtered_df = df_with_names[df_with_names["VoxCeleb2_ID"].isin(id_list)]
-    filterd_dev = df_dev[df_dev["speaker"].isin(id_list)]
+    # Read only the names and the first video of the speakers in id_list
+    filtered_df = read_metadata("vox2_meta", id_list, ["Name"])
+    filterd_dev = read_metadata("dev", id_list, ["video", "start_time"], first=True)
 
     merged_df = (
         filtered_df.merge(
-            filterd_dev[["speaker", "video", "start_time"]],
+            filterd_dev,
             left_on="VoxCeleb2_ID",
             right_on="speaker",
             how="left",
         )
         .drop_duplicates(subset=["VoxCeleb2_ID"], keep="first")
-        .drop(columns=["speaker", "Set", "VGGFace2_ID", "Gender"])
+        .drop(columns=["speaker"])
     )
 
     # Add Wikipedia info to the dataframe
-    wiki_info = merged_df["Name"].apply(get_wiki_info)
+    if fetcher is None:
+        fetcher = WikiFetcher(WIKI_CACHE_PATH)
+    wiki_info = fetcher.fetch_all(merged_df["Name"].tolist())
 
-    merged_df["image_url"] = wiki_info.apply(lambda x: x["image_url"])
-    merged_df["wiki_description"] = wiki_info.apply(lambda x: x["wiki_description"])
-    merged_df["wiki_url"] = wiki_info.apply(lambda x: x["wiki_url"])
+    for column in ["image_url", "wiki_description", "wiki_url"]:
+        merged_df[column] = [wiki_info[name][column] for name in merged_df["Name"]]
 
     # Cache the results
     merged_df.to_csv(cache_path, index=False)
 
     return merged_df
+
+
+class SpeakerRecords:
+    """Immutable store of speaker information keyed by `VoxCeleb2_ID`.
+
+    Every record is serialized to JSON once when the store is built, so the records
+    of search results are assembled by looking up and concatenating k strings,
+    without pandas. The store never changes after it is built, so threads share it
+    without locks and forked worker processes share its memory.
+
+    Examples:
+        >>> from kth_sr.loaddata import SpeakerRecords
+        >>> records = SpeakerRecords.from_frame(get_celeb_data(path_to_known_ids))
+        >>> records.json(["id00017", "id00012"])
+        '[{"VoxCeleb2_ID": "id00017", "Name": ...}, {"VoxCeleb2_ID": "id00012", ...}]'
+    """
+
+    def __init__(self, records: list[dict], key: str = "VoxCeleb2_ID"):
+        """Build the store, the first record of a speaker wins.
+
+        Args:
+            records (list[dict]): Speaker records, each with a `key` field.
+            key (str, optional): Field identifying the speaker. Defaults to
+            "VoxCeleb2_ID".
+        """
+        fragments = {}
+        for record in records:
+            # NaN of missing CSV values is not valid JSON
+            record = {
+                field: None if isinstance(value, float) and math.isnan(value) else value
+                for field, value in record.items()
+            }
+            fragments.setdefault(record[key], json.dumps(record))
+        self._fragments = MappingProxyType(fragments)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, key: str = "VoxCeleb2_ID") -> SpeakerRecords:
+        """Build the store from a DataFrame such as the one of `get_celeb_data`.
+
+        Args:
+            df (pd.DataFrame): Speaker information, one row per speaker.
+            key (str, optional): Column identifying the speaker. Defaults to
+            "VoxCeleb2_ID".
+
+        Returns:
+            SpeakerRecords: Store of the rows.
+        """
+        return cls(df.to_dict(orient="records"), key)
+
+    def __len__(self) -> int:
+        return len(self._fragments)
+
+    def __contains__(self, speaker_id) -> bool:
+        return speaker_id in self._fragments
+
+    def json(self, speaker_ids: list) -> str:
+        """Return a JSON array of the records of the speakers in the given order.
+
+        Speakers without a record are left out.
+
+        Args:
+            speaker_ids (list): Speaker ids, e.g. metadata of search results.
+
+        Returns:
+            str: Serialized list of records.
+        """
+        fragments = self._fragments
+        return (
+            "[" + ", ".join(fragments[s] for s in speaker_ids if s in fragments) + "]"
+        )
+
+    def records(self, speaker_ids: list) -> list[dict]:
+        """Return the records of the speakers in the given order.
+
+        Args:
+            speaker_ids (list): Speaker ids, e.g. metadata of search results.
+
+        Returns:
+            list[dict]: New copies of the records, speakers without a record are
+            left out.
+        """
+        return json.loads(self.json(speaker_ids))
+
+
+def get_speaker_records(path_to_known_ids: str) -> SpeakerRecords:
+    """Return the speaker information of `get_celeb_data` as a `SpeakerRecords` store.
+
+    Args:
+        path_to_known_ids (str): Path of the vector store with the known speakers.
+
+    Returns:
+        SpeakerRecords: Store keyed by `VoxCeleb2_ID`.
+    """
+    return SpeakerRecords.from_frame(get_celeb_data(path_to_known_ids))
@@ -0,0 +1,250 @@
+from __future__ import annotations
+
+import bisect
+import contextvars
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable
+
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+"""Upper bounds in seconds of the stage latency histogram buckets."""
+
+
+@dataclass
+class Trace:
+    """Stage timings and counts of one request."""
+
+    stages: dict[str, float] = field(default_factory=dict)
+    """Seconds spent in each stage, summed over repeated stages."""
+    counts: dict[str, float] = field(default_factory=dict)
+    """Counted values, e.g. number of windows."""
+
+    def to_dict(self) -> dict:
+        """Return the trace for a JSON response, timings in milliseconds."""
+        return {
+            "stages_ms": {
+                stage: round(seconds * 1000, 3)
+                for stage, seconds in self.stages.items()
+            },
+            "counts": dict(self.counts),
+        }
+
+
+_trace: contextvars.ContextVar[Trace | None] = contextvars.ContextVar(
+    "trace", default=None
+)
+"""Trace of the current request, None outside of `Metrics.trace`."""
+_deferred: contextvars.ContextVar[bool] = contextvars.ContextVar(
+    "deferred", default=False
+)
+"""Whether measurements go only to the trace, to be recorded by another process."""
+
+
+class _Timer:
+    """Context manager timing a stage, a class to keep the overhead low."""
+
+    __slots__ = ("_metrics", "_stage", "_begin")
+
+    def __init__(self, metrics: Metrics, stage: str):
+        self._metrics = metrics
+        self._stage = stage
+
+    def __enter__(self):
+        self._begin = time.perf_counter()
+
+    def __exit__(self, *args):
+        self._metrics.observe(self._stage, time.perf_counter() - self._begin)
+
+
+class Metrics:
+    """Latency histograms of pipeline stages and counters, in Prometheus format.
+
+    Stages are timed with `timer`, which costs about a microsecond, and every
+    measurement is also added to the trace of the current request, if any.
+
+    Measurements of worker processes do not reach the registry of the server. Stages
+    run there through `traced`, which returns their trace instead, and the server
+    adds it with `record`.
+
+    Examples:
+        >>> from kth_sr.metrics import metrics
+        >>> with metrics.trace() as trace:
+        ...     with metrics.timer("search"):
+        ...         ...
+        ...     metrics.count("windows", 100)
+        >>> trace.counts
+        {'windows': 100}
+        >>> print(metrics.render())
+    """
+
+    _histograms: dict[str, list]
+    """Bucket counts, sum and count of observations of each stage."""
+    _counters: dict[str, float]
+    """Total of each counter."""
+
+    def __init__(self, prefix: str = "kth_sr", buckets: tuple = DEFAULT_BUCKETS):
+        """Create an empty registry.
+
+        Args:
+            prefix (str, optional): Prefix of the metric names. Defaults to "kth_sr".
+            buckets (tuple, optional): Sorted upper bounds of the histogram buckets
+            in seconds. Defaults to DEFAULT_BUCKETS.
+        """
+        self.prefix = prefix
+        self.buckets = tuple(buckets)
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def timer(self, stage: str) -> _Timer:
+        """Return a context manager timing a stage.
+
+        Args:
+            stage (str): Name of the stage.
+        """
+        return _Timer(self, stage)
+
+    def observe(self, stage: str, seconds: float):
+        """Record the time spent in a stage.
+
+        Args:
+            stage (str): Name of the stage.
+            seconds (float): Time spent.
+        """
+        trace = _trace.get()
+        if trace is not None:
+            trace.stages[stage] = trace.stages.get(stage, 0.0) + seconds
+        if _deferred.get():
+            return
+
+        bucket = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = [
+                    [0] * (len(self.buckets) + 1),
+                    0.0,
+                    0,
+                ]
+            histogram[0][bucket] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    def count(self, name: str, value: float = 1):
+        """Increase a counter.
+
+        Args:
+            name (str): Name of the counter, e.g. "windows".
+            value (float, optional): Increment. Defaults to 1.
+        """
+        trace = _trace.get()
+        if trace is not None:
+            trace.counts[name] = trace.counts.get(name, 0) + value
+        if _deferred.get():
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def trace(self) -> _TraceScope:
+        """Return a context manager collecting the measurements of a request.
+
+        Only measurements of the current thread, or of `traced` calls recorded with
+        `record`, are collected.
+        """
+        return _TraceScope()
+
+    def record(self, trace: Trace):
+        """Add the measurements of a trace returned by `traced`.
+
+        Args:
+            trace (Trace): Trace of stages run elsewhere.
+        """
+        for stage, seconds in trace.stages.items():
+            self.observe(stage, seconds)
+        for name, value in trace.counts.items():
+            self.count(name, value)
+
+    def render(self) -> str:
+        """Return the metrics in the Prometheus text exposition format."""
+        with self._lock:
+            histograms = {
+                stage: (list(buckets), total, n)
+                for stage, (buckets, total, n) in self._histograms.items()
+            }
+            counters = dict(self._counters)
+
+        name = f"{self.prefix}_stage_seconds"
+        lines = [
+            f"# HELP {name} Time spent in each stage of the pipeline.",
+            f"# TYPE {name} histogram",
+        ]
+        for stage, (buckets, total, n) in sorted(histograms.items()):
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (float("inf"),), buckets):
+                cumulative += bucket
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {n}')
+
+        for counter, value in sorted(counters.items()):
+            name = f"{self.prefix}_{counter}_total"
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class _TraceScope:
+    """Context manager setting the trace of the current request."""
+
+    def __enter__(self) -> Trace:
+        trace = Trace()
+        self._token = _trace.set(trace)
+        return trace
+
+    def __exit__(self, *args):
+        _trace.reset(self._token)
+
+
+def traced(fn: Callable, *args, **kwargs) -> tuple:
+    """Call fn and return its result with the trace of its measurements.
+
+    Picklable entry point for worker processes, the measurements are not recorded
+    in the registry of the process, pass the trace to `Metrics.record` instead.
+
+    Args:
+        fn (Callable): Function to call.
+        *args: Positional arguments of fn.
+        **kwargs: Keyword arguments of fn.
+
+    Returns:
+        tuple: Tuple of the result of fn and its `Trace`.
+    """
+    context = contextvars.copy_context()
+
+    def run():
+        _deferred.set(True)
+        with _TraceScope() as trace:
+            return fn(*args, **kwargs), trace
+
+    return context.run(run)
+
+
+metrics = Metrics()
+"""Registry of the process."""
@@ -1,10 +1,64 @@
+from __future__ import annotations
+
 import librosa
 import numpy as np
-from deep_speaker.audio import mfcc_fbank, pad_mfcc
+from deep_speaker.audio import mfcc_fbank
+from numpy.lib.stride_tricks import sliding_window_view
+
+from kth_sr.metrics import metrics
+
+FRAME_LENGTH_S = 0.025
+"""Length of one filterbank frame in seconds, as used by `mfcc_fbank`."""
+FRAME_STEP_S = 0.01
+"""Step between filterbank frames in seconds, as used by `mfcc_fbank`."""
+SPEECH_MARGIN_DB = 6.0
+"""Frames this much louder than the noise floor start to count as speech."""
+SPEECH_RANGE_DB = 15.0
+"""Frames this much louder than the margin count as certain speech."""
+
+
+def window_samples(sample_rate: int, num_frames: int, n_windows: int = 1) -> int:
+    """Return number of audio samples covered by consecutive windows of frames.
+
+    Args:
+        sample_rate (int): Sample rate of the audio.
+        num_frames (int): Number of frames in each window.
+        n_windows (int): Number of consecutive windows.
+
+    Returns:
+        int: Number of samples `mfcc_fbank` needs to produce the frames.
+    """
+    frame_length = round(FRAME_LENGTH_S * sample_rate)
+    frame_step = round(FRAME_STEP_S * sample_rate)
+    return (n_windows * num_frames - 1) * frame_step + frame_length
+
+
+def voiced_span(audio: np.ndarray) -> tuple[int, int]:
+    """Return span between the first and the last loud sample of the audio.
+
+    Loud samples are the ones above the 95th percentile of the absolute amplitude.
+
+    Args:
+        audio (np.ndarray): Audio array.
+
+    Returns:
+        tuple: Start and end sample of the span.
+    """
+    energy = np.abs(audio)
+    silence_threshold = np.percentile(energy, 95)
+    loud = energy > silence_threshold
+    # TODO: could use trim_silence() here or a better VAD.
+    start = int(np.argmax(loud))
+    end = len(loud) - 1 - int(np.argmax(loud[::-1]))
+    return start, end
 
 
 def first_k_windows(audio, sample_rate: int, num_frames: int, k: int = 5):
     """Return first k windows of the Mel-filterbank energy features.
+
+    Filterbank frames are computed only for the part of the voiced audio the k windows
+    cover, so long recordings cost the same as short ones.
+
     Args:
         audio (np.ndarray): Audio array.
         sample_rate (int): Sample rate of the audio.
@@ -15,29 +69,255 @@ def first_k_windows(audio, sample_rate: int, num_frames: int, k: int = 5):
         np.ndarray: Array of first k frames prepared for the model.
         Dimensions are (k, num_frames, 64, 1)
     """
+    with metrics.timer("vad"):
+        start, end = voiced_span(audio)
+    # frames are computed independently, so the frames of the truncated audio are
+    # the same as the first frames of the whole voiced audio
+    end = min(end, start + window_samples(sample_rate, num_frames, k))
+    with metrics.timer("fbank"):
+        mfcc = mfcc_fbank(audio[start:end], sample_rate)
+
+    n_full = min(k, len(mfcc) // num_frames)
+    n_filters = mfcc.shape[1]
+    if n_full == k:
+        # view of the frames, no copy
+        return mfcc[: k * num_frames].reshape((k, num_frames, n_filters, 1))
+
+    # the last window is padded with zeros
+    windows = np.zeros((n_full + 1, num_frames, n_filters, 1), dtype=mfcc.dtype)
+    windows[:n_full] = mfcc[: n_full * num_frames].reshape(
+        (n_full, num_frames, n_filters, 1)
+    )
+    windows[n_full, : len(mfcc) - n_full * num_frames, :, 0] = mfcc[
+        n_full * num_frames :
+    ]
+    return windows
+
+
+def first_k_windows_batch(
+    audios: list, sample_rate: int, num_frames: int, k: int = 5
+) -> tuple[np.ndarray, np.ndarray]:
+    """Return first k windows of many clips stacked into one array.
+
+    The result can be embedded with one model call and searched with
+    `FAISS.search_speakers(..., lengths=lengths)`.
+
+    Args:
+        audios (list): List of audio arrays.
+        sample_rate (int): Sample rate of the audio.
+        num_frames (int): Number of frames in each window.
+        k (int): Number of windows per clip.
+
+    Returns:
+        tuple: Tuple of `windows` and `lengths`.
+        - windows (np.ndarray): Windows of all clips, dimensions are
+        (sum(lengths), num_frames, 64, 1).
+        - lengths (np.ndarray): Number of windows of each clip.
+    """
+    clip_windows = [first_k_windows(a, sample_rate, num_frames, k) for a in audios]
+    lengths = np.array([len(w) for w in clip_windows], dtype=np.int64)
+    return np.concatenate(clip_windows), lengths
 
-    energy = np.abs(audio)
-    silence_threshold = np.percentile(energy, 95)
-    offsets = np.where(energy > silence_threshold)[0]
-    # left_blank_duration_ms = (1000.0 * offsets[0]) // self.sample_rate  # frame_id to duration (ms)
-    # right_blank_duration_ms = (1000.0 * (len(audio) - offsets[-1])) // self.sample_rate
-    # TODO: could use trim_silence() here or a better VAD.
-    audio_voice_only = audio[offsets[0] : offsets[-1]]
-    mfcc = mfcc_fbank(audio_voice_only, sample_rate)
 
-    segments = []
-    for i in range(k):
-        start_frame = i * num_frames
-        end_frame = start_frame + num_frames
+def frame_quality(audio: np.ndarray, sample_rate: int) -> np.ndarray:
+    """Score every filterbank frame of the audio for how usable its speech is.
 
-        if end_frame > mfcc.shape[0]:
-            padded = pad_mfcc(mfcc[i * num_frames :], num_frames)
-            segments.append(padded)
+    A frame scores by its energy above the noise floor of the recording, the 10th
+    percentile of the frame energies, from 0 for silence and background noise to 1
+    for frames `SPEECH_MARGIN_DB + SPEECH_RANGE_DB` louder. Frames with clipped
+    samples, runs at the peak amplitude of the recording, are scored down.
+
+    Args:
+        audio (np.ndarray): Audio array.
+        sample_rate (int): Sample rate of the audio.
+
+    Returns:
+        np.ndarray: Score between 0 and 1 of each full frame `mfcc_fbank` computes,
+        it pads a last partial frame.
+    """
+    frame_length = round(FRAME_LENGTH_S * sample_rate)
+    frame_step = round(FRAME_STEP_S * sample_rate)
+    if len(audio) < frame_length:
+        return np.zeros(0, dtype=np.float32)
+    frames = sliding_window_view(np.asarray(audio, dtype=np.float32), frame_length)[
+        ::frame_step
+    ]
+
+    power = np.einsum("ij,ij->i", frames, frames) / frame_length
+    log_energy = 10 * np.log10(power + 1e-10)
+    noise_floor = np.percentile(log_energy, 10)
+    speech = np.clip(
+        (log_energy - noise_floor - SPEECH_MARGIN_DB) / SPEECH_RANGE_DB, 0, 1
+    )
+
+    # a clean recording reaches its peak in a few samples, a clipped one in runs
+    peak = np.abs(audio).max()
+    clipped = (np.abs(frames) >= 0.99 * peak).mean(axis=1) if peak > 0 else 0
+    return (speech * np.clip(1 - 20 * clipped, 0, 1)).astype(np.float32)
+
+
+def best_k_windows(
+    audio: np.ndarray,
+    sample_rate: int,
+    num_frames: int,
+    k: int = 5,
+    hop_frames: int | None = None,
+) -> np.ndarray:
+    """Return the k windows of the Mel-filterbank energy features with the best speech.
+
+    Candidate windows start every `hop_frames` frames of the whole audio and are
+    ranked by the mean `frame_quality` of their frames. The best windows which do
+    not overlap are picked, so fewer windows can be embedded than with
+    `first_k_windows` for the same accuracy. Filterbank frames are computed only for
+    the picked windows.
+
+    Args:
+        audio (np.ndarray): Audio array.
+        sample_rate (int): Sample rate of the audio.
+        num_frames (int): Number of frames in each window.
+        k (int): Maximum number of windows to return.
+        hop_frames (int, optional): Frames between starts of candidate windows.
+        Defaults to None, a quarter of a window.
+
+    Returns:
+        np.ndarray: Picked windows in the order of the audio, dimensions are
+        (min(k, number of non-overlapping windows), num_frames, 64, 1). Audio shorter
+        than a window gives one window padded with zeros, as in `first_k_windows`.
+    """
+    hop_frames = hop_frames or max(num_frames // 4, 1)
+    with metrics.timer("vad"):
+        quality = frame_quality(audio, sample_rate)
+    if len(quality) < num_frames:
+        return first_k_windows(audio, sample_rate, num_frames, 1)
+
+    # mean quality of every candidate window through a cumulative sum
+    totals = np.concatenate(([0.0], np.cumsum(quality, dtype=np.float64)))
+    starts = np.arange(0, len(quality) - num_frames + 1, hop_frames)
+    scores = totals[starts + num_frames] - totals[starts]
+
+    picked = []
+    blocked = np.zeros(len(starts), dtype=bool)
+    # candidates closer than a window overlap
+    overlap = -(-num_frames // hop_frames) - 1
+    for i in np.argsort(-scores, kind="stable"):
+        if blocked[i]:
+            continue
+        picked.append(starts[i])
+        blocked[max(i - overlap, 0) : i + overlap + 1] = True
+        if len(picked) == k:
             break
 
-        segments.append(mfcc[start_frame:end_frame])
+    frame_step = round(FRAME_STEP_S * sample_rate)
+    length = window_samples(sample_rate, num_frames)
+    with metrics.timer("fbank"):
+        windows = [
+            mfcc_fbank(
+                audio[start * frame_step : start * frame_step + length], sample_rate
+            )
+            for start in sorted(picked)
+        ]
+    return np.stack(windows)[..., None]
+
+
+class WindowStream:
+    """Cut windows of filterbank features from audio arriving in chunks.
+
+    Only the samples of windows which are not complete yet are kept, so memory stays
+    bounded regardless of the length of the stream. Unlike `first_k_windows` there is
+    no silence trimming, the windows start at the first sample of the stream. The
+    first frame of windows computed in a later `push` differs slightly from offline
+    features, as pre-emphasis does not see the previous sample.
+
+    Examples:
+        >>> stream = WindowStream(16000, 160)
+        >>> for chunk in chunks:
+        ...     windows, starts = stream.push(chunk)
+    """
+
+    _buffer: np.ndarray
+    """Samples not consumed by complete windows yet."""
+
+    def __init__(
+        self, sample_rate: int, num_frames: int, hop_frames: int | None = None
+    ):
+        """Create the stream.
+
+        Args:
+            sample_rate (int): Sample rate of the audio.
+            num_frames (int): Number of frames in each window.
+            hop_frames (int, optional): Number of frames between starts of consecutive
+            windows. Defaults to None, which makes windows not overlap.
+        """
+        self.sample_rate = sample_rate
+        self.num_frames = num_frames
+        self.hop_frames = hop_frames or num_frames
+        self.offset = 0
+        """Position of the first buffered sample in the stream."""
+        self._buffer = np.empty(0, dtype=np.float32)
+        self._hop_samples = self.hop_frames * round(FRAME_STEP_S * sample_rate)
+        self._covered = 0
+        """End of the last returned window in the stream."""
+
+    def push(self, chunk: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Append audio and return the windows it completes.
+
+        Args:
+            chunk (np.ndarray): Next samples of the stream.
+
+        Returns:
+            tuple: Tuple of `windows` and `starts`.
+            - windows (np.ndarray): Completed windows, dimensions are
+            (n, num_frames, 64, 1).
+            - starts (np.ndarray): Position of the first sample of each window.
+        """
+        self._buffer = np.concatenate((self._buffer, chunk.astype(np.float32)))
+
+        n_windows = 0
+        window_length = window_samples(self.sample_rate, self.num_frames)
+        if len(self._buffer) >= window_length:
+            n_windows = 1 + (len(self._buffer) - window_length) // self._hop_samples
+        if n_windows == 0:
+            return np.empty((0, self.num_frames, 64, 1), np.float32), np.empty(0, int)
+
+        n_frames = (n_windows - 1) * self.hop_frames + self.num_frames
+        mfcc = mfcc_fbank(
+            self._buffer[: window_samples(self.sample_rate, n_frames)],
+            self.sample_rate,
+        )
+        windows = sliding_window_view(mfcc, self.num_frames, axis=0)[:: self.hop_frames]
+        starts = self.offset + np.arange(n_windows) * self._hop_samples
+        self._covered = starts[-1] + window_length
+
+        consumed = n_windows * self._hop_samples
+        self._buffer = self._buffer[consumed:]
+        self.offset += consumed
+
+        # (n, 64, num_frames) view to contiguous (n, num_frames, 64, 1) windows
+        return np.ascontiguousarray(windows.transpose(0, 2, 1)[..., None]), starts
+
+    def flush(self) -> tuple[np.ndarray, np.ndarray]:
+        """End the stream and return its last, partial window.
+
+        The window is padded with zeros as the last window of `first_k_windows`, so
+        a stream shorter than one window still gives a window. It is returned only if
+        it has samples no earlier window covers.
+
+        Returns:
+            tuple: Tuple of `windows` and `starts` as in `push`, with at most one
+            window.
+        """
+        windows = np.zeros((0, self.num_frames, 64, 1), dtype=np.float32)
+        starts = np.empty(0, int)
+        if self.offset + len(self._buffer) > self._covered:
+            mfcc = mfcc_fbank(self._buffer, self.sample_rate)[: self.num_frames]
+            windows = np.zeros((1, self.num_frames, mfcc.shape[1], 1), mfcc.dtype)
+            windows[0, : len(mfcc), :, 0] = mfcc
+            starts = np.array([self.offset])
+            self._covered = self.offset + len(self._buffer)
 
-    return np.array(segments).reshape((-1, 160, 64, 1))
+        self.offset += len(self._buffer)
+        self._buffer = np.empty(0, dtype=np.float32)
+        return windows, starts
 
 
 def first_k_windows_from_file(
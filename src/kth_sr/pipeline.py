@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from kth_sr.audio import decode_audio
+from kth_sr.cache import EmbeddingCache
+from kth_sr.metrics import metrics
+from kth_sr.mfcc import first_k_windows
+
+THREAD_ENV_VARS = [
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "TF_NUM_INTRAOP_THREADS",
+]
+"""Environment variables limiting threads of OpenMP (FAISS), BLAS and TensorFlow."""
+
+
+def limit_threads(threads: int, tf_inter_op_threads: int = 1):
+    """Limit the number of threads compute libraries of this process may start.
+
+    Should be called before TensorFlow is imported, as it reads its limits from the
+    environment when it initializes. FAISS is limited immediately if already imported.
+
+    Args:
+        threads (int): Threads of OpenMP, BLAS and TensorFlow intra-op pools.
+        tf_inter_op_threads (int, optional): Threads running independent TensorFlow
+        operations in parallel. Defaults to 1.
+    """
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+    os.environ["TF_NUM_INTEROP_THREADS"] = str(tf_inter_op_threads)
+
+    if "faiss" in sys.modules:
+        sys.modules["faiss"].omp_set_num_threads(threads)
+
+
+def extract_features(
+    data: bytes,
+    sample_rate: int,
+    num_frames: int,
+    k: int,
+    checkpoint: str,
+) -> tuple[str, np.ndarray]:
+    """Decode an uploaded recording and compute its feature windows.
+
+    Picklable entry point for worker processes of `feature_executor`.
+
+    Args:
+        data (bytes): Encoded audio.
+        sample_rate (int): Sample rate of the features.
+        num_frames (int): Number of frames in each window.
+        k (int): Number of windows.
+        checkpoint (str): Identifier of the model weights, part of the cache key.
+
+    Returns:
+        tuple: Tuple of `EmbeddingCache` key of the audio and its feature windows.
+    """
+    audio = decode_audio(data, sample_rate)
+    metrics.count("audio_seconds", len(audio) / sample_rate)
+    key = EmbeddingCache.key(audio, sample_rate, num_frames, k, checkpoint)
+    return key, first_k_windows(audio, sample_rate, num_frames, k)
+
+
+def feature_executor(workers: int) -> ProcessPoolExecutor:
+    """Create a process pool for decoding and feature extraction.
+
+    Workers are spawned, so they do not inherit TensorFlow state of the parent, and
+    each of them runs single-threaded to not oversubscribe the cores.
+
+    Args:
+        workers (int): Number of worker processes.
+
+    Returns:
+        ProcessPoolExecutor: Pool for `extract_features` and similar CPU-bound work.
+    """
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=limit_threads,
+        initargs=(1,),
+    )
@@ -0,0 +1,246 @@
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+
+def path_signature(path: str) -> tuple:
+    """Return name, size and modification time of every file under a directory.
+
+    A store saved again, or a delta appended to it, changes the signature.
+
+    Args:
+        path (str): Directory of the store.
+
+    Returns:
+        tuple: Sorted tuples of relative path, size and modification time in ns.
+    """
+    dir_path = Path(path)
+    files = []
+    for file in dir_path.rglob("*"):
+        try:
+            stat = file.stat()
+        except FileNotFoundError:
+            # a temporary file renamed by a writer, the next check sees the result
+            continue
+        if file.is_file():
+            files.append(
+                (str(file.relative_to(dir_path)), stat.st_size, stat.st_mtime_ns)
+            )
+    return tuple(sorted(files))
+
+
+class Version:
+    """A loaded version of a store and the number of requests using it."""
+
+    __slots__ = ("number", "path", "value", "signature", "loaded_at", "refs")
+
+    def __init__(self, number: int, path: str, value: Any, signature: tuple):
+        self.number = number
+        self.path = path
+        self.value = value
+        """Loaded store, None once the version is released."""
+        self.signature = signature
+        self.loaded_at = time.time()
+        self.refs = 0
+        """Number of `VersionedStore.acquire` blocks using the version."""
+
+
+class VersionedStore:
+    """Serve a loaded store while newer versions load, then swap them in atomically.
+
+    Requests use the current version inside `acquire`. `reload` loads a store
+    directory in the background and swaps it in only once it is loaded and warmed up,
+    so requests never wait for loading. Requests which acquired the old version
+    finish on it, and the old version is released once the last of them is done.
+
+    Examples:
+        >>> from kth_sr.reload import VersionedStore
+        >>> from kth_sr.vectorstore import FAISS
+        >>> stores = VersionedStore(FAISS.load)
+        >>> stores.load("data/store")  # first version, blocks until loaded
+        >>> stores.watch(interval_s=10)  # reload when the directory changes
+        >>> with stores.acquire() as store:
+        ...     store.search_speakers(embeddings, 5)
+    """
+
+    _current: Version | None
+    """Version used by new requests."""
+    _draining: dict[int, Version]
+    """Replaced versions still used by requests, by number."""
+
+    def __init__(
+        self,
+        load: Callable[[str], Any],
+        release: Callable[[Any], None] | None = None,
+    ):
+        """Create the store without a version.
+
+        Args:
+            load (Callable[[str], Any]): Function loading and warming up the store
+            of a directory, raising if it cannot be loaded.
+            release (Callable[[Any], None], optional): Function called with a
+            replaced store once no request uses it, e.g. to close files. Defaults to
+            None, the store is only dereferenced.
+        """
+        self._load = load
+        self._release = release
+        self._current = None
+        self._draining = {}
+        self._n_versions = 0
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self._stop = threading.Event()
+        self.error: str | None = None
+        """Error of the last failed reload, None after a successful one."""
+
+    @property
+    def current(self) -> Version | None:
+        """Version used by new requests, None until the first one is loaded."""
+        return self._current
+
+    @contextmanager
+    def acquire(self) -> Iterator[Any]:
+        """Use the current store until the block exits, even if a newer one is
+        swapped in meanwhile.
+
+        Raises:
+            ValueError: No version is loaded yet.
+
+        Yields:
+            Any: The store.
+        """
+        with self._lock:
+            version = self._current
+            if version is None:
+                raise ValueError("No version of the store is loaded.")
+            version.refs += 1
+        try:
+            yield version.value
+        finally:
+            with self._lock:
+                version.refs -= 1
+                drained = version is not self._current and version.refs == 0
+                if drained:
+                    self._draining.pop(version.number, None)
+            if drained:
+                self._release_version(version)
+
+    def load(self, path: str) -> Version:
+        """Load the store of a directory and swap it in, blocking until done.
+
+        Args:
+            path (str): Directory of the store.
+
+        Returns:
+            Version: The new current version.
+        """
+        with self._reload_lock:
+            signature = path_signature(path)
+            value = self._load(path)
+            with self._lock:
+                self._n_versions += 1
+                version = Version(self._n_versions, str(path), value, signature)
+                old, self._current = self._current, version
+                drained = old is not None and old.refs == 0
+                if old is not None and not drained:
+                    self._draining[old.number] = old
+            self.error = None
+        if drained:
+            self._release_version(old)
+        return version
+
+    def reload(self, path: str | None = None) -> threading.Thread:
+        """Load a store directory in the background and swap it in when loaded.
+
+        A store which fails to load is not swapped in, the error is kept in `error`.
+
+        Args:
+            path (str, optional): Directory of the new store. Defaults to None, the
+            directory of the current version.
+
+        Raises:
+            ValueError: No path is given and no version is loaded.
+
+        Returns:
+            threading.Thread: Thread loading the store.
+        """
+        if path is None:
+            if self._current is None:
+                raise ValueError("No version of the store is loaded.")
+            path = self._current.path
+
+        def run():
+            try:
+                self.load(path)
+            except Exception as e:
+                self.error = f"{path}: {e}"
+                print(f"Error reloading the store from {path}: {e}")
+
+        thread = threading.Thread(target=run, name="Store reload", daemon=True)
+        thread.start()
+        return thread
+
+    def watch(self, interval_s: float = 10.0):
+        """Reload the store whenever the directory of the current version changes.
+
+        A change is picked up once the directory stays the same for one interval,
+        so a store is not loaded while it is still being written. A store which fails
+        to load is not retried until the directory changes again.
+
+        Args:
+            interval_s (float, optional): Seconds between checks. Defaults to 10.
+        """
+        if self._watcher is not None:
+            return
+        self._stop.clear()
+
+        def run():
+            pending = failed = None
+            while not self._stop.wait(interval_s):
+                version = self._current
+                if version is None or not Path(version.path).exists():
+                    continue
+                signature = path_signature(version.path)
+                if signature in (version.signature, failed):
+                    pending = None
+                elif signature == pending:
+                    self.reload(version.path).join()
+                    if self._current is version:
+                        failed = signature
+                    pending = None
+                else:
+                    pending = signature
+
+        self._watcher = threading.Thread(target=run, name="Store watcher", daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        """Stop watching the directory."""
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
+    def status(self) -> dict:
+        """Return the current and draining versions, e.g. for a status endpoint."""
+        with self._lock:
+            current = self._current
+            draining = sorted(self._draining)
+        return {
+            "version": None if current is None else current.number,
+            "path": None if current is None else current.path,
+            "loaded_at": None if current is None else current.loaded_at,
+            "draining": draining,
+            "error": self.error,
+        }
+
+    def _release_version(self, version: Version):
+        """Release a replaced version no request uses anymore."""
+        value, version.value = version.value, None
+        if self._release is not None:
+            self._release(value)
@@ -0,0 +1,271 @@
+from __future__ import annotations
+
+import multiprocessing
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from kth_sr.pipeline import limit_threads
+from kth_sr.vectorstore import FAISS
+
+_shard: FAISS | None = None
+"""Shard of the worker process."""
+
+
+def _init_shard(threads: int, path: str | None, store_args: tuple, index_params: dict):
+    """Load the shard of a worker process, or create an empty one if path is None."""
+    global _shard
+    limit_threads(threads)
+    if path is None:
+        _shard = FAISS(*store_args, **index_params)
+    else:
+        _shard = FAISS.load(path)
+
+
+def _call_shard(method: str, *args, **kwargs):
+    """Call a method of the shard of the worker process."""
+    return getattr(_shard, method)(*args, **kwargs)
+
+
+def _shard_ready() -> bool:
+    """Return once the worker process created or loaded its shard."""
+    return _shard is not None
+
+
+class ShardedFAISS:
+    """Vector store partitioned by speaker across `FAISS` shards in worker processes.
+
+    Vectors of a speaker (metadata value) always go to the same shard, chosen by a
+    hash of the speaker. Searches are sent to all shards in parallel and their top-k
+    results merged into the global top-k, so the store scales beyond the memory and
+    cores available to one index.
+
+    Examples:
+        >>> from kth_sr.sharding import ShardedFAISS
+        >>> with ShardedFAISS(4, dimension=512) as vstore:
+        ...     vstore.add(vectors, speakers)
+        ...     distances, metadata = vstore.search(queries, 5)
+    """
+
+    _shards: list[ProcessPoolExecutor]
+    """Single-process executor holding each shard."""
+
+    def __init__(
+        self,
+        n_shards: int,
+        dimension: int = 512,
+        index_type: str = "flat",
+        threads_per_shard: int | None = None,
+        **index_params,
+    ):
+        """Start the shard processes with empty stores.
+
+        Args:
+            n_shards (int): Number of shards.
+            dimension (int, optional): Dimension of the vectors. Defaults to 512.
+            index_type (str, optional): Type of the index of each shard, see `FAISS`.
+            Defaults to "flat".
+            threads_per_shard (int, optional): Threads of FAISS in each shard process.
+            Defaults to None, the cores divided by the number of shards.
+            **index_params: Parameters of the index of each shard, see `FAISS`.
+
+        Raises:
+            ValueError: Number of shards is not positive.
+        """
+        if n_shards <= 0:
+            raise ValueError("Number of shards should be positive.")
+        self._shards = self._start_shards(
+            [None] * n_shards, threads_per_shard, (dimension, index_type), index_params
+        )
+
+    @staticmethod
+    def _start_shards(
+        paths: list,
+        threads_per_shard: int | None,
+        store_args: tuple = (),
+        index_params: dict | None = None,
+    ) -> list[ProcessPoolExecutor]:
+        """Start a process for each shard, loading it from its path if not None."""
+        if threads_per_shard is None:
+            threads_per_shard = max((os.cpu_count() or 1) // len(paths), 1)
+
+        context = multiprocessing.get_context("spawn")
+        shards = [
+            ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=context,
+                initializer=_init_shard,
+                initargs=(threads_per_shard, path, store_args, index_params or {}),
+            )
+            for path in paths
+        ]
+        # processes start on the first task, wait until all shards are ready
+        for future in [shard.submit(_shard_ready) for shard in shards]:
+            future.result()
+        return shards
+
+    @property
+    def n_shards(self) -> int:
+        """Number of shards."""
+        return len(self._shards)
+
+    def shard_of(self, speaker) -> int:
+        """Return the shard holding vectors of the speaker.
+
+        Args:
+            speaker: Metadata value.
+
+        Returns:
+            int: Index of the shard.
+        """
+        return zlib.crc32(str(speaker).encode()) % self.n_shards
+
+    def train(self, vectors: list):
+        """Train the index of every shard on the same sample of vectors.
+
+        Args:
+            vectors (list): Training vectors.
+        """
+        self._call_all("train", np.asarray(vectors, dtype=np.float32))
+
+    def add(self, vectors: list, metadata: list | None = None):
+        """Add vectors to the shards of their speakers.
+
+        Args:
+            vectors (list): List of vectors to be added.
+            metadata (list, optional): List of metadata for the vectors. Defaults to
+            None, which puts all vectors to one shard.
+
+        Raises:
+            ValueError: Length of metadata should be same as length of vectors.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if metadata is None:
+            metadata = [None] * len(vectors)
+        if len(vectors) != len(metadata):
+            raise ValueError("Length of metadata should be same as length of vectors.")
+
+        shard_of = {speaker: self.shard_of(speaker) for speaker in set(metadata)}
+        shards = np.fromiter(
+            (shard_of[m] for m in metadata), dtype=np.int64, count=len(metadata)
+        )
+        futures = []
+        for i in np.unique(shards):
+            rows = np.flatnonzero(shards == i)
+            futures.append(
+                self._shards[i].submit(
+                    _call_shard, "add", vectors[rows], [metadata[j] for j in rows]
+                )
+            )
+        for future in futures:
+            future.result()
+
+    def build(self, vectors: list, metadata: list | None = None):
+        """Train the shards on the vectors and add them.
+
+        Args:
+            vectors (list): List of vectors to be added.
+            metadata (list, optional): List of metadata for the vectors. Defaults to None.
+        """
+        self.train(vectors)
+        self.add(vectors, metadata)
+
+    def remove(self, speaker) -> int:
+        """Remove all vectors of a speaker, see `FAISS.remove`."""
+        return self._call(self.shard_of(speaker), "remove", speaker)
+
+    def upsert(self, speaker, vectors: list):
+        """Replace all vectors of a speaker, see `FAISS.upsert`."""
+        self._call(self.shard_of(speaker), "upsert", speaker, vectors)
+
+    def set_search_params(self, **search_params):
+        """Set search-time parameters of every shard, see `FAISS.set_search_params`."""
+        self._call_all("set_search_params", **search_params)
+
+    def search(
+        self, embeddings: list, k: int, threshold: float | None = None
+    ) -> tuple[list[np.ndarray], list]:
+        """Search all shards for the k nearest vectors to the given embeddings.
+
+        Args:
+            embeddings (list): List of embeddings to search for.
+            k (int): Number of nearest vectors to return.
+            threshold (float, optional): Threshold distance to filter the search
+            results. Defaults to None.
+
+        Returns:
+            tuple: Tuple of `distances` and `metadata`, the same as `FAISS.search`.
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        results = self._call_all("search_padded", embeddings, k)
+
+        # merge the top-k of the shards into the global top-k
+        distances = np.concatenate([d for d, _ in results], axis=1)
+        metadata = np.concatenate([m for _, m in results], axis=1)
+        order = np.argsort(distances, axis=1, kind="stable")[:, :k]
+        distances = np.take_along_axis(distances, order, axis=1)
+        metadata = np.take_along_axis(metadata, order, axis=1)
+
+        mask = np.isfinite(distances)
+        if threshold is not None:
+            mask &= distances <= threshold
+        if mask.all():
+            return list(distances), metadata.tolist()
+        return FAISS._split_rows(distances, metadata, mask)
+
+    def save(self, path: str):
+        """Save every shard to a subdirectory `shard_{i}` of the path.
+
+        Args:
+            path (str): Path to save the store.
+        """
+        futures = [
+            shard.submit(_call_shard, "save", str(Path(path) / f"shard_{i}"))
+            for i, shard in enumerate(self._shards)
+        ]
+        for future in futures:
+            future.result()
+
+    @classmethod
+    def load(cls, path: str, threads_per_shard: int | None = None) -> ShardedFAISS:
+        """Load a sharded store, each shard in its own process.
+
+        Args:
+            path (str): Path of the saved store.
+            threads_per_shard (int, optional): Threads of FAISS in each shard process.
+            Defaults to None, the cores divided by the number of shards.
+
+        Returns:
+            ShardedFAISS: Sharded vector store.
+        """
+        paths = sorted(
+            Path(path).glob("shard_*"), key=lambda p: int(p.name.split("_")[1])
+        )
+        vstore = cls.__new__(cls)
+        vstore._shards = cls._start_shards([str(p) for p in paths], threads_per_shard)
+        return vstore
+
+    def close(self):
+        """Stop the shard processes."""
+        for shard in self._shards:
+            shard.shutdown()
+
+    def __enter__(self) -> ShardedFAISS:
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _call(self, i: int, method: str, *args, **kwargs):
+        """Call a method of one shard and wait for the result."""
+        return self._shards[i].submit(_call_shard, method, *args, **kwargs).result()
+
+    def _call_all(self, method: str, *args, **kwargs) -> list:
+        """Call a method of all shards in parallel and return their results."""
+        futures = [
+            shard.submit(_call_shard, method, *args, **kwargs) for shard in self._shards
+        ]
+        return [future.result() for future in futures]
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Callable
+
+
+class Startup:
+    """Load the heavy resources of a service in the background and track readiness.
+
+    Steps run in registration order on a background thread, so the service can
+    accept connections, answer health checks and report progress while models and
+    indexes load. The time spent in each step is recorded.
+
+    Examples:
+        >>> from kth_sr.startup import Startup
+        >>> startup = Startup()
+        >>> @startup.step("model")
+        ... def load_model():
+        ...     ...
+        >>> startup.start()
+        >>> startup.wait(timeout=60)
+        True
+    """
+
+    _steps: list[tuple[str, Callable[[], None]]]
+    """Registered steps, tuples of name and function."""
+    _ready: threading.Event
+    """Set once all steps finished or one of them failed."""
+    _thread: threading.Thread | None
+    """Thread running the steps, None until `start` is called."""
+
+    def __init__(self):
+        self.state = "created"
+        """One of "created", "loading", "ready" and "failed"."""
+        self.error: str | None = None
+        """Error of the failed step."""
+        self.timings: dict[str, float] = {}
+        """Seconds spent in each finished step."""
+        self.time_to_ready: float | None = None
+        """Seconds from creation until all steps finished."""
+
+        self._created = time.monotonic()
+        self._steps = []
+        self._ready = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def step(self, name: str) -> Callable:
+        """Register a loading step, to be used as a decorator.
+
+        Args:
+            name (str): Name of the step in `timings`.
+
+        Raises:
+            ValueError: If the startup is already running.
+
+        Returns:
+            Callable: Decorator registering the function and returning it unchanged.
+        """
+
+        def register(fn: Callable[[], None]) -> Callable[[], None]:
+            if self._thread is not None:
+                raise ValueError("Cannot add steps after the startup was started.")
+            self._steps.append((name, fn))
+            return fn
+
+        return register
+
+    def start(self):
+        """Run the steps in the background, calling it again has no effect."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.state = "loading"
+            self._thread = threading.Thread(
+                target=self._run, name="Startup", daemon=True
+            )
+            self._thread.start()
+
+    @property
+    def ready(self) -> bool:
+        """Whether all steps finished successfully."""
+        return self.state == "ready"
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Block until the steps finish.
+
+        Args:
+            timeout (float, optional): Seconds to wait. Defaults to None, no limit.
+
+        Returns:
+            bool: Whether the service is ready.
+        """
+        self._ready.wait(timeout)
+        return self.ready
+
+    def status(self) -> dict:
+        """Return the state, error and timings, e.g. for a readiness endpoint."""
+        return {
+            "state": self.state,
+            "error": self.error,
+            "timings": dict(self.timings),
+            "time_to_ready": self.time_to_ready,
+        }
+
+    def _run(self):
+        """Run the steps in order, stopping at the first failure."""
+        try:
+            for name, fn in self._steps:
+                begin = time.monotonic()
+                fn()
+                self.timings[name] = time.monotonic() - begin
+        except Exception as e:
+            self.error = f"{name}: {e}"
+            self.state = "failed"
+        else:
+            self.time_to_ready = time.monotonic() - self._created
+            self.state = "ready"
+        finally:
+            self._ready.set()
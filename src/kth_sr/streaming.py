@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+from typing import Callable
+
+import numpy as np
+
+from kth_sr.mfcc import WindowStream
+from kth_sr.vectorstore import FAISS
+
+
+class StreamingIdentifier:
+    """Rank speakers incrementally while audio of one recording arrives.
+
+    Each `feed` embeds only the windows completed by the new audio and adds their
+    distances to the per-speaker sums, so the ranking is always up to date with the
+    audio received so far. The identification is `done` once the same speaker leads by
+    at least `min_margin` for `patience` consecutive updates or `max_windows` windows
+    have been embedded, after which further audio is ignored.
+
+    Examples:
+        >>> identifier = StreamingIdentifier(predictor.predict, storage, 16000, 160)
+        >>> for chunk in chunks:
+        ...     scores, speakers = identifier.feed(chunk)
+        ...     if identifier.done:
+        ...         break
+        >>> scores, speakers = identifier.finish()
+    """
+
+    _predict: Callable[[np.ndarray], np.ndarray]
+    """Function embedding feature windows."""
+    _storage: FAISS
+    """Vector store with the enrolled speakers."""
+    _windows: WindowStream
+    """Source of feature windows."""
+    _distance_sums: np.ndarray | None
+    """Sum of distances of all embedded windows to each speaker."""
+
+    def __init__(
+        self,
+        predict: Callable[[np.ndarray], np.ndarray],
+        storage: FAISS,
+        sample_rate: int,
+        num_frames: int,
+        k: int = 6,
+        max_windows: int = 100,
+        patience: int = 3,
+        min_margin: float = 0.05,
+        min_amplitude: float = 0.01,
+    ):
+        """Create the identifier for one recording.
+
+        Args:
+            predict (Callable[[np.ndarray], np.ndarray]): Function embedding feature
+            windows, e.g. `BatchedPredictor.predict`.
+            storage (FAISS): Vector store with the enrolled speakers.
+            sample_rate (int): Sample rate of the audio.
+            num_frames (int): Number of frames in each window.
+            k (int, optional): Number of speakers in the ranking. Defaults to 6.
+            max_windows (int, optional): Stop after this many windows. Defaults to 100.
+            patience (int, optional): Number of consecutive updates the leading
+            speaker has to keep the lead. Defaults to 3.
+            min_margin (float, optional): Minimal difference of mean distances of the
+            first and the second speaker. Defaults to 0.05.
+            min_amplitude (float, optional): Leading audio quieter than this is
+            considered silence and skipped. Defaults to 0.01.
+        """
+        self._predict = predict
+        self._storage = storage
+        self._windows = WindowStream(sample_rate, num_frames)
+        self.k = k
+        self.max_windows = max_windows
+        self.patience = patience
+        self.min_margin = min_margin
+        self.min_amplitude = min_amplitude
+
+        self.n_windows = 0
+        """Number of embedded windows."""
+        self.done = False
+        """Whether the ranking is final."""
+        self._started = False
+        self._distance_sums = None
+        self._n_scored = 0
+        self._speakers = []
+        self._leader = None
+        self._stable_updates = 0
+        self._ranking = ([], [])
+
+    @property
+    def ranking(self) -> tuple[np.ndarray, list]:
+        """Current ranking, tuple of mean distances and speakers."""
+        return self._ranking
+
+    def feed(self, chunk: np.ndarray) -> tuple[np.ndarray, list]:
+        """Process the next chunk of audio.
+
+        Args:
+            chunk (np.ndarray): Next samples of the recording.
+
+        Returns:
+            tuple: Tuple of `scores` and `speakers`, the current ranking.
+            - scores (np.ndarray): Mean distances of the k best speakers.
+            - speakers (list): The k best speakers ordered from the best match.
+        """
+        if self.done:
+            return self._ranking
+
+        chunk = np.asarray(chunk, dtype=np.float32)
+        if not self._started:
+            # skip the silence before the speaker starts talking
+            loud = np.abs(chunk) > self.min_amplitude
+            if not loud.any():
+                return self._ranking
+            chunk = chunk[np.argmax(loud) :]
+            self._started = True
+
+        windows, _ = self._windows.push(chunk)
+        self._embed(windows)
+        return self._ranking
+
+    def finish(self) -> tuple[np.ndarray, list]:
+        """End the recording and embed its last, partial window.
+
+        The window is padded with zeros as by `first_k_windows`, so a recording
+        shorter than one window is ranked too.
+
+        Returns:
+            tuple: Tuple of `scores` and `speakers`, the final ranking.
+        """
+        if not self.done and self._started:
+            windows, _ = self._windows.flush()
+            self._embed(windows)
+        self.done = True
+        return self._ranking
+
+    def _embed(self, windows: np.ndarray):
+        """Embed and score new windows, up to `max_windows` in total."""
+        windows = windows[: self.max_windows - self.n_windows]
+        if len(windows) > 0:
+            self.n_windows += len(windows)
+            self._update(self._predict(windows))
+
+        if self.n_windows >= self.max_windows:
+            self.done = True
+
+    def _update(self, embeddings: np.ndarray):
+        """Add distances of new windows to the scores and check the stopping rule."""
+        distances, self._speakers = self._storage.speaker_distances(embeddings)
+        if not self._speakers:
+            # nothing enrolled, more audio can not change the empty ranking
+            self._ranking = (np.empty(0), [])
+            self.done = True
+            return
+        if self._distance_sums is None:
+            self._distance_sums = np.zeros(distances.shape[1])
+        self._distance_sums += distances.sum(axis=0)
+        self._n_scored += len(distances)
+
+        mean_distances = self._distance_sums / self._n_scored
+        order = np.argsort(mean_distances, kind="stable")[: max(self.k, 2)]
+        self._ranking = (
+            mean_distances[order[: self.k]],
+            [self._speakers[i] for i in order[: self.k]],
+        )
+
+        margin = np.inf
+        if len(order) > 1:
+            margin = mean_distances[order[1]] - mean_distances[order[0]]
+        if order[0] == self._leader and margin >= self.min_margin:
+            self._stable_updates += 1
+        else:
+            self._leader = order[0]
+            self._stable_updates = 1 if margin >= self.min_margin else 0
+        if self._stable_updates >= self.patience:
+            self.done = True
@@ -0,0 +1,239 @@
+"""Label who speaks when in long recordings, such as podcasts and interviews.
+
+`speaker_timeline` consumes audio in chunks and cuts overlapping windows with
+`WindowStream`. It embeds the windows of each chunk in fixed-size batches and scores
+them against the speakers of the store in one batched search per chunk. Distances
+are smoothed over neighbouring windows and consecutive windows of the same speaker
+are merged into segments, which are yielded as soon as the next speaker starts.
+Only the windows of the current chunk and the few needed for smoothing are kept, so
+memory does not grow with the length of the recording.
+
+Run:
+    python -m kth_sr.timeline podcast.mp3 data/filtered_celebs_data/celebs_200_9_clips
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from typing import Callable, Iterable, Iterator, NamedTuple
+
+import numpy as np
+
+from kth_sr.mfcc import WindowStream, window_samples
+from kth_sr.vectorstore import FAISS
+
+
+class Segment(NamedTuple):
+    """Part of a recording attributed to one speaker."""
+
+    start: float
+    """Start in seconds."""
+    end: float
+    """End in seconds."""
+    speaker: str | None
+    """Speaker, None if no enrolled speaker is close enough."""
+    score: float
+    """Mean smoothed distance of the windows of the segment to the speaker."""
+
+
+def speaker_timeline(
+    chunks: Iterable[np.ndarray],
+    predict: Callable[[np.ndarray], np.ndarray],
+    storage: FAISS,
+    sample_rate: int,
+    num_frames: int,
+    hop_frames: int | None = None,
+    batch_size: int = 64,
+    smoothing: int = 5,
+    threshold: float | None = None,
+) -> Iterator[Segment]:
+    """Yield who speaks when in a recording arriving in chunks.
+
+    Each window labels the audio until the start of the next window, the last window
+    its whole length, so the segments cover the recording without gaps.
+
+    Args:
+        chunks (Iterable[np.ndarray]): Consecutive chunks of the recording, e.g. from
+        `kth_sr.audio.stream_audio`.
+        predict (Callable[[np.ndarray], np.ndarray]): Function embedding feature
+        windows, e.g. `compile_inference(model)`.
+        storage (FAISS): Vector store with the enrolled speakers.
+        sample_rate (int): Sample rate of the audio.
+        num_frames (int): Number of frames in each window.
+        hop_frames (int, optional): Frames between starts of consecutive windows.
+        Defaults to None, half a window.
+        batch_size (int, optional): Number of windows per model call. Defaults to 64.
+        smoothing (int, optional): Number of neighbouring windows whose distances
+        are averaged before picking the speaker of a window, odd numbers centre
+        the average on the window. Defaults to 5, 1 disables smoothing.
+        threshold (float, optional): Windows whose best smoothed distance is above
+        the threshold are attributed to no speaker. Defaults to None, every window
+        gets the closest speaker.
+
+    Raises:
+        ValueError: If smoothing is not positive.
+
+    Yields:
+        Segment: Segments in the order of the recording, consecutive segments have
+        different speakers.
+    """
+    if smoothing < 1:
+        raise ValueError("Smoothing should be a positive number of windows.")
+
+    stream = WindowStream(sample_rate, num_frames, hop_frames or num_frames // 2)
+    labels = _window_labels(
+        chunks, stream, predict, storage, batch_size, smoothing, threshold
+    )
+    return _merge_windows(labels, window_samples(sample_rate, num_frames) / sample_rate)
+
+
+def _window_labels(
+    chunks: Iterable[np.ndarray],
+    stream: WindowStream,
+    predict: Callable[[np.ndarray], np.ndarray],
+    storage: FAISS,
+    batch_size: int,
+    smoothing: int,
+    threshold: float | None,
+) -> Iterator[tuple[float, str | None, float]]:
+    """Yield start in seconds, speaker and smoothed distance of every window."""
+    before, after = (smoothing - 1) // 2, smoothing // 2
+    # distances of the last labelled windows, kept as context for smoothing, followed
+    # by those of the windows waiting for the windows after them
+    rows = np.empty((0, 0), dtype=np.float32)
+    n_context = 0
+    starts = np.empty(0)
+    speakers = []
+
+    def label(n: int) -> Iterator[tuple[float, str | None, float]]:
+        """Label the first n waiting windows."""
+        if len(speakers) == 0:
+            # nothing enrolled, no speaker is close to any window
+            for start in starts[:n]:
+                yield float(start), None, np.inf
+            return
+        sums = np.concatenate(
+            (np.zeros((1, rows.shape[1])), np.cumsum(rows, axis=0, dtype=np.float64))
+        )
+        index = n_context + np.arange(n)
+        lo = np.maximum(index - before, 0)
+        hi = np.minimum(index + after + 1, len(rows))
+        smoothed = (sums[hi] - sums[lo]) / (hi - lo)[:, None]
+        best = smoothed.argmin(axis=1)
+        scores = smoothed[np.arange(n), best]
+        for start, i, score in zip(starts[:n], best, scores):
+            rejected = threshold is not None and score > threshold
+            yield float(start), None if rejected else speakers[i], float(score)
+
+    for chunk in chunks:
+        windows, window_starts = stream.push(np.asarray(chunk, dtype=np.float32))
+        if len(windows) == 0:
+            continue
+        embeddings = np.concatenate(
+            [
+                np.asarray(predict(windows[i : i + batch_size]), dtype=np.float32)
+                for i in range(0, len(windows), batch_size)
+            ]
+        )
+        # one search of all windows of the chunk
+        distances, speakers = storage.speaker_distances(embeddings)
+
+        rows = distances if len(rows) == 0 else np.concatenate((rows, distances))
+        starts = np.concatenate((starts, window_starts / stream.sample_rate))
+        # windows followed by enough windows to be smoothed
+        n_ready = max(len(starts) - after, 0)
+        if n_ready:
+            yield from label(n_ready)
+            starts = starts[n_ready:]
+            n_context = min(n_context + n_ready, before)
+            rows = rows[len(rows) - len(starts) - n_context :]
+
+    if len(starts):
+        yield from label(len(starts))
+
+
+def _merge_windows(
+    labels: Iterator[tuple[float, str | None, float]], window_s: float
+) -> Iterator[Segment]:
+    """Merge consecutive windows of the same speaker into segments."""
+    segment = None
+    last_start = 0.0
+    n_windows = 0
+    for start, speaker, score in labels:
+        last_start = start
+        if segment is not None and segment.speaker == speaker:
+            segment = segment._replace(score=segment.score + score)
+            n_windows += 1
+            continue
+        if segment is not None:
+            # a segment ends where the first window of the next speaker starts
+            yield segment._replace(end=start, score=segment.score / n_windows)
+        segment = Segment(start, start, speaker, score)
+        n_windows = 1
+
+    if segment is not None:
+        # the last window labels its whole length
+        end = last_start + window_s
+        yield segment._replace(end=end, score=segment.score / n_windows)
+
+
+def main():
+    from kth_sr.audio import stream_audio
+    from kth_sr.embeddings import compile_inference, get_embedding_model
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("recording", help="audio file, any format ffmpeg decodes")
+    parser.add_argument("store", help="directory of the store of the speakers")
+    parser.add_argument("--chunk-s", type=float, default=10.0)
+    parser.add_argument("--hop-frames", type=int, help="defaults to half a window")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--smoothing", type=int, default=5, help="windows")
+    parser.add_argument("--threshold", type=float, help="maximal distance")
+    parser.add_argument("--checkpoint", help="weights of the embedding model")
+    parser.add_argument("--sample-rate", type=int, default=16000)
+    parser.add_argument("--num-frames", type=int, default=160)
+    args = parser.parse_args()
+
+    model = (
+        get_embedding_model(args.checkpoint)
+        if args.checkpoint
+        else get_embedding_model()
+    )
+    predict = compile_inference(model, args.num_frames)
+    storage = FAISS.load(args.store)
+
+    n_samples = 0
+
+    def chunks():
+        nonlocal n_samples
+        for chunk in stream_audio(args.recording, args.sample_rate, args.chunk_s):
+            n_samples += len(chunk)
+            yield chunk
+
+    begin = time.perf_counter()
+    for segment in speaker_timeline(
+        chunks(),
+        predict,
+        storage,
+        args.sample_rate,
+        args.num_frames,
+        hop_frames=args.hop_frames,
+        batch_size=args.batch_size,
+        smoothing=args.smoothing,
+        threshold=args.threshold,
+    ):
+        print(
+            f"{segment.start:9.2f} {segment.end:9.2f} "
+            f"{segment.speaker or '-':<12} {segment.score:.3f}"
+        )
+    elapsed = time.perf_counter() - begin
+    audio_s = n_samples / args.sample_rate
+    print(
+        f"{audio_s:.1f} s of audio in {elapsed:.1f} s, "
+        f"real-time factor {elapsed / max(audio_s, 1e-9):.3f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -3,16 +3,19 @@ from pathlib import Path
 import pandas as pd
 
 
-def get_df_by_downloaded_folder(folder: str) -> pd.DataFrame:
+def get_df_by_downloaded_folder(folder: str, pattern: str = "*.mp3") -> pd.DataFrame:
     """Create a DataFrame from folder with downloaded mp3 files.
 
+    Files are named `{speaker}_{sample_number}_{duration_ms}`.
+
     Args:
         folder (str): path to folder with downloaded mp3 files.
+        pattern (str, optional): glob pattern of the files. Defaults to "*.mp3".
     """
     # iterate all files in the folder and get their length
     data = []
 
-    for file in Path(folder).rglob("*.mp3"):
+    for file in Path(folder).rglob(pattern):
         file_name = file.name
         user_id = file.stem.split("_")[0]  # user_id in voxceleb2
         sample_number = int(file.stem.split("_")[1])
@@ -26,6 +29,7 @@ def get_df_by_downloaded_folder(folder: str) -> pd.DataFrame:
                 "sample_number": sample_number,
                 "duration_s": duration_s,
                 "file_name": file_name,
+                "path": str(file),
             }
         )
 
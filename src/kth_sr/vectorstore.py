@@ -1,6 +1,8 @@
 from __future__ import annotations
 
 import json
+import os
+import threading
 from pathlib import Path
 
 import faiss
@@ -8,18 +10,149 @@ import numpy as np
 
 
 class FAISS:
-    """Vector store using FAISS library."""
+    """Vector store using FAISS library.
 
-    _vstore: faiss.IndexFlatL2
-    """Vector store using FAISS library."""
-    _metadata: list
-    """Metadata for the vectors stored"""
+    Every vector gets a stable id when added, ids are never reused, so they remain
+    valid after other vectors are removed. Removed vectors are only marked as removed
+    and skipped by searches, until enough of them accumulate to purge them from the
+    index at once. Changes since the last save can be saved as an append-only delta
+    segment. Updating a speaker thus costs time proportional to the speaker instead
+    of the whole store.
+    """
 
-    def __init__(self, dimension=512):
-        self._vstore = faiss.IndexFlatL2(dimension)
-        self._metadata = []
+    _vstore: faiss.Index
+    """Vector store using FAISS library. IVF indexes keep the vector ids in their
+    inverted lists, other indexes are wrapped in `faiss.IndexIDMap`."""
+    _index_type: str
+    """Type of the FAISS index, one of `INDEX_TYPES`."""
+    _index_params: dict
+    """Parameters used to build the index, e.g. `nlist` for IVF indexes."""
+    _search_params: dict
+    """Search-time parameters, `nprobe` for IVF and `ef_search` for HNSW indexes."""
+    _labels: np.ndarray
+    """Table of distinct metadata values (labels), indexed by label id."""
+    _label_ids: dict
+    """Mapping from a label to its id in `_labels`."""
+    _codes: np.ndarray
+    """Label id of the vector with each id, i.e. the metadata of the vectors stored,
+    -1 for removed vectors."""
+    _read_only: bool
+    """Whether the index is memory-mapped and cannot be modified."""
+    _speaker_vstore: faiss.IndexFlatL2 | None
+    """Index of per-speaker centroids. Built lazily from the stored vectors."""
+    _speaker_labels: list
+    """Speaker label (metadata) of each centroid in `_speaker_vstore`."""
+    _dead: list
+    """Arrays of ids of removed vectors which are still in the index."""
+    _dead_selector: tuple | None
+    """FAISS selector of the vectors not in `_dead`, with the selectors it wraps,
+    built lazily for searches and reset when `_dead` changes."""
+    _added: list
+    """Tuples of ids, vectors and labels added since the last save."""
+    _removed: list
+    """Arrays of ids removed since the last save."""
+    _delta_seq: int
+    """Sequence number of the last delta segment saved, 0 if none."""
+    _saved_path: Path | None
+    """Directory the store was last saved to or loaded from."""
+    _compaction: threading.Thread | None
+    """Thread of the last background compaction."""
 
-    def add(self, vectors: list, metadata: list | None = None):
+    AGGREGATIONS = ("mean", "vote")
+    """Supported ways of combining query windows in `search_speakers`."""
+
+    INDEX_TYPES = {
+        "flat": "Flat",
+        "ivf_flat": "IVF{nlist},Flat",
+        "ivf_pq": "IVF{nlist},PQ{pq_m}x{pq_bits}",
+        "hnsw": "HNSW{hnsw_m}",
+        "sq_fp16": "SQfp16",
+        "sq8": "SQ8",
+    }
+    """FAISS index factory strings of the supported index types."""
+
+    DEFAULT_INDEX_PARAMS = {"nlist": 1024, "pq_m": 64, "pq_bits": 8, "hnsw_m": 32}
+    """Default parameters of the index factory strings."""
+
+    MAX_DELTAS = 16
+    """Number of delta segments at which `save` compacts them in the background."""
+
+    MAX_DEAD_RATIO = 0.01
+    """Share of removed vectors kept in the index before they are purged from it."""
+
+    def __init__(self, dimension=512, index_type: str = "flat", **index_params):
+        """Create an empty vector store.
+
+        Args:
+            dimension (int, optional): Dimension of the vectors. Defaults to 512.
+            index_type (str, optional): Type of the index, one of `INDEX_TYPES`.
+            `"flat"` is an exact brute-force search, the other types are approximate
+            and `"ivf_flat"`, `"ivf_pq"` and `"sq8"` need to be trained before adding
+            vectors. Defaults to "flat".
+            **index_params: Overrides of `DEFAULT_INDEX_PARAMS`.
+
+        Raises:
+            ValueError: Unknown index type or index parameter.
+        """
+        if index_type not in self.INDEX_TYPES:
+            raise ValueError(
+                f"Unknown index type {index_type}, use one of {list(self.INDEX_TYPES)}."
+            )
+        unknown_params = set(index_params) - set(self.DEFAULT_INDEX_PARAMS)
+        if unknown_params:
+            raise ValueError(f"Unknown index parameters {sorted(unknown_params)}.")
+
+        self._index_type = index_type
+        self._index_params = {**self.DEFAULT_INDEX_PARAMS, **index_params}
+        self._search_params = {}
+
+        if index_type == "flat":
+            index = faiss.IndexFlatL2(dimension)
+        else:
+            factory_string = self.INDEX_TYPES[index_type].format(**self._index_params)
+            index = faiss.index_factory(dimension, factory_string)
+        self._vstore = self._with_ids(index)
+
+        self._labels = np.empty(0, dtype=object)
+        self._label_ids = {}
+        self._codes = np.empty(0, dtype=np.int32)
+        self._read_only = False
+        self._speaker_vstore = None
+        self._speaker_labels = []
+        self._dead = []
+        self._dead_selector = None
+        self._added = []
+        self._removed = []
+        self._delta_seq = 0
+        self._saved_path = None
+        self._compaction = None
+
+    def _with_ids(self, index: faiss.Index) -> faiss.Index:
+        """Make the index store vector ids, vectors already in it get their positions.
+
+        Args:
+            index (faiss.Index): Index created by `__init__` or read from a file.
+
+        Returns:
+            faiss.Index: Index supporting `add_with_ids` and `remove_ids`.
+        """
+        if self._index_type.startswith("ivf") or isinstance(index, faiss.IndexIDMap):
+            return index
+
+        if index.ntotal == 0:
+            return faiss.IndexIDMap(index)
+
+        # IndexIDMap only wraps empty indexes, attach the filled one afterwards
+        wrapper = faiss.IndexIDMap(faiss.IndexFlatL2(index.d))
+        wrapper.index = index
+        wrapper.referenced_objects.append(index)
+        wrapper.ntotal = index.ntotal
+        faiss.copy_array_to_vector(
+            np.arange(index.ntotal, dtype=np.int64), wrapper.id_map
+        )
+        return wrapper
+
+    def add(self, vectors: list, metadata: list | None = None) -> np.ndarray:
         """Add a vectors to the store.
 
         Args:
@@ -28,23 +161,206 @@ class FAISS:
 
         Raises:
             ValueError: Length of metadata should be same as length of vectors.
+            ValueError: Index is not trained yet.
+            ValueError: Store is memory-mapped.
+
+        Returns:
+            np.ndarray: Ids of the added vectors.
         """
 
         # validate input
         if metadata and len(vectors) != len(metadata):
             raise ValueError("Length of metadata should be same as length of vectors.")
+        if self._read_only:
+            raise ValueError("Memory-mapped vector store is read-only.")
+        if not self.is_trained:
+            raise ValueError(
+                f"Index {self._index_type} has to be trained before adding vectors."
+            )
+
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+
+        # Add vectors to the store, ids continue after the last id ever assigned
+        ids = np.arange(len(self._codes), len(self._codes) + len(vectors))
+        self._vstore.add_with_ids(vectors, ids)
+
+        # Add metadata to the store
+        if metadata is None:
+            metadata = [None] * len(vectors)
+        self._codes = np.concatenate((self._codes, self._encode_labels(metadata)))
+        # changes are kept for the next delta segment once there is a saved base
+        if self._saved_path is not None:
+            self._added.append((ids, vectors, list(metadata)))
+
+        # centroids are stale now, rebuild them on the next speaker search
+        self._speaker_vstore = None
+        return ids
+
+    def remove(self, speaker) -> int:
+        """Remove all vectors of a speaker.
+
+        Args:
+            speaker: Metadata of the vectors to remove.
+
+        Raises:
+            ValueError: Store is memory-mapped.
+
+        Returns:
+            int: Number of removed vectors.
+        """
+        if self._read_only:
+            raise ValueError("Memory-mapped vector store is read-only.")
+
+        code = self._label_ids.get(speaker)
+        if code is None:
+            return 0
+        ids = np.flatnonzero(self._codes == code)
+        if len(ids) == 0:
+            return 0
+
+        self._remove_ids(ids)
+        if self._saved_path is not None:
+            self._removed.append(ids)
+        return len(ids)
+
+    def _remove_ids(self, ids: np.ndarray):
+        """Mark vectors as removed, purging the index once enough accumulate."""
+        self._codes[ids] = -1
+        self._dead.append(ids.astype(np.int64))
+        self._dead_selector = None
+        self._speaker_vstore = None
+        if sum(len(d) for d in self._dead) > self.MAX_DEAD_RATIO * self._vstore.ntotal:
+            self._vstore = self._purged(self._vstore, self._codes, self._dead)
+            self._dead = []
+            self._dead_selector = None
+
+    def _purged(self, index: faiss.Index, codes: np.ndarray, dead: list) -> faiss.Index:
+        """Remove vectors marked as removed from the index.
+
+        Args:
+            index (faiss.Index): Index of the store or its copy.
+            codes (np.ndarray): Label id of each vector id, -1 for removed vectors.
+            dead (list): Arrays of ids of the removed vectors still in the index.
+
+        Returns:
+            faiss.Index: The index, or a rebuilt one for HNSW which does not support
+            removal.
+        """
+        if not dead:
+            return index
+        if self._index_type != "hnsw":
+            index.remove_ids(np.concatenate(dead))
+            return index
+
+        ids = faiss.vector_to_array(index.id_map)
+        vectors = index.index.reconstruct_n(0, index.ntotal)
+        alive = codes[ids] >= 0
+        factory_string = self.INDEX_TYPES["hnsw"].format(**self._index_params)
+        rebuilt = faiss.IndexIDMap(faiss.index_factory(index.d, factory_string))
+        if "ef_search" in self._search_params:
+            faiss.downcast_index(rebuilt.index).hnsw.efSearch = self._search_params[
+                "ef_search"
+            ]
+        rebuilt.add_with_ids(vectors[alive], ids[alive])
+        return rebuilt
+
+    def upsert(self, speaker, vectors: list) -> np.ndarray:
+        """Replace all vectors of a speaker, or add the speaker if not stored yet.
+
+        Args:
+            speaker: Metadata of the vectors.
+            vectors (list): New vectors of the speaker.
+
+        Returns:
+            np.ndarray: Ids of the added vectors.
+        """
+        self.remove(speaker)
+        return self.add(vectors, [speaker] * len(vectors))
+
+    @property
+    def metadata(self) -> list:
+        """Metadata of the stored vectors, ordered by id."""
+        return self._labels[self._codes[self._codes >= 0]].tolist()
+
+    def _encode_labels(self, labels: list) -> np.ndarray:
+        """Map labels to their ids, registering labels not seen before.
+
+        Args:
+            labels (list): Labels to encode.
+
+        Returns:
+            np.ndarray: Label id of each label.
+        """
+        n_labels = len(self._label_ids)
+        codes = np.fromiter(
+            (self._label_ids.setdefault(m, len(self._label_ids)) for m in labels),
+            dtype=np.int32,
+            count=len(labels),
+        )
+        if len(self._label_ids) > n_labels:
+            new_labels = np.empty(len(self._label_ids) - n_labels, dtype=object)
+            new_labels[:] = list(self._label_ids)[n_labels:]
+            self._labels = np.concatenate((self._labels, new_labels))
+        return codes
+
+    @property
+    def is_trained(self) -> bool:
+        """Whether the index is ready to accept vectors."""
+        return self._vstore.is_trained
+
+    def train(self, vectors: list):
+        """Train the index on a representative sample of vectors.
+
+        IVF indexes learn their coarse clusters (and PQ codebooks), SQ8 learns value
+        ranges. Training an index which does not need it is a no-op.
+
+        Args:
+            vectors (list): Training vectors. IVF indexes need at least `nlist`
+            vectors, preferably 30-100 times more.
+        """
+        if self.is_trained:
+            return
 
         if not isinstance(vectors, np.ndarray):
             vectors = np.array(vectors)
 
-        # Add vectors to the store
-        self._vstore.add(vectors)
+        self._vstore.train(np.ascontiguousarray(vectors, dtype=np.float32))
+        # apply search parameters to the freshly trained structures
+        self.set_search_params(**self._search_params)
 
-        # Add metadata to the store
-        if metadata is not None:
-            self._metadata.extend(metadata)
-        else:
-            self._metadata.extend([None] * len(vectors))
+    def build(self, vectors: list, metadata: list | None = None):
+        """Train the index on the vectors and add them to the store.
+
+        Args:
+            vectors (list): List of vectors to be added.
+            metadata (list, optional): List of metadata for the vectors. Defaults to None.
+        """
+        self.train(vectors)
+        self.add(vectors, metadata)
+
+    def set_search_params(
+        self, nprobe: int | None = None, ef_search: int | None = None
+    ):
+        """Set search-time parameters trading recall for speed.
+
+        Args:
+            nprobe (int, optional): Number of IVF clusters visited per query.
+            ef_search (int, optional): Size of the HNSW candidate list per query.
+
+        Raises:
+            ValueError: Parameter is not supported by the index type.
+        """
+        if nprobe is not None:
+            if not self._index_type.startswith("ivf"):
+                raise ValueError(f"nprobe is not supported by {self._index_type}.")
+            faiss.extract_index_ivf(self._vstore).nprobe = nprobe
+            self._search_params["nprobe"] = nprobe
+
+        if ef_search is not None:
+            if self._index_type != "hnsw":
+                raise ValueError(f"ef_search is not supported by {self._index_type}.")
+            faiss.downcast_index(self._vstore.index).hnsw.efSearch = ef_search
+            self._search_params["ef_search"] = ef_search
 
     def search(
         self, embeddings: list, k: int, threshold: float | None = None
@@ -76,50 +392,603 @@ class FAISS:
             >>> vstore.search([[1, 2], [3, 4]], 2)
             ([array([0., 8.]), array([0., 8.])], [['a', 'b'], ['b', 'a']])  # distance, metadata
         """
+        distances, metadata = self.search_padded(embeddings, k)
+
+        # rows with less than k results are padded with infinite distances
+        mask = np.isfinite(distances)
+        if threshold is not None:
+            mask &= distances <= threshold
+
+        if mask.all():
+            return list(distances), metadata.tolist()
+        return self._split_rows(distances, metadata, mask)
+
+    def search_padded(self, embeddings: list, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """Search for the k nearest vectors, returning results as fixed-size arrays.
+
+        Building block of `search` for callers merging results of several stores.
+
+        Args:
+            embeddings (list): List of embeddings to search for.
+            k (int): Number of nearest vectors to return.
+
+        Returns:
+            tuple: Tuple of `distances` and `metadata`, dimensions are
+            (n_embeddings, k). Rows with less than k results are padded with
+            infinite distances and None metadata.
+        """
         if not isinstance(embeddings, np.ndarray):
             embeddings = np.array(embeddings)
+        if self._vstore.ntotal == 0:
+            return np.full((len(embeddings), k), np.inf, dtype=np.float32), np.full(
+                (len(embeddings), k), None, dtype=object
+            )
 
-        distances, indices = self._vstore.search(embeddings, k)
+        params = self._alive_params()
+        n_dead = 0
+        if params is None and self._dead:
+            # without selectors, removed vectors still in the index may take some of
+            # the k places
+            n_dead = sum(len(d) for d in self._dead)
+        if params is None:
+            distances, indices = self._vstore.search(embeddings, k + n_dead)
+        else:
+            distances, indices = self._vstore.search(embeddings, k, params=params)
         # indices are 2 dimensional array. Each row for each query.
-        metadata = [[self._metadata[i] for i in row] for row in indices]
+        codes = self._codes[indices]
 
-        if threshold is not None:
-            distances, metadata = self.apply_threshold(distances, metadata, threshold)
+        # FAISS pads rows with -1 when there are less than k results
+        mask = indices >= 0
+        if n_dead:
+            mask &= codes >= 0
+            # move the results which are not removed to the front
+            order = np.argsort(~mask, axis=1, kind="stable")[:, :k]
+            distances = np.take_along_axis(distances, order, axis=1)
+            codes = np.take_along_axis(codes, order, axis=1)
+            mask = np.take_along_axis(mask, order, axis=1)
+
+        metadata = self._labels[codes]
+        if not mask.all():
+            distances[~mask] = np.inf
+            metadata[~mask] = None
+        return distances, metadata
+
+    def _alive_params(self) -> faiss.SearchParameters | None:
+        """Search parameters skipping removed vectors still in the index.
+
+        The removed vectors are filtered inside the index by an `IDSelector`, so
+        search cost does not grow with the number of removed vectors. The parameters
+        are created for each search, as `faiss.IndexIDMap` changes them while
+        searching, and carry `nprobe` or `ef_search` of the index, which they
+        override.
+
+        Returns:
+            faiss.SearchParameters | None: Parameters with the selector, None if no
+            vectors are removed or FAISS does not support selectors.
+        """
+        if not self._dead or not hasattr(faiss, "IDSelectorNot"):
+            return None
+        if self._dead_selector is None:
+            batch = faiss.IDSelectorBatch(np.concatenate(self._dead))
+            # the wrapped selector is kept alive next to the one using it
+            self._dead_selector = (faiss.IDSelectorNot(batch), batch)
+        selector = self._dead_selector[0]
+
+        if self._index_type.startswith("ivf"):
+            nprobe = faiss.extract_index_ivf(self._vstore).nprobe
+            return faiss.SearchParametersIVF(sel=selector, nprobe=nprobe)
+        if self._index_type == "hnsw":
+            ef_search = faiss.downcast_index(self._vstore.index).hnsw.efSearch
+            return faiss.SearchParametersHNSW(sel=selector, efSearch=ef_search)
+        return faiss.SearchParameters(sel=selector)
+
+    def range_search(
+        self, embeddings: list, radius: float
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Search for all vectors closer than `radius` to the given embeddings.
+
+        Results are returned in CSR-style layout: the results of query `i` are
+        `distances[lims[i]:lims[i + 1]]` and `metadata[lims[i]:lims[i + 1]]`,
+        ordered from the nearest one.
+
+        Args:
+            embeddings (list): List of embeddings to search for.
+            radius (float): Search radius, results have distance strictly lower than it.
+
+        Returns:
+            tuple: Tuple of `lims`, `distances` and `metadata`.
+            - lims (np.ndarray): Offsets of the query results, length is n_queries + 1.
+            - distances (np.ndarray): Distances of all results.
+            - metadata (np.ndarray): Metadata of all results.
+
+        Examples:
+            >>> from kth_sr.vectorstore import FAISS
+            >>> vstore = FAISS(2)
+            >>> vstore.add([[1, 2], [3, 4]], ["a", "b"])
+            >>> vstore.range_search([[1, 2], [9, 9]], 10)
+            (array([0, 2, 2]), array([0., 8.], dtype=float32), array(['a', 'b'], dtype=object))
+        """
+        if not isinstance(embeddings, np.ndarray):
+            embeddings = np.array(embeddings)
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+
+        params = self._alive_params()
+        if params is None:
+            lims, distances, indices = self._vstore.range_search(embeddings, radius)
+        else:
+            lims, distances, indices = self._vstore.range_search(
+                embeddings, radius, params=params
+            )
+        lims = lims.astype(np.int64)
+        queries = np.repeat(np.arange(len(embeddings)), np.diff(lims))
+        codes = self._codes[indices]
+
+        if self._dead and params is None:
+            # skip removed vectors still in the index
+            alive = codes >= 0
+            queries, distances, codes = queries[alive], distances[alive], codes[alive]
+            counts = np.bincount(queries, minlength=len(embeddings))
+            lims = np.concatenate(([0], np.cumsum(counts)))
+
+        # FAISS does not order the results, sort them by query and distance
+        order = np.lexsort((distances, queries))
+
+        return lims, distances[order], self._labels[codes[order]]
+
+    def build_speaker_index(self, normalize: bool = False):
+        """Build a compact index of per-speaker centroids from the stored vectors.
+
+        Vectors sharing the same metadata are averaged into one centroid, so a store
+        of 200 speakers with 9 clips each is searched as 200 vectors instead of 1800.
+
+        Args:
+            normalize (bool, optional): L2 normalize the centroids. Useful when the
+            stored embeddings are unit vectors. Defaults to False.
+        """
+        vectors, codes = self._live_vectors()
+        self._speaker_vstore = faiss.IndexFlatL2(self._vstore.d)
+        if len(codes) == 0:
+            # empty or fully removed store, searches find no speakers
+            self._speaker_labels = []
+            return
+
+        # sum vectors of each speaker in one pass over the sorted vectors
+        order = np.argsort(codes, kind="stable")
+        counts = np.bincount(codes, minlength=len(self._labels))
+        speakers = np.flatnonzero(counts)
+        counts = counts[speakers]
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        centroids = np.add.reduceat(vectors[order], starts, axis=0)
+        centroids /= counts[:, None]
+
+        if normalize:
+            faiss.normalize_L2(centroids)
+
+        self._speaker_vstore.add(np.ascontiguousarray(centroids, dtype=np.float32))
+        self._speaker_labels = self._labels[speakers].tolist()
+
+    def _live_vectors(self) -> tuple[np.ndarray, np.ndarray]:
+        """Reconstruct the vectors which are not removed, with their label ids."""
+        if isinstance(self._vstore, faiss.IndexIDMap):
+            ids = faiss.vector_to_array(self._vstore.id_map)
+            vectors = self._vstore.index.reconstruct_n(0, self._vstore.ntotal)
+        elif self._vstore.ntotal == len(self._codes):
+            # nothing was removed from the IVF index, ids are positions
+            ids = np.arange(self._vstore.ntotal)
+            vectors = self._vstore.reconstruct_n(0, self._vstore.ntotal)
+        else:
+            ivf = faiss.extract_index_ivf(self._vstore)
+            if ivf.direct_map.type == faiss.DirectMap.NoMap:
+                ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+            ids = np.flatnonzero(self._codes >= 0)
+            vectors = self._vstore.reconstruct_batch(ids.astype(np.int64))
+
+        codes = self._codes[ids]
+        alive = codes >= 0
+        return vectors[alive], codes[alive]
+
+    def search_speakers(
+        self,
+        embeddings: list,
+        k: int,
+        aggregation: str = "mean",
+        lengths: list | None = None,
+    ) -> tuple[list[np.ndarray], list]:
+        """Rank speakers for queries consisting of multiple windows.
+
+        All windows are scored against the speaker centroids in a single search and
+        the scores are then combined per query.
+
+        Args:
+            embeddings (list): Embeddings of all query windows.
+            k (int): Number of speakers to return for each query.
+            aggregation (str, optional): How to combine windows of a query.
+            `"mean"` ranks speakers by mean distance over the windows, `"vote"` by the
+            share of windows for which the speaker is the nearest one (ties broken by
+            mean distance). Defaults to "mean".
+            lengths (list, optional): Number of consecutive windows belonging to each
+            query. Defaults to None, which treats all windows as one query.
+
+        Raises:
+            ValueError: Unknown aggregation or lengths not matching the embeddings.
+
+        Returns:
+            tuple: Tuple of `scores` and `metadata`, one row per query.
+            - scores (list[np.ndarray]): Mean distances for `"mean"`,
+            vote shares for `"vote"`.
+            - metadata (list): Speakers ordered from the best match.
+
+        Examples:
+            >>> from kth_sr.vectorstore import FAISS
+            >>> vstore = FAISS(2)
+            >>> vstore.add([[0, 0], [0, 2], [10, 10]], ["a", "a", "b"])
+            >>> vstore.search_speakers([[0, 1], [1, 1]], 2)
+            ([array([  0.5, 171.5])], [['a', 'b']])  # distance, metadata
+        """
+        if aggregation not in self.AGGREGATIONS:
+            raise ValueError(
+                f"Unknown aggregation {aggregation}, use one of {self.AGGREGATIONS}."
+            )
+
+        if lengths is None:
+            lengths = [len(embeddings)]
+        lengths = np.asarray(lengths, dtype=np.int64)
+        if lengths.sum() != len(embeddings) or (lengths <= 0).any():
+            raise ValueError("Lengths should be positive and sum to number of windows.")
+
+        dense, speakers = self.speaker_distances(embeddings)
+        if not speakers:
+            # nothing enrolled, every query gets an empty ranking
+            scores = [np.empty(0, dtype=np.float32) for _ in lengths]
+            return scores, [[] for _ in lengths]
+
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        mean_distances = np.add.reduceat(dense, starts, axis=0) / lengths[:, None]
+
+        if aggregation == "mean":
+            scores = mean_distances
+            order = np.argsort(mean_distances, axis=1, kind="stable")
+        else:
+            queries = np.repeat(np.arange(len(lengths)), lengths)
+            votes = np.zeros_like(mean_distances)
+            np.add.at(votes, (queries, dense.argmin(axis=1)), 1)
+            scores = votes / lengths[:, None]
+            # sort by votes (descending), ties by mean distance
+            order = np.lexsort((mean_distances, -votes), axis=1)
+
+        order = order[:, :k]
+        scores = np.take_along_axis(scores, order, axis=1)
+        metadata = [[speakers[i] for i in row] for row in order]
+
+        return list(scores), metadata
+
+    def speaker_distances(self, embeddings: list) -> tuple[np.ndarray, list]:
+        """Compute distances from every embedding to every speaker centroid.
+
+        Building block of `search_speakers` for callers accumulating scores over time.
 
-        return list(distances), metadata
+        Args:
+            embeddings (list): List of embeddings.
+
+        Returns:
+            tuple: Tuple of `distances` and `speakers`.
+            - distances (np.ndarray): Distances, dimensions are
+            (n_embeddings, n_speakers).
+            - speakers (list): Speaker of each column of `distances`.
+        """
+        if not isinstance(embeddings, np.ndarray):
+            embeddings = np.array(embeddings)
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+
+        if self._speaker_vstore is None:
+            self.build_speaker_index()
+
+        n_speakers = self._speaker_vstore.ntotal
+        if n_speakers == 0:
+            return np.empty((len(embeddings), 0), dtype=np.float32), []
+        distances, indices = self._speaker_vstore.search(embeddings, n_speakers)
+        dense = np.empty_like(distances)
+        np.put_along_axis(dense, indices, distances, axis=1)
+        return dense, self._speaker_labels
 
-    def save(self, path: str):
+    def save(self, path: str, delta: bool = False):
         """Save the vector store to a file.
 
+        Metadata are saved in columnar form, the label table to `labels.json` and the
+        label id of each vector id to `codes.npy`. With `delta`, only the changes since
+        the store was last saved to or loaded from `path` are written, as an
+        append-only segment in `deltas/`. Once there are `MAX_DELTAS` segments, they
+        are merged into a new snapshot by a background `compact`.
+
         Args:
             path (str): Path to save the vector store.
+            delta (bool, optional): Save only the changes. Saves everything if the
+            store does not come from `path`. Defaults to False.
         """
         dir_path = Path(path)
-        dir_path.mkdir(parents=True, exist_ok=True)
-        faiss.write_index(self._vstore, f"{path}/vector_store.index")
-        with open(dir_path / "metadata.json", "w") as f:
-            json.dump(self._metadata, f)
+        if not delta or self._saved_path != dir_path.resolve():
+            dir_path.mkdir(parents=True, exist_ok=True)
+            self._vstore = self._purged(self._vstore, self._codes, self._dead)
+            self._dead = []
+            self._dead_selector = None
+            self._write_snapshot(
+                dir_path,
+                self._vstore,
+                self._labels.tolist(),
+                self._codes,
+                self._config(),
+            )
+            self._saved_path = dir_path.resolve()
+            self._added, self._removed = [], []
+            return
+
+        self._save_delta(dir_path)
+        if len(self._delta_paths(dir_path)) >= self.MAX_DELTAS:
+            self.compact(path, background=True)
+
+    def compact(self, path: str, background: bool = False) -> threading.Thread | None:
+        """Merge the delta segments of a saved store into a new snapshot.
+
+        The snapshot is taken from the store in memory, unsaved changes are saved as a
+        delta segment first. Segments saved while the snapshot is written are kept.
+        Loading the store from another process while it is compacted is not
+        supported, the snapshot files are replaced one by one.
+
+        Args:
+            path (str): Path the store was saved to or loaded from.
+            background (bool, optional): Write the snapshot on a background thread.
+            Defaults to False.
+
+        Raises:
+            ValueError: The store was not saved to or loaded from `path`.
+
+        Returns:
+            threading.Thread | None: Thread writing the snapshot if `background`,
+            the running one if a compaction is already in progress.
+        """
+        dir_path = Path(path)
+        if self._saved_path != dir_path.resolve():
+            raise ValueError(f"Vector store was not saved to or loaded from {path}.")
+        if self._compaction is not None and self._compaction.is_alive():
+            return self._compaction
+
+        self._save_delta(dir_path)
+        if not background:
+            self._vstore = self._purged(self._vstore, self._codes, self._dead)
+            self._dead = []
+            self._dead_selector = None
+            self._write_snapshot(
+                dir_path,
+                self._vstore,
+                self._labels.tolist(),
+                self._codes,
+                self._config(),
+                delete_all=False,
+            )
+            return None
+
+        # copy the state, the store may change while the snapshot is written
+        index, codes = faiss.clone_index(self._vstore), self._codes.copy()
+        labels, dead, config = self._labels.tolist(), list(self._dead), self._config()
+
+        def write():
+            self._write_snapshot(
+                dir_path,
+                self._purged(index, codes, dead),
+                labels,
+                codes,
+                config,
+                delete_all=False,
+            )
+
+        self._compaction = threading.Thread(
+            target=write, name="FAISS compaction", daemon=True
+        )
+        self._compaction.start()
+        return self._compaction
+
+    def _config(self) -> dict:
+        """Configuration saved to `config.json`."""
+        return {
+            "index_type": self._index_type,
+            "index_params": self._index_params,
+            "search_params": self._search_params,
+            "delta_seq": self._delta_seq,
+        }
+
+    @staticmethod
+    def _write_snapshot(
+        dir_path: Path,
+        index: faiss.Index,
+        labels: list,
+        codes: np.ndarray,
+        config: dict,
+        delete_all: bool = True,
+    ):
+        """Write the whole store and delete the delta segments it includes.
+
+        Every file is written to a temporary file and renamed, `config.json` last.
+
+        Args:
+            dir_path (Path): Directory of the store.
+            index (faiss.Index): Vector index.
+            labels (list): Label table.
+            codes (np.ndarray): Label id of each vector id.
+            config (dict): Configuration, `delta_seq` is the last included segment.
+            delete_all (bool, optional): Delete all segments, also those saved after
+            `delta_seq`. Defaults to True.
+        """
+
+        def write(name: str, write_file):
+            tmp_path = dir_path / f"{name}.tmp"
+            write_file(tmp_path)
+            os.replace(tmp_path, dir_path / name)
+
+        def write_json(data):
+            return lambda file_path: file_path.write_text(json.dumps(data))
+
+        def write_codes(file_path: Path):
+            with open(file_path, "wb") as f:
+                np.save(f, codes)
+
+        write("vector_store.index", lambda p: faiss.write_index(index, str(p)))
+        write("codes.npy", write_codes)
+        write("labels.json", write_json(labels))
+        write("config.json", write_json(config))
+
+        for delta_path in FAISS._delta_paths(dir_path):
+            if delete_all or int(delta_path.stem) <= config["delta_seq"]:
+                delta_path.unlink()
+
+    def _save_delta(self, dir_path: Path):
+        """Write the changes since the last save as the next delta segment."""
+        if not self._added and not self._removed:
+            return
+
+        removed = np.concatenate(self._removed) if self._removed else np.empty(0)
+        removed = removed.astype(np.int64)
+        if self._added:
+            ids = np.concatenate([ids for ids, _, _ in self._added])
+            vectors = np.concatenate([vectors for _, vectors, _ in self._added])
+            labels = np.array(
+                [label for _, _, labels in self._added for label in labels],
+                dtype=object,
+            )
+        else:
+            ids = np.empty(0, dtype=np.int64)
+            vectors = np.empty((0, self._vstore.d), dtype=np.float32)
+            labels = np.empty(0, dtype=object)
+
+        # vectors added and removed again since the last save are left out
+        added_kept = ~np.isin(ids, removed)
+        removed = removed[~np.isin(removed, ids)]
+
+        self._delta_seq += 1
+        deltas_path = dir_path / "deltas"
+        deltas_path.mkdir(exist_ok=True)
+        tmp_path = deltas_path / f"{self._delta_seq:06d}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                ids=ids[added_kept],
+                vectors=vectors[added_kept],
+                labels=np.array(json.dumps(labels[added_kept].tolist())),
+                removed=removed,
+                next_id=np.array(len(self._codes)),
+            )
+        os.replace(tmp_path, deltas_path / f"{self._delta_seq:06d}.npz")
+        self._added, self._removed = [], []
+
+    def _apply_delta(self, delta_path: Path):
+        """Replay a delta segment on the store loaded from the preceding snapshot."""
+        with np.load(delta_path) as delta:
+            ids, vectors, removed = delta["ids"], delta["vectors"], delta["removed"]
+            labels = json.loads(str(delta["labels"]))
+            next_id = int(delta["next_id"])
+
+        codes = np.full(next_id, -1, dtype=np.int32)
+        codes[: len(self._codes)] = self._codes
+        if len(ids):
+            self._vstore.add_with_ids(vectors, ids)
+            codes[ids] = self._encode_labels(labels)
+        self._codes = codes
+        if len(removed):
+            self._remove_ids(removed)
+
+    @staticmethod
+    def _delta_paths(dir_path: Path) -> list:
+        """Delta segments of a saved store, ordered by their sequence number."""
+        return sorted((dir_path / "deltas").glob("*.npz"))
 
     @classmethod
-    def load(cls, path: str) -> FAISS:
+    def load(cls, path: str, mmap: bool = False) -> FAISS:
         """Load the vector store from a file.
 
         Args:
             path (str): Path to load the vector store.
+            mmap (bool, optional): Memory-map the index and metadata instead of reading
+            them to memory. Processes loading the same store share its pages through
+            the OS cache, but the store is read-only. Defaults to False.
+
+        Raises:
+            ValueError: Memory-mapping a store with delta segments, `compact` it
+            first.
 
         Returns:
             FAISS: Vector store object
         """
         dir_path = Path(path)
 
-        vector_store = FAISS(512)
-        vector_store._vstore = faiss.read_index(f"{path}/vector_store.index")
+        # stores saved before index types were introduced have no config
+        config = {"index_type": "flat", "index_params": {}, "search_params": {}}
+        if (dir_path / "config.json").exists():
+            with open(dir_path / "config.json", "r") as f:
+                config = json.load(f)
+
+        io_flags = 0
+        if mmap:
+            # IVF indexes map their inverted lists, the other ones their codes
+            io_flags = faiss.IO_FLAG_READ_ONLY
+            if config["index_type"].startswith("ivf"):
+                io_flags |= faiss.IO_FLAG_MMAP
+            else:
+                io_flags |= faiss.IO_FLAG_MMAP_IFC
+
+        vstore = faiss.read_index(f"{path}/vector_store.index", io_flags)
+        vector_store = cls(vstore.d, config["index_type"], **config["index_params"])
+        vector_store._vstore = vector_store._with_ids(vstore)
+        vector_store._read_only = mmap
+        vector_store.set_search_params(**config["search_params"])
         print("Loaded vectorstore", vector_store._vstore)
-        with open(dir_path / "metadata.json", "r") as f:
-            vector_store._metadata = json.load(f)
-            print("Loaded vector metadata")
+
+        if (dir_path / "codes.npy").exists():
+            vector_store._label_ids = {
+                label: i for i, label in enumerate(cls.read_labels(path))
+            }
+            vector_store._labels = np.empty(len(vector_store._label_ids), dtype=object)
+            vector_store._labels[:] = list(vector_store._label_ids)
+            vector_store._codes = np.load(
+                dir_path / "codes.npy", mmap_mode="r" if mmap else None
+            )
+        else:
+            # stores saved before the columnar format keep one label per vector
+            vector_store._codes = vector_store._encode_labels(cls.read_labels(path))
+        print("Loaded vector metadata")
+
+        # replay the changes saved after the snapshot
+        vector_store._delta_seq = config.get("delta_seq", 0)
+        deltas = [
+            delta_path
+            for delta_path in cls._delta_paths(dir_path)
+            if int(delta_path.stem) > vector_store._delta_seq
+        ]
+        if deltas and mmap:
+            raise ValueError("Compact the vector store before memory-mapping it.")
+        for delta_path in deltas:
+            vector_store._apply_delta(delta_path)
+            vector_store._delta_seq = int(delta_path.stem)
+
+        vector_store._saved_path = dir_path.resolve()
         return vector_store
 
+    @classmethod
+    def read_labels(cls, path: str) -> list:
+        """Read the distinct labels of a saved vector store without loading it.
+
+        Args:
+            path (str): Path of the saved vector store.
+
+        Returns:
+            list: Labels of the store. Stores saved in the legacy format return the
+            label of every vector.
+        """
+        dir_path = Path(path)
+        labels_path = dir_path / "labels.json"
+        if not labels_path.exists():
+            labels_path = dir_path / "metadata.json"
+        with open(labels_path, "r") as f:
+            return json.load(f)
+
     @classmethod
     def apply_threshold(
         cls, distances: np.ndarray, metadata: list, threshold: float
@@ -148,17 +1017,33 @@ class FAISS:
             raise ValueError(
                 "Length of metadata should be same as length of distances."
             )
+        if len(distances) == 0:
+            # no queries, no rows
+            return [], []
 
         if not isinstance(distances, np.ndarray):
             distances = np.array(distances)
 
-        # remove the distances greater than threshold
-        distances_masked = np.where(distances <= threshold, distances, np.nan)
-        distances_filtered = [i[~np.isnan(i)] for i in distances_masked]
+        metadata_array = np.empty(distances.shape, dtype=object)
+        metadata_array[:] = metadata
 
-        # remove the metadata corresponding to the distances greater than threshold
-        metadata_filtered = [
-            metadata[i][: len(row)] for i, row in enumerate(distances_filtered)
-        ]
+        return cls._split_rows(distances, metadata_array, distances <= threshold)
 
+    @staticmethod
+    def _split_rows(
+        distances: np.ndarray, metadata: np.ndarray, mask: np.ndarray
+    ) -> tuple[list[np.ndarray], list]:
+        """Keep the masked search results and split them to rows of varying length.
+
+        Args:
+            distances (np.ndarray): Distances of the search results.
+            metadata (np.ndarray): Metadata of the search results.
+            mask (np.ndarray): Boolean mask of the results to keep.
+
+        Returns:
+            tuple: Tuple of `distances` and `metadata` rows.
+        """
+        splits = np.cumsum(mask.sum(axis=1))[:-1]
+        distances_filtered = np.split(distances[mask], splits)
+        metadata_filtered = [row.tolist() for row in np.split(metadata[mask], splits)]
         return distances_filtered, metadata_filtered
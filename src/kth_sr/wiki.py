@@ -0,0 +1,245 @@
+"""Fetch a picture, description and link of people from Wikipedia.
+
+`WikiFetcher` queries the page summaries of the Wikipedia REST API from a pool of
+threads, rate limited by a token bucket and retrying transient errors. Results are
+appended to a per-name cache file as they arrive, so an interrupted run, or a run
+for newly added speakers, only fetches the names missing from the cache.
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable
+
+API_URL = "https://en.wikipedia.org/api/rest_v1/page/summary/"
+"""Endpoint of the page summaries, the page title is appended."""
+USER_AGENT = "KTH_SR/0.1 (speaker recognition demo)"
+"""Wikimedia asks clients to identify themselves."""
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+"""Images to use, icons and logos are usually SVG."""
+EMPTY_INFO = {"image_url": "", "wiki_description": "", "wiki_url": ""}
+"""Information of names without a Wikipedia page."""
+
+
+def http_get(url: str, timeout: float = 10.0) -> tuple[int, bytes]:
+    """Send a GET request.
+
+    Args:
+        url (str): URL to get.
+        timeout (float, optional): Seconds to wait for the server. Defaults to 10.
+
+    Raises:
+        OSError: The server could not be reached.
+
+    Returns:
+        tuple: Tuple of the HTTP status and the body of the response.
+    """
+    request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+class TokenBucket:
+    """Thread-safe rate limiter allowing bursts of up to `capacity` calls.
+
+    Examples:
+        >>> from kth_sr.wiki import TokenBucket
+        >>> bucket = TokenBucket(rate=10, capacity=10)
+        >>> bucket.acquire()  # blocks once more than 10 calls per second are made
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        """Create a full bucket.
+
+        Args:
+            rate (float): Tokens added per second.
+            capacity (float, optional): Maximum number of tokens. Defaults to 1.
+
+        Raises:
+            ValueError: Rate or capacity is not positive.
+        """
+        if rate <= 0 or capacity <= 0:
+            raise ValueError("Rate and capacity should be positive.")
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take a token, waiting until one is available."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class WikiFetcher:
+    """Concurrent, rate limited and cached fetcher of Wikipedia page summaries.
+
+    Examples:
+        >>> from kth_sr.wiki import WikiFetcher
+        >>> fetcher = WikiFetcher(cache_path="data/wiki_cache.jsonl")
+        >>> info = fetcher.fetch_all(["Ada Lovelace", "Alan Turing"])
+        >>> info["Alan Turing"]["wiki_url"]
+        'https://en.wikipedia.org/wiki/Alan_Turing'
+    """
+
+    _cache: dict[str, dict]
+    """Information of every fetched name."""
+
+    def __init__(
+        self,
+        cache_path: str | None = None,
+        client: Callable[[str], tuple[int, bytes]] = http_get,
+        api_url: str = API_URL,
+        workers: int = 8,
+        rate: float = 20.0,
+        retries: int = 3,
+        backoff_s: float = 1.0,
+    ):
+        """Create the fetcher and load the names fetched by earlier runs.
+
+        Args:
+            cache_path (str, optional): JSON lines file caching the information of
+            each name. Defaults to None, which caches in memory only.
+            client (Callable[[str], tuple[int, bytes]], optional): Function getting
+            a URL and returning the HTTP status and body, raising OSError if the
+            server can not be reached. Defaults to `http_get`.
+            api_url (str, optional): URL of the page summaries, the page title is
+            appended. Defaults to API_URL.
+            workers (int, optional): Maximum number of concurrent requests.
+            Defaults to 8.
+            rate (float, optional): Maximum number of requests per second, including
+            retries. Defaults to 20.
+            retries (int, optional): Retries of a request failing with a network
+            error, status 429 or 5xx. Defaults to 3.
+            backoff_s (float, optional): Wait before the first retry, doubled for
+            every further retry. Defaults to 1.
+        """
+        self.client = client
+        self.api_url = api_url
+        self.workers = workers
+        self.retries = retries
+        self.backoff_s = backoff_s
+        self.n_requests = 0
+        """Number of requests sent, including retries."""
+        self._bucket = TokenBucket(rate, capacity=max(workers, 1))
+        self._lock = threading.Lock()
+
+        self._cache = {}
+        self._cache_path = None if cache_path is None else Path(cache_path)
+        if self._cache_path is not None and self._cache_path.exists():
+            complete, _, partial = self._cache_path.read_text().rpartition("\n")
+            if partial:
+                # a run was killed while writing the last line, drop it
+                self._cache_path.write_text(complete + "\n" if complete else "")
+            for line in complete.splitlines():
+                entry = json.loads(line)
+                self._cache[entry["name"]] = entry["info"]
+
+    def fetch(self, name: str) -> dict:
+        """Return the information of a name, fetching it if it is not cached.
+
+        Args:
+            name (str): Name of the person, the title of their Wikipedia page.
+
+        Returns:
+            dict: Dictionary of `image_url`, `wiki_description` and `wiki_url`,
+            empty strings if not found. Names whose requests failed after all
+            retries are not cached, so they are fetched again by a later call.
+        """
+        with self._lock:
+            if name in self._cache:
+                return dict(self._cache[name])
+
+        info = self._request(name)
+        if info is None:
+            return dict(EMPTY_INFO)
+
+        with self._lock:
+            self._cache[name] = info
+            if self._cache_path is not None:
+                self._cache_path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self._cache_path, "a") as f:
+                    f.write(json.dumps({"name": name, "info": info}) + "\n")
+        return dict(info)
+
+    def fetch_all(self, names: list) -> dict[str, dict]:
+        """Return the information of all names, fetching the uncached concurrently.
+
+        Args:
+            names (list): Names of the people.
+
+        Returns:
+            dict: Information of each name, see `fetch`.
+        """
+        names = list(dict.fromkeys(names))
+        with ThreadPoolExecutor(self.workers) as pool:
+            return dict(zip(names, pool.map(self.fetch, names)))
+
+    def _request(self, name: str) -> dict | None:
+        """Fetch the summary of a page, None if all attempts failed."""
+        url = self.api_url + urllib.parse.quote(name.replace(" ", "_"), safe="")
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                time.sleep(self.backoff_s * 2 ** (attempt - 1))
+            self._bucket.acquire()
+            with self._lock:
+                self.n_requests += 1
+            try:
+                status, body = self.client(url)
+            except OSError as e:
+                print(f"Error fetching Wikipedia page of {name}: {e}")
+                continue
+            if status == 200:
+                return parse_summary(json.loads(body))
+            if status == 404:
+                return dict(EMPTY_INFO)
+            if status != 429 and status < 500:
+                print(f"Error fetching Wikipedia page of {name}: status {status}")
+                return None
+        return None
+
+
+def parse_summary(summary: dict) -> dict:
+    """Pick the image, description and URL from a page summary of the REST API.
+
+    Args:
+        summary (dict): Page summary.
+
+    Returns:
+        dict: Dictionary of `image_url`, `wiki_description` and `wiki_url`.
+    """
+    info = dict(EMPTY_INFO)
+    for image in (summary.get("originalimage"), summary.get("thumbnail")):
+        if image and image.get("source", "").lower().endswith(IMAGE_EXTENSIONS):
+            info["image_url"] = image["source"]
+            break
+
+    extract = " ".join(summary.get("extract", "").split())
+    if extract:
+        info["wiki_description"] = extract[:500] + "..."
+
+    info["wiki_url"] = (
+        summary.get("content_urls", {}).get("desktop", {}).get("page", "")
+    )
+    return info
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+import pytest
+import soundfile
+
+from kth_sr.utils import get_df_by_downloaded_folder
+from kth_sr.vectorstore import FAISS
+
+SAMPLE_RATE = 16000
+
+
+@pytest.fixture
+def fake_predict():
+    """Deterministic stand-in for the model, 512-dimensional embeddings."""
+
+    def predict(windows: np.ndarray) -> np.ndarray:
+        features = windows.reshape(len(windows), -1)[:, :512]
+        return features / np.linalg.norm(features, axis=1, keepdims=True)
+
+    return predict
+
+
+@pytest.fixture
+def clips(tmp_path) -> pd.DataFrame:
+    """Three 6 s noise clips of speakers id001 to id003 and a broken clip of id004,
+    sorted by path."""
+    rng = np.random.default_rng(0)
+    folder = tmp_path / "clips"
+    folder.mkdir()
+    for speaker in ["id001", "id002", "id003"]:
+        for sample in range(3):
+            audio = 0.3 * rng.standard_normal(SAMPLE_RATE * 6).astype(np.float32)
+            soundfile.write(folder / f"{speaker}_{sample}_6000.wav", audio, SAMPLE_RATE)
+    (folder / "id004_0_1000.wav").write_bytes(b"not audio")
+    return get_df_by_downloaded_folder(folder, "*.wav").sort_values("path")
+
+
+@pytest.fixture
+def storage() -> FAISS:
+    """Two-dimensional store of speakers a, b and c."""
+    storage = FAISS(2)
+    storage.add([[0, 0], [0, 1], [10, 10], [20, 0]], ["a", "a", "b", "c"])
+    return storage
@@ -0,0 +1,107 @@
+import io
+import time
+
+import numpy as np
+import pytest
+import soundfile
+
+from kth_sr.audio import StreamDecoder, decode_audio, detect_format, stream_audio
+
+SAMPLE_RATE = 16000
+AUDIO = 0.5 * np.sin(np.linspace(0, 2000, SAMPLE_RATE)).astype(np.float32)
+
+
+def encode(audio: np.ndarray, rate: int, fmt: str, subtype: str) -> bytes:
+    buffer = io.BytesIO()
+    soundfile.write(buffer, audio, rate, format=fmt, subtype=subtype)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize(
+    "data, expected",
+    [
+        (encode(AUDIO, SAMPLE_RATE, "WAV", "PCM_16"), "wav"),
+        (encode(AUDIO, SAMPLE_RATE, "FLAC", "PCM_16"), "flac"),
+        (b"\x1a\x45\xdf\xa3\x01\x00", "webm"),
+        (b"\x00\x00\x00\x20ftypisom", "mp4"),
+        (b"not audio", "unknown"),
+    ],
+)
+def test_detect_format(data, expected):
+    assert detect_format(data) == expected
+
+
+@pytest.mark.parametrize(
+    "audio, rate, fmt, subtype, tolerance",
+    [
+        (AUDIO, SAMPLE_RATE, "WAV", "PCM_16", 1e-4),
+        (AUDIO, SAMPLE_RATE, "WAV", "PCM_U8", 1e-2),
+        (AUDIO, SAMPLE_RATE, "WAV", "PCM_24", 1e-6),
+        (AUDIO, SAMPLE_RATE, "WAV", "PCM_32", 1e-6),
+        (AUDIO, SAMPLE_RATE, "WAV", "FLOAT", 0),
+        (AUDIO, SAMPLE_RATE, "WAV", "DOUBLE", 1e-7),
+        (AUDIO, SAMPLE_RATE, "WAV", "ULAW", 3e-2),
+        (AUDIO, SAMPLE_RATE, "WAV", "ALAW", 3e-2),
+        (np.stack([AUDIO, AUDIO], axis=1), SAMPLE_RATE, "WAV", "PCM_16", 1e-4),
+        (np.stack([AUDIO, AUDIO], axis=1), SAMPLE_RATE, "WAV", "PCM_24", 1e-6),
+        (AUDIO, SAMPLE_RATE, "FLAC", "PCM_16", 1e-4),
+    ],
+)
+def test_decode_audio(audio, rate, fmt, subtype, tolerance):
+    decoded = decode_audio(encode(audio, rate, fmt, subtype), SAMPLE_RATE)
+    assert decoded.dtype == np.float32
+    assert np.abs(decoded - AUDIO).max() <= tolerance
+
+
+def test_decode_audio_no_copy():
+    data = encode(AUDIO, SAMPLE_RATE, "WAV", "FLOAT")
+    decoded = decode_audio(io.BytesIO(data), SAMPLE_RATE)
+    # float32 WAV at the target rate is a view of the input
+    assert not decoded.flags.owndata
+    assert not decoded.flags.writeable
+
+
+def test_decode_audio_resample():
+    audio = 0.5 * np.sin(np.linspace(0, 2000, 44100)).astype(np.float32)
+    decoded = decode_audio(encode(audio, 44100, "WAV", "PCM_16"), SAMPLE_RATE)
+    assert len(decoded) == SAMPLE_RATE
+
+
+def test_decode_audio_invalid():
+    with pytest.raises(ValueError):
+        decode_audio(b"RIFF\x00\x00\x00\x00WAVE", SAMPLE_RATE)
+
+
+def test_stream_audio(tmp_path):
+    path = tmp_path / "recording.wav"
+    audio = np.concatenate([AUDIO, AUDIO, AUDIO[: SAMPLE_RATE // 2]])
+    soundfile.write(path, audio, SAMPLE_RATE, subtype="FLOAT")
+
+    chunks = list(stream_audio(str(path), SAMPLE_RATE, chunk_s=1.0))
+    assert [len(c) for c in chunks] == [SAMPLE_RATE, SAMPLE_RATE, SAMPLE_RATE // 2]
+    assert np.abs(np.concatenate(chunks) - audio).max() <= 1e-6
+
+    (tmp_path / "broken.wav").write_bytes(b"not audio")
+    with pytest.raises(ValueError):
+        list(stream_audio(str(tmp_path / "broken.wav"), SAMPLE_RATE))
+
+
+def test_stream_decoder():
+    audio = np.concatenate([AUDIO, AUDIO, AUDIO])
+    data = encode(audio, SAMPLE_RATE, "FLAC", "PCM_16")
+    decoder = StreamDecoder(SAMPLE_RATE)
+    chunks = [decoder.feed(data[i : i + 2000]) for i in range(0, len(data), 2000)]
+    # the chunks are decoded as they arrive, not only once the recording ends
+    deadline = time.monotonic() + 5
+    while sum(len(c) for c in chunks) == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+        chunks.append(decoder.feed(b""))
+    assert sum(len(c) for c in chunks) > 0
+
+    chunks.append(decoder.close())
+    assert np.abs(np.concatenate(chunks) - audio).max() <= 1e-4
+
+    decoder = StreamDecoder(SAMPLE_RATE)
+    decoder.feed(b"not audio")
+    with pytest.raises(ValueError):
+        decoder.close()
@@ -0,0 +1,26 @@
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import numpy as np
+
+from kth_sr.batching import BatchedPredictor
+
+
+def test_batched_predictor_pads_batches(fake_predict):
+    shapes = []
+
+    def predict_on_batch(windows):
+        shapes.append(windows.shape)
+        return fake_predict(windows + 1)
+
+    model = SimpleNamespace(m=SimpleNamespace(predict_on_batch=predict_on_batch))
+    rng = np.random.default_rng(0)
+    requests = [rng.random((n, 160, 64, 1), dtype=np.float32) for n in [3, 5, 12]]
+
+    with BatchedPredictor(model, batch_size=8, compiled=False) as predictor:
+        with ThreadPoolExecutor(len(requests)) as executor:
+            results = list(executor.map(predictor.predict, requests))
+
+    assert set(shapes) == {(8, 160, 64, 1)}
+    for windows, embeddings in zip(requests, results):
+        np.testing.assert_allclose(embeddings, fake_predict(windows + 1), rtol=1e-6)
@@ -0,0 +1,140 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from kth_sr.cache import EmbeddingCache
+
+AUDIO = np.linspace(-1, 1, 1600, dtype=np.float32)
+
+
+@pytest.mark.parametrize(
+    "audio, params",
+    [
+        (AUDIO[::-1], (16000, 160, 5, "model")),  # different audio
+        (AUDIO, (8000, 160, 5, "model")),  # different sample rate
+        (AUDIO, (16000, 100, 5, "model")),  # different number of frames
+        (AUDIO, (16000, 160, 10, "model")),  # different k
+        (AUDIO, (16000, 160, 5, "other_model")),  # different checkpoint
+    ],
+)
+def test_key(audio, params):
+    key = EmbeddingCache.key(AUDIO, 16000, 160, 5, "model")
+    assert key == EmbeddingCache.key(AUDIO.copy(), 16000, 160, 5, "model")
+    assert key != EmbeddingCache.key(audio, *params)
+
+
+def test_memory_lru():
+    cache = EmbeddingCache(max_items=2)
+    cache.put("a", np.zeros(2))
+    cache.put("b", np.ones(2))
+    assert cache.get("a") is not None  # "b" is now least recently used
+    cache.put("c", np.ones(2))
+
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+    assert cache.stats() == {
+        "hits": 2,
+        "disk_hits": 0,
+        "misses": 1,
+        "items": 2,
+        "disk_bytes": 0,
+    }
+
+
+def test_disk_tier(tmp_path):
+    cache = EmbeddingCache(max_items=1, disk_path=tmp_path)
+    cache.put("a", np.arange(4))
+    cache.put("b", np.arange(4))  # evicts "a" from memory
+
+    assert (cache.get("a") == np.arange(4)).all()
+    assert cache.disk_hits == 1
+
+    # disk tier survives the process
+    cache2 = EmbeddingCache(disk_path=tmp_path)
+    assert cache2.get("b") is not None
+    assert cache2.stats()["disk_bytes"] == cache.stats()["disk_bytes"]
+
+
+def test_disk_eviction(tmp_path):
+    cache = EmbeddingCache(max_items=1, disk_path=tmp_path, max_disk_bytes=1000)
+    for key in "abcde":
+        cache.put(key, np.zeros(50))  # 528 bytes per file
+
+    assert cache.stats()["disk_bytes"] <= 1000
+    assert len(list(tmp_path.glob("*.npy"))) == 1
+    assert (tmp_path / "e.npy").exists()
+
+
+def test_get_or_compute():
+    cache = EmbeddingCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return np.ones(3)
+
+    cache.get_or_compute("a", compute)
+    value = cache.get_or_compute("a", compute)
+
+    assert len(calls) == 1
+    assert (value == 1).all()
+    assert not value.flags.writeable
+
+
+def test_put_copies():
+    cache = EmbeddingCache()
+    embeddings = np.zeros(3)
+    cache.put("a", embeddings)
+    embeddings[0] = 1
+
+    # the array of the caller stays writable and changing it does not change the cache
+    assert embeddings.flags.writeable
+    assert (cache.get("a") == 0).all()
+
+
+def test_single_flight():
+    cache = EmbeddingCache()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return np.ones(3)
+
+    with ThreadPoolExecutor(4) as pool:
+        futures = [pool.submit(cache.get_or_compute, "a", compute) for _ in range(4)]
+        started.wait(5)
+        release.set()
+        values = [future.result() for future in futures]
+
+    assert len(calls) == 1
+    assert all(value is values[0] for value in values)
+    assert cache.stats()["misses"] == 1
+
+
+def test_slow_disk_does_not_block_memory(tmp_path, monkeypatch):
+    cache = EmbeddingCache(max_items=1, disk_path=tmp_path)
+    cache.put("disk", np.zeros(3))
+    cache.put("memory", np.ones(3))  # evicts "disk" from memory
+
+    reading, release = threading.Event(), threading.Event()
+    load = np.load
+
+    def slow_load(*args, **kwargs):
+        reading.set()
+        release.wait(5)
+        return load(*args, **kwargs)
+
+    monkeypatch.setattr(np, "load", slow_load)
+    with ThreadPoolExecutor(1) as pool:
+        disk_read = pool.submit(cache.get, "disk")
+        reading.wait(5)
+        # served while the disk read is still running
+        assert (cache.get("memory") == 1).all()
+        assert not disk_read.done()
+        release.set()
+        assert (disk_read.result() == 0).all()
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from kth_sr.columnar import read_table, write_table
+from kth_sr.loaddata import convert_metadata, read_metadata
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    rng = np.random.default_rng(0)
+    n = 500
+    pd.DataFrame(
+        {
+            "speaker": [f"id{s:05d}" for s in rng.integers(0, 40, n)],
+            "video": [f"video_{i}" for i in range(n)],
+            "start_time": rng.random(n),
+            "length": rng.integers(1, 20, n),
+            "txt_file": [None if i % 7 == 0 else f"{i:05d}.txt" for i in range(n)],
+        }
+    ).to_csv(tmp_path / "dev.csv", index=False)
+    return tmp_path
+
+
+@pytest.mark.parametrize(
+    "speakers, columns, first",
+    [
+        (None, None, False),
+        (["id00003", "id00001", "unknown", "id00003"], ["video", "length"], False),
+        (["id00039", "id00000"], ["start_time", "txt_file"], True),
+        ([], ["video"], False),
+        (None, ["speaker", "video"], True),
+    ],
+)
+def test_read_metadata(data_dir, speakers, columns, first):
+    from_csv = read_metadata("dev", speakers, columns, first, str(data_dir))
+    convert_metadata(str(data_dir))
+    from_table = read_metadata("dev", speakers, columns, first, str(data_dir))
+
+    assert (data_dir / "dev" / "table.json").exists()
+    pd.testing.assert_frame_equal(
+        from_table.fillna(""), from_csv.fillna(""), check_dtype=False
+    )
+    if speakers:
+        assert set(from_table["speaker"]) == set(speakers) - {"unknown"}
+
+
+def test_read_table_only_selected_rows(tmp_path):
+    df = pd.DataFrame({"speaker": ["b", "a", "b", "c", "a"], "row": range(5)})
+    write_table(df, str(tmp_path / "table"), "speaker")
+
+    table = read_table(str(tmp_path / "table"), ["b", "a"])
+    assert table["speaker"].tolist() == ["a", "a", "b", "b"]
+    assert table["row"].tolist() == [1, 4, 0, 2]
+    assert read_table(str(tmp_path / "table"), ["c"], first=True)["row"].tolist() == [3]
+
+    with pytest.raises(ValueError):
+        read_table(str(tmp_path / "table"), columns=["missing"])
+    with pytest.raises(ValueError):
+        write_table(df, str(tmp_path / "other"), "missing")
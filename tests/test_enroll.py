@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from kth_sr.enroll import enroll
+from kth_sr.vectorstore import FAISS
+
+
+def run(clips, store_path, predict, **kwargs):
+    return enroll(
+        clips["path"].tolist(),
+        clips["speaker"].tolist(),
+        str(store_path),
+        predict,
+        workers=0,
+        chunk_clips=3,
+        k=2,
+        **kwargs,
+    )
+
+
+def test_enroll(clips, fake_predict, tmp_path):
+    store, throughput = run(clips, tmp_path / "store", fake_predict)
+
+    # the broken clip is skipped, every other clip has 2 windows
+    assert store._vstore.ntotal == 18
+    assert sorted(set(store.metadata)) == ["id001", "id002", "id003"]
+    assert set(throughput) == {"features", "embed", "index", "total"}
+    assert not (tmp_path / "store" / "enrollment").exists()
+
+    loaded = FAISS.load(str(tmp_path / "store"))
+    assert loaded.metadata == store.metadata
+
+
+def test_enroll_resumes(clips, fake_predict, tmp_path):
+    calls = []
+
+    def crashing_predict(windows):
+        if len(calls) == 2:
+            raise RuntimeError("crash")
+        calls.append(len(windows))
+        return fake_predict(windows)
+
+    work_dir = tmp_path / "work"
+    with pytest.raises(RuntimeError):
+        run(clips, tmp_path / "store", crashing_predict, work_dir=str(work_dir))
+    assert len(list(work_dir.glob("chunk_*.npz"))) == 2
+
+    calls.clear()
+    resumed, _ = run(
+        clips, tmp_path / "store", crashing_predict, work_dir=str(work_dir)
+    )
+    # only the third chunk is embedded, the fourth holds just the broken clip
+    assert calls == [6]
+
+    expected, _ = run(clips, tmp_path / "expected", fake_predict)
+    assert resumed.metadata == expected.metadata
+    np.testing.assert_allclose(resumed._live_vectors()[0], expected._live_vectors()[0])
+
+
+def test_enroll_other_clips(clips, fake_predict, tmp_path):
+    work_dir = tmp_path / "work"
+    run(clips, tmp_path / "store", fake_predict, work_dir=str(work_dir))
+
+    with pytest.raises(ValueError):
+        run(clips[:3], tmp_path / "store", fake_predict, work_dir=str(work_dir))
+
+
+def test_enroll_other_checkpoint(clips, fake_predict, tmp_path):
+    work_dir = tmp_path / "work"
+    run(clips, tmp_path / "store", fake_predict, work_dir=str(work_dir), checkpoint="a")
+
+    with pytest.raises(ValueError):
+        run(
+            clips,
+            tmp_path / "store",
+            fake_predict,
+            work_dir=str(work_dir),
+            checkpoint="b",
+        )
+
+
+def test_enroll_trains_index(clips, fake_predict, tmp_path):
+    store, _ = run(
+        clips, tmp_path / "store", fake_predict, index_type="ivf_flat", nlist=2
+    )
+
+    assert store.is_trained
+    assert store._vstore.ntotal == 18
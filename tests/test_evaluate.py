@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from kth_sr.enroll import enroll
+from kth_sr.evaluate import embed_clips, score
+
+
+@pytest.fixture
+def store(clips, fake_predict, tmp_path):
+    enrolled = clips[clips["speaker"] != "id003"]
+    store, _ = enroll(
+        enrolled["path"].tolist(),
+        enrolled["speaker"].tolist(),
+        str(tmp_path / "store"),
+        fake_predict,
+        workers=0,
+        k=3,
+    )
+    return store
+
+
+def test_score(clips, store, fake_predict):
+    embeddings, lengths, throughput = embed_clips(
+        clips["path"].tolist(), fake_predict, workers=0, chunk_clips=2, k=3
+    )
+    assert lengths.tolist() == [3] * 9 + [0]
+    assert set(throughput) == {"features", "embed"}
+
+    result = score(store, embeddings, lengths, clips["speaker"].tolist())
+    # queries are the enrolled clips, unknown and broken clips are left out
+    assert (result["n_clips"], result["n_failed"], result["n_unknown"]) == (10, 1, 3)
+    assert result["top1"] == result["top5"] == 1.0
+    assert result["rejected"] == 0.0
+
+    for aggregation, threshold in [("mean", -1.0), ("vote", 1.1)]:
+        result = score(
+            store,
+            embeddings,
+            lengths,
+            clips["speaker"].tolist(),
+            aggregation=aggregation,
+            threshold=threshold,
+        )
+        assert result["rejected"] == 1.0
+        assert result["top1"] == result["top5"] == 0.0
+
+    with pytest.raises(ValueError):
+        score(store, embeddings, lengths, ["id001"])
+
+
+def test_embed_clips_cache(clips, fake_predict, tmp_path):
+    paths = clips["path"].tolist()
+    cache_path = str(tmp_path / "cache.npz")
+    calls = []
+
+    def predict(windows):
+        calls.append(len(windows))
+        return fake_predict(windows)
+
+    embeddings, lengths, _ = embed_clips(paths, predict, cache_path, workers=0, k=3)
+    assert calls == [27]
+    assert lengths.tolist() == [3] * 9 + [0]
+
+    # fewer windows per clip are the first windows of the cached ones
+    calls.clear()
+    cached, cached_lengths, throughput = embed_clips(
+        paths, predict, cache_path, workers=0, k=2
+    )
+    assert calls == [] and throughput == {}
+    assert cached_lengths.tolist() == [2] * 9 + [0]
+    np.testing.assert_array_equal(
+        cached, embeddings.reshape(9, 3, -1)[:, :2].reshape(18, -1)
+    )
+    fresh, _, _ = embed_clips(paths, fake_predict, workers=0, k=2)
+    np.testing.assert_allclose(cached, fresh)
+
+    # more windows or other clips are embedded again
+    embed_clips(paths, predict, cache_path, workers=0, k=4)
+    embed_clips(paths[1:], predict, cache_path, workers=0, k=4)
+    assert calls == [36, 32]
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from kth_sr.features import FeatureStore, embed_features, extract_corpus
+
+
+def random_windows(rng, n: int) -> np.ndarray:
+    return rng.random((n, 160, 64, 1), dtype=np.float32)
+
+
+def test_feature_store(tmp_path):
+    rng = np.random.default_rng(0)
+    windows = [random_windows(rng, n) for n in [3, 1, 2, 3]]
+    features = FeatureStore(str(tmp_path / "features"), k=3)
+    features.append(["a0", "b0"], ["a", "b"], windows[:2])
+    features.append(["a1", "c0"], ["a", "c"], windows[2:])
+
+    reopened = FeatureStore(str(tmp_path / "features"), k=3)
+    assert (reopened.n_clips, reopened.n_windows) == (4, 9)
+    assert reopened.paths == ["a0", "b0", "a1", "c0"]
+    np.testing.assert_array_equal(reopened.clip_windows(2), windows[2])
+
+    speaker_windows, lengths = reopened.speaker_windows("a")
+    assert lengths.tolist() == [3, 2]
+    np.testing.assert_array_equal(speaker_windows, np.concatenate(windows[::2]))
+    assert len(reopened.speaker_windows("unknown")[0]) == 0
+
+    batches = list(reopened.batches(batch_size=4))
+    assert [len(b) for b, _ in batches] == [4, 4, 1]
+    np.testing.assert_array_equal(
+        np.concatenate([b for b, _ in batches]), np.concatenate(windows)
+    )
+    assert [label for _, labels in batches for label in labels] == list("aaabaaccc")
+
+    with pytest.raises(ValueError):
+        FeatureStore(str(tmp_path / "features"), k=5)
+    with pytest.raises(ValueError):
+        reopened.append(["d0"], ["d"], [random_windows(rng, 4)])
+
+
+def test_interrupted_append(tmp_path):
+    rng = np.random.default_rng(0)
+    path = tmp_path / "features"
+    features = FeatureStore(str(path))
+    features.append(["a0"], ["a"], [random_windows(rng, 2)])
+
+    # an append killed before its description was written
+    with open(path / "windows.bin", "ab") as f:
+        f.write(random_windows(rng, 3).tobytes())
+    np.save(path / "offsets.npy", np.array([0, 2, 5]))
+
+    features = FeatureStore(str(path))
+    assert (features.n_clips, features.n_windows) == (1, 2)
+    new_windows = random_windows(rng, 1)
+    features.append(["b0"], ["b"], [new_windows])
+    np.testing.assert_array_equal(FeatureStore(str(path)).clip_windows(1), new_windows)
+    assert (path / "windows.bin").stat().st_size == 3 * new_windows.nbytes
+
+
+def test_extract_and_embed(clips, fake_predict, tmp_path):
+    paths, speakers = clips["path"].tolist(), clips["speaker"].tolist()
+
+    features = FeatureStore(str(tmp_path / "features"), k=2)
+    assert extract_corpus(paths[:2], speakers[:2], features, workers=0) == 2
+    # clips already in the store are not decoded again
+    assert extract_corpus(paths, speakers, features, workers=0, chunk_clips=2) == 7
+    assert features.n_clips == 9 and features.n_windows == 18
+
+    store, _ = embed_features(
+        features, str(tmp_path / "store"), fake_predict, batch_size=3
+    )
+    assert store.metadata == ["id001"] * 6 + ["id002"] * 6 + ["id003"] * 6
+    trained, _ = embed_features(
+        features,
+        str(tmp_path / "ivf"),
+        fake_predict,
+        batch_size=3,
+        train_size=6,
+        index_type="ivf_flat",
+        nlist=2,
+    )
+    assert trained.is_trained and trained.metadata == store.metadata
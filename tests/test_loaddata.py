@@ -0,0 +1,51 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from kth_sr.loaddata import SpeakerRecords
+
+
+@pytest.fixture
+def celebs():
+    return pd.DataFrame(
+        {
+            "VoxCeleb2_ID": ["id00001", "id00002", "id00003", "id00002"],
+            "Name": ["Ada", "Grace", "Alan", "Duplicate"],
+            "start_time": [0, 12, 7, 3],
+            "image_url": ["a.jpg", np.nan, "c.jpg", "d.jpg"],
+        }
+    )
+
+
+@pytest.mark.parametrize(
+    "speaker_ids, names",
+    [
+        (["id00003", "id00001"], ["Alan", "Ada"]),
+        (["id00002", "unknown", "id00003"], ["Grace", "Alan"]),
+        ([], []),
+    ],
+)
+def test_speaker_records(celebs, speaker_ids, names):
+    records = SpeakerRecords.from_frame(celebs)
+
+    assert len(records) == 3
+    assert [r["Name"] for r in json.loads(records.json(speaker_ids))] == names
+    assert [r["Name"] for r in records.records(speaker_ids)] == names
+
+
+def test_speaker_records_values(celebs):
+    records = SpeakerRecords.from_frame(celebs)
+
+    assert records.records(["id00002"]) == [
+        {
+            "VoxCeleb2_ID": "id00002",
+            "Name": "Grace",
+            "start_time": 12,
+            "image_url": None,
+        }
+    ]
+    # callers get copies, the store stays unchanged
+    records.records(["id00001"])[0]["Name"] = "changed"
+    assert records.records(["id00001"])[0]["Name"] == "Ada"
@@ -0,0 +1,66 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from kth_sr import metrics as metrics_module
+from kth_sr.metrics import Metrics, traced
+
+
+def measure(metrics, seconds: float, windows: int) -> int:
+    # the registry of the process, e.g. in a worker
+    metrics = metrics or metrics_module.metrics
+    metrics.observe("embed", seconds)
+    metrics.count("windows", windows)
+    return windows
+
+
+@pytest.mark.parametrize(
+    "seconds, bucket", [(0.0005, 'le="0.0005"} 1'), (0.003, 'le="0.005"} 1')]
+)
+def test_render(seconds, bucket):
+    metrics = Metrics(buckets=(0.0005, 0.001, 0.005))
+    measure(metrics, seconds, 100)
+    measure(metrics, 20.0, 50)
+    text = metrics.render()
+
+    assert "# TYPE kth_sr_stage_seconds histogram" in text
+    assert f'kth_sr_stage_seconds_bucket{{stage="embed",{bucket}' in text
+    assert 'kth_sr_stage_seconds_bucket{stage="embed",le="+Inf"} 2' in text
+    assert 'kth_sr_stage_seconds_count{stage="embed"} 2' in text
+    assert f'kth_sr_stage_seconds_sum{{stage="embed"}} {seconds + 20:.6f}' in text
+    assert "kth_sr_windows_total 150" in text
+
+
+def test_trace():
+    metrics = Metrics()
+    measure(metrics, 0.1, 1)
+    with metrics.trace() as trace:
+        with metrics.timer("search"):
+            pass
+        measure(metrics, 0.2, 5)
+        measure(metrics, 0.3, 5)
+
+    assert set(trace.stages) == {"search", "embed"}
+    assert trace.stages["embed"] == pytest.approx(0.5)
+    assert trace.counts == {"windows": 10}
+    assert trace.to_dict()["stages_ms"]["embed"] == pytest.approx(500)
+    assert "kth_sr_windows_total 11" in metrics.render()
+
+
+@pytest.mark.parametrize("in_process", [True, False])
+def test_traced(in_process):
+    metrics = Metrics()
+    with metrics.trace() as request_trace:
+        if in_process:
+            result, trace = traced(measure, metrics, 0.2, 5)
+        else:
+            with ProcessPoolExecutor(1) as pool:
+                result, trace = pool.submit(traced, measure, None, 0.2, 5).result()
+        # measurements of traced calls count only once they are recorded
+        assert "kth_sr_windows_total" not in metrics.render()
+        metrics.record(trace)
+
+    assert result == 5
+    assert trace.counts == request_trace.counts == {"windows": 5}
+    assert request_trace.stages["embed"] == pytest.approx(0.2)
+    assert "kth_sr_windows_total 5" in metrics.render()
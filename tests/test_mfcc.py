@@ -0,0 +1,158 @@
+import numpy as np
+import pytest
+from deep_speaker.audio import mfcc_fbank
+
+from kth_sr.mfcc import (
+    WindowStream,
+    best_k_windows,
+    first_k_windows,
+    first_k_windows_batch,
+    frame_quality,
+    voiced_span,
+    window_samples,
+)
+
+SAMPLE_RATE = 16000
+NUM_FRAMES = 160
+
+
+def make_audio(n_samples: int) -> np.ndarray:
+    audio = np.random.default_rng(0).normal(size=n_samples).astype(np.float32)
+    # loud samples at both ends, so the whole audio is voiced
+    audio[0] = audio[-1] = 100
+    return audio
+
+
+def test_window_samples():
+    # 25 ms frames with 10 ms step at 16 kHz
+    assert window_samples(SAMPLE_RATE, 1) == 400
+    assert window_samples(SAMPLE_RATE, NUM_FRAMES) == 159 * 160 + 400
+    assert window_samples(SAMPLE_RATE, NUM_FRAMES, 2) == 319 * 160 + 400
+
+
+def test_voiced_span():
+    audio = np.full(100, 0.1, dtype=np.float32)
+    audio[10] = 1
+    audio[50] = -2
+    assert voiced_span(audio) == (10, 50)
+
+
+@pytest.mark.parametrize(
+    "n_samples, k, expected_windows",
+    [
+        (window_samples(SAMPLE_RATE, NUM_FRAMES, 3) + 1, 3, 3),
+        (window_samples(SAMPLE_RATE, NUM_FRAMES, 3) + 1, 5, 4),  # last one padded
+        (16000, 5, 1),  # shorter than one window
+        (16000 * 60, 5, 5),  # long audio
+    ],
+)
+def test_first_k_windows(n_samples, k, expected_windows):
+    audio = make_audio(n_samples)
+    windows = first_k_windows(audio, SAMPLE_RATE, NUM_FRAMES, k)
+
+    assert windows.shape == (expected_windows, NUM_FRAMES, 64, 1)
+    # windows are the first frames of the whole voiced audio
+    mfcc = mfcc_fbank(audio[: len(audio) - 1], SAMPLE_RATE)
+    n_frames = min(len(mfcc), expected_windows * NUM_FRAMES)
+    frames = windows.reshape((-1, 64))
+    assert np.allclose(frames[:n_frames], mfcc[:n_frames], atol=1e-5)
+    assert (frames[n_frames:] == 0).all()
+
+
+def test_first_k_windows_batch():
+    audios = [make_audio(16000 * 10), make_audio(16000)]
+    windows, lengths = first_k_windows_batch(audios, SAMPLE_RATE, NUM_FRAMES, 3)
+
+    assert lengths.tolist() == [3, 1]
+    assert windows.shape == (4, NUM_FRAMES, 64, 1)
+    assert np.array_equal(
+        windows[3:], first_k_windows(audios[1], SAMPLE_RATE, NUM_FRAMES, 3)
+    )
+
+
+def make_recording() -> np.ndarray:
+    """3 s silence, 2 s clipped noise, 4 s clean noise standing in for speech."""
+    rng = np.random.default_rng(0)
+    silence = 0.001 * rng.normal(size=3 * SAMPLE_RATE)
+    clipped = np.clip(3 * rng.normal(size=2 * SAMPLE_RATE), -1, 1)
+    speech = 0.2 * rng.normal(size=4 * SAMPLE_RATE)
+    return np.concatenate([silence, clipped, speech, silence]).astype(np.float32)
+
+
+def test_frame_quality():
+    quality = frame_quality(make_recording(), SAMPLE_RATE)
+
+    assert len(quality) == (len(make_recording()) - 400) // 160 + 1
+    assert (quality[:290] < 0.1).all()  # silence
+    assert (quality[310:490] < 0.1).all()  # clipped
+    assert (quality[510:890] > 0.9).all()  # speech
+
+
+@pytest.mark.parametrize(
+    "k, starts",
+    [
+        (1, [520]),
+        (2, [520, 680]),
+    ],
+)
+def test_best_k_windows(k, starts):
+    audio = make_recording()
+    windows = best_k_windows(audio, SAMPLE_RATE, NUM_FRAMES, k)
+
+    length = window_samples(SAMPLE_RATE, NUM_FRAMES)
+    expected = [
+        mfcc_fbank(audio[s * 160 : s * 160 + length], SAMPLE_RATE) for s in starts
+    ]
+    assert windows.shape == (k, NUM_FRAMES, 64, 1)
+    assert np.array_equal(windows[..., 0], np.stack(expected))
+
+
+def test_best_k_windows_short_audio():
+    audio = make_audio(16000)
+    windows = best_k_windows(audio, SAMPLE_RATE, NUM_FRAMES, 5)
+    assert np.array_equal(windows, first_k_windows(audio, SAMPLE_RATE, NUM_FRAMES, 1))
+
+    # at most the windows which do not overlap
+    audio = make_audio(window_samples(SAMPLE_RATE, NUM_FRAMES, 3))
+    assert len(best_k_windows(audio, SAMPLE_RATE, NUM_FRAMES, 10)) == 3
+
+
+@pytest.mark.parametrize("hop_frames", [None, 40])
+def test_window_stream(hop_frames):
+    audio = make_audio(16000 * 10)
+    stream = WindowStream(SAMPLE_RATE, NUM_FRAMES, hop_frames)
+    results = [stream.push(audio[i : i + 7000]) for i in range(0, len(audio), 7000)]
+    windows = np.concatenate([w for w, _ in results])
+    starts = np.concatenate([s for _, s in results])
+
+    hop = hop_frames or NUM_FRAMES
+    assert starts.tolist() == [i * hop * 160 for i in range(len(windows))]
+    # all complete windows were returned, the rest is buffered
+    assert stream.offset + len(stream._buffer) == len(audio)
+    assert len(stream._buffer) < window_samples(SAMPLE_RATE, NUM_FRAMES)
+
+    # same frames as offline features, up to pre-emphasis at the chunk boundaries
+    mfcc = mfcc_fbank(audio, SAMPLE_RATE)
+    for window, start in zip(windows, starts // 160):
+        assert np.allclose(window[1:, :, 0], mfcc[start + 1 : start + NUM_FRAMES])
+
+
+@pytest.mark.parametrize("n_samples", [8000, 16000 * 10])
+def test_window_stream_flush(n_samples):
+    audio = make_audio(n_samples)
+    stream = WindowStream(SAMPLE_RATE, NUM_FRAMES)
+    for i in range(0, n_samples, 7000):
+        stream.push(audio[i : i + 7000])
+    offset = stream.offset
+
+    # the tail is padded with zeros as by `first_k_windows`
+    windows, starts = stream.flush()
+    tail = mfcc_fbank(audio[offset:], SAMPLE_RATE)
+    assert starts.tolist() == [offset]
+    assert windows.shape == (1, NUM_FRAMES, 64, 1)
+    assert np.array_equal(windows[0, : len(tail), :, 0], tail)
+    assert not windows[0, len(tail) :].any()
+
+    # nothing is left to flush
+    assert len(stream.flush()[0]) == 0
+    assert stream.offset == n_samples
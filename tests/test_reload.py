@@ -0,0 +1,131 @@
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from kth_sr.reload import VersionedStore
+
+
+class Store:
+    def __init__(self, path):
+        self.name = (Path(path) / "name.txt").read_text()
+
+
+def make_store(tmp_path, name: str):
+    path = tmp_path / name
+    path.mkdir(exist_ok=True)
+    (path / "name.txt").write_text(name)
+    return path
+
+
+def test_swap_waits_for_requests(tmp_path):
+    released = []
+    stores = VersionedStore(Store, released.append)
+    with pytest.raises(ValueError):
+        with stores.acquire():
+            pass
+
+    stores.load(make_store(tmp_path, "old"))
+    with stores.acquire() as old:
+        stores.reload(make_store(tmp_path, "new")).join()
+        # the request started on the old store finishes on it
+        assert old.name == "old"
+        with stores.acquire() as new:
+            assert new.name == "new"
+        assert stores.status()["draining"] == [1]
+        assert released == []
+
+    assert [store.name for store in released] == ["old"]
+    status = stores.status()
+    assert (status["version"], status["draining"]) == (2, [])
+
+    # nothing uses the replaced store, it is released right away
+    stores.load(make_store(tmp_path, "newer"))
+    assert [store.name for store in released] == ["old", "new"]
+
+
+def test_failed_reload_keeps_store(tmp_path):
+    stores = VersionedStore(Store)
+    stores.load(make_store(tmp_path, "old"))
+
+    stores.reload(tmp_path / "missing").join()
+    assert "missing" in stores.error
+    with stores.acquire() as store:
+        assert store.name == "old"
+
+
+def test_watch_reloads_changed_store(tmp_path):
+    path = make_store(tmp_path, "store")
+    stores = VersionedStore(Store)
+    stores.load(path)
+    stores.watch(interval_s=0.02)
+    try:
+        (path / "name.txt").write_text("saved again")
+        deadline = time.monotonic() + 5
+        while stores.current.number == 1 and time.monotonic() < deadline:
+            time.sleep(0.02)
+    finally:
+        stores.stop()
+
+    with stores.acquire() as store:
+        assert store.name == "saved again"
+
+
+def test_watch_skips_failed_store(tmp_path):
+    path = make_store(tmp_path, "store")
+    loads = []
+
+    def load(path):
+        loads.append(path)
+        store = Store(path)
+        if store.name == "broken":
+            raise ValueError("broken store")
+        return store
+
+    stores = VersionedStore(load)
+    stores.load(path)
+    stores.watch(interval_s=0.02)
+    try:
+        (path / "name.txt").write_text("broken")
+        deadline = time.monotonic() + 5
+        while stores.error is None and time.monotonic() < deadline:
+            time.sleep(0.02)
+        # the broken directory is not loaded again while it stays the same
+        time.sleep(0.2)
+        assert len(loads) == 2
+
+        (path / "name.txt").write_text("fixed")
+        while stores.current.number == 1 and time.monotonic() < deadline:
+            time.sleep(0.02)
+    finally:
+        stores.stop()
+
+    assert len(loads) == 3
+    with stores.acquire() as store:
+        assert store.name == "fixed"
+
+
+def test_concurrent_requests_during_reloads(tmp_path):
+    stores = VersionedStore(Store)
+    stores.load(make_store(tmp_path, "0"))
+    errors = []
+    stop = threading.Event()
+
+    def request():
+        while not stop.is_set():
+            with stores.acquire() as store:
+                if store is None or store.name not in {"0", "1", "2"}:
+                    errors.append(store)
+
+    threads = [threading.Thread(target=request) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for name in ["1", "2", "0"]:
+        stores.reload(make_store(tmp_path, name)).join()
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert stores.status()["draining"] == []
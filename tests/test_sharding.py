@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from kth_sr.sharding import ShardedFAISS
+from kth_sr.vectorstore import FAISS
+
+
+@pytest.fixture(scope="module")
+def data():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(200, 4)).astype(np.float32)
+    metadata = [f"s{i % 20}" for i in range(len(vectors))]
+    queries = rng.normal(size=(10, 4)).astype(np.float32)
+    return vectors, metadata, queries
+
+
+@pytest.mark.parametrize("k, threshold", [(5, None), (3, 1.0), (300, None)])
+def test_search_matches_single_store(data, k, threshold):
+    vectors, metadata, queries = data
+    single = FAISS(4)
+    single.add(vectors, metadata)
+
+    with ShardedFAISS(3, dimension=4, threads_per_shard=1) as sharded:
+        sharded.add(vectors, metadata)
+        distances, found = sharded.search(queries, k, threshold)
+
+    expected_distances, expected = single.search(queries, k, threshold)
+    assert found == expected
+    for row, expected_row in zip(distances, expected_distances):
+        np.testing.assert_allclose(row, expected_row, rtol=1e-5)
+
+
+def test_update_save_load(data, tmp_path):
+    vectors, metadata, queries = data
+
+    with ShardedFAISS(2, dimension=4, threads_per_shard=1) as sharded:
+        sharded.add(vectors, metadata)
+        assert sharded.remove("s0") == 10
+        sharded.upsert("s1", queries[:1])
+        sharded.save(tmp_path)
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["shard_0", "shard_1"]
+    with ShardedFAISS.load(tmp_path, threads_per_shard=1) as loaded:
+        _, found = loaded.search(queries[:1], 200)
+
+    assert found[0][0] == "s1"
+    assert len(found[0]) == 200 - 10 - 9
+    assert "s0" not in found[0]
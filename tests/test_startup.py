@@ -0,0 +1,56 @@
+import pytest
+
+from kth_sr.startup import Startup
+
+
+def test_steps_run_in_order():
+    startup = Startup()
+    calls = []
+
+    @startup.step("first")
+    def first():
+        calls.append("first")
+
+    @startup.step("second")
+    def second():
+        calls.append("second")
+
+    assert not startup.ready
+    startup.start()
+    startup.start()
+
+    assert startup.wait(timeout=5)
+    assert calls == ["first", "second"]
+    status = startup.status()
+    assert status["state"] == "ready"
+    assert list(status["timings"]) == ["first", "second"]
+    assert status["time_to_ready"] >= 0
+
+
+def test_failed_step_stops_startup():
+    startup = Startup()
+    calls = []
+
+    @startup.step("broken")
+    def broken():
+        raise RuntimeError("missing weights")
+
+    @startup.step("after")
+    def after():
+        calls.append("after")
+
+    startup.start()
+
+    assert not startup.wait(timeout=5)
+    assert startup.state == "failed"
+    assert startup.error == "broken: missing weights"
+    assert calls == []
+
+
+def test_step_after_start():
+    startup = Startup()
+    startup.start()
+    startup.wait(timeout=5)
+
+    with pytest.raises(ValueError):
+        startup.step("late")(lambda: None)
@@ -0,0 +1,94 @@
+import numpy as np
+
+from kth_sr.streaming import StreamingIdentifier
+from kth_sr.vectorstore import FAISS
+
+SAMPLE_RATE = 16000
+NUM_FRAMES = 160
+
+
+def test_streaming_identifier(storage):
+    calls = []
+
+    def predict(windows):
+        calls.append(len(windows))
+        # every window sounds like speaker "b"
+        return np.tile([[10.0, 9.0]], (len(windows), 1))
+
+    identifier = StreamingIdentifier(
+        predict, storage, SAMPLE_RATE, NUM_FRAMES, k=2, patience=2
+    )
+    rng = np.random.default_rng(0)
+    silence = np.zeros(SAMPLE_RATE, dtype=np.float32)
+    speech = rng.normal(scale=0.3, size=SAMPLE_RATE * 20).astype(np.float32)
+
+    # leading silence is skipped
+    assert identifier.feed(silence) == ([], [])
+    # less than one window of audio
+    assert identifier.feed(speech[:SAMPLE_RATE]) == ([], [])
+
+    for start in range(SAMPLE_RATE, len(speech), SAMPLE_RATE):
+        scores, speakers = identifier.feed(speech[start : start + SAMPLE_RATE])
+        if identifier.done:
+            break
+
+    assert identifier.done
+    assert speakers == ["b", "a"]
+    assert scores[0] < scores[1]
+    # stopped after the leader stayed the same for two updates
+    assert len(calls) == 2
+    assert identifier.n_windows == sum(calls)
+    # audio after the end is ignored
+    identifier.feed(speech)
+    assert len(calls) == 2
+
+
+def test_streaming_identifier_max_windows(storage):
+    identifier = StreamingIdentifier(
+        lambda w: np.zeros((len(w), 2)),
+        storage,
+        SAMPLE_RATE,
+        NUM_FRAMES,
+        max_windows=3,
+        patience=100,
+    )
+    speech = np.random.default_rng(0).normal(scale=0.3, size=SAMPLE_RATE * 10)
+    _, speakers = identifier.feed(speech)
+
+    assert identifier.done
+    assert identifier.n_windows == 3
+    assert speakers == ["a", "b", "c"]
+
+
+def test_streaming_identifier_finish(storage):
+    calls = []
+
+    def predict(windows):
+        calls.append(windows)
+        return np.tile([[10.0, 9.0]], (len(windows), 1))
+
+    identifier = StreamingIdentifier(predict, storage, SAMPLE_RATE, NUM_FRAMES)
+    speech = np.random.default_rng(0).normal(scale=0.3, size=SAMPLE_RATE // 2)
+    # half a second is shorter than a window
+    assert identifier.feed(speech) == ([], [])
+
+    _, speakers = identifier.finish()
+    assert identifier.done
+    assert speakers[0] == "b"
+    assert [len(windows) for windows in calls] == [1]
+    # the window is padded with zeros
+    assert not calls[0][0, -1].any()
+    assert identifier.finish()[1] == speakers
+    assert len(calls) == 1
+
+
+def test_streaming_identifier_empty_store():
+    identifier = StreamingIdentifier(
+        lambda w: np.zeros((len(w), 2)), FAISS(2), SAMPLE_RATE, NUM_FRAMES
+    )
+    speech = np.random.default_rng(0).normal(scale=0.3, size=SAMPLE_RATE * 4)
+    scores, speakers = identifier.feed(speech)
+
+    assert identifier.done
+    assert speakers == [] and len(scores) == 0
+    assert identifier.finish()[1] == []
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+from kth_sr.timeline import Segment, speaker_timeline
+from kth_sr.vectorstore import FAISS
+
+SAMPLE_RATE = 16000
+NUM_FRAMES = 160
+
+
+def tone_predict(windows: np.ndarray) -> np.ndarray:
+    """Windows of low tones sound like speaker "a", of high tones like "b"."""
+    high = windows[..., 0].mean(axis=1).argmax(axis=1) > 32
+    return np.where(high[:, None], [10.0, 10.0], [0.0, 0.5])
+
+
+def tones(*parts) -> np.ndarray:
+    """Concatenate tones given as pairs of frequency and seconds."""
+    return np.concatenate(
+        [
+            0.3
+            * np.sin(2 * np.pi * freq * np.arange(int(s * SAMPLE_RATE)) / SAMPLE_RATE)
+            for freq, s in parts
+        ]
+    ).astype(np.float32)
+
+
+def chunked(audio: np.ndarray, chunk: int):
+    return (audio[i : i + chunk] for i in range(0, len(audio), chunk))
+
+
+@pytest.mark.parametrize("chunk", [20_000, 16000 * 30])
+def test_speaker_timeline(chunk, storage):
+    audio = tones((300, 10), (4000, 10), (300, 10))
+    segments = list(
+        speaker_timeline(
+            chunked(audio, chunk), tone_predict, storage, SAMPLE_RATE, NUM_FRAMES
+        )
+    )
+
+    assert [s.speaker for s in segments] == ["a", "b", "a"]
+    assert segments[0].start == 0
+    # segments cover the recording without gaps, changes are found within a window
+    assert [s.end for s in segments[:-1]] == [s.start for s in segments[1:]]
+    assert abs(segments[1].start - 10) < 1.6 and abs(segments[2].start - 20) < 1.6
+    assert 30 - 1.6 < segments[-1].end <= 30
+    assert all(isinstance(s, Segment) and s.score >= 0 for s in segments)
+
+
+@pytest.mark.parametrize("smoothing, expected", [(1, ["a", "b", "a"]), (5, ["a"])])
+def test_smoothing(smoothing, expected, storage):
+    # the fifth window sounds like another speaker
+    calls = []
+
+    def predict(windows):
+        index = len(calls) + np.arange(len(windows))
+        calls.extend(index)
+        return np.where((index == 4)[:, None], [10.0, 10.0], [0.0, 0.5])
+
+    segments = speaker_timeline(
+        chunked(tones((300, 12)), 10_000),
+        predict,
+        storage,
+        SAMPLE_RATE,
+        NUM_FRAMES,
+        batch_size=2,
+        smoothing=smoothing,
+    )
+    assert [s.speaker for s in segments] == expected
+    assert len(calls) == 13
+
+
+def test_threshold(storage):
+    segments = list(
+        speaker_timeline(
+            [tones((300, 5))],
+            tone_predict,
+            storage,
+            SAMPLE_RATE,
+            NUM_FRAMES,
+            threshold=-1.0,
+        )
+    )
+    assert [s.speaker for s in segments] == [None]
+
+    with pytest.raises(ValueError):
+        speaker_timeline([], tone_predict, storage, 16000, 160, smoothing=0)
+
+
+def test_empty_store():
+    audio = tones((300, 5))
+    segments = list(
+        speaker_timeline(
+            chunked(audio, 20_000), tone_predict, FAISS(2), SAMPLE_RATE, NUM_FRAMES
+        )
+    )
+    assert [(s.speaker, s.score) for s in segments] == [(None, np.inf)]
+    assert segments[0].start == 0
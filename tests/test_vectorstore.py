@@ -1,5 +1,6 @@
 import shutil
 
+import faiss
 import numpy as np
 import pytest
 
@@ -20,7 +21,7 @@ def test_add_vectors(dimension, array, metadata):
     vstore.add(vectors, metadata)
     if metadata is None:
         metadata = [None] * len(array)
-    assert vstore._metadata == metadata
+    assert vstore.metadata == metadata
     assert vstore._vstore.ntotal == len(array)
 
 
@@ -50,7 +51,7 @@ def test_save_load():
 
     vstore2 = FAISS.load(tmp_path)
 
-    assert vstore2._metadata == metadata
+    assert vstore2.metadata == metadata
     assert vstore2._vstore.ntotal == vectors.shape[0]
     assert vstore2._vstore.d == 2
 
@@ -110,3 +111,361 @@ def test_threshold_search(distances, metadata, threshold, expected_metadata):
         # check each distance row
         assert (distances_filtered[i] <= threshold).all()
         assert len(m) == len(distances_filtered[i])
+
+
+@pytest.mark.parametrize(
+    "distances, metadata",
+    [([], []), (np.empty((0, 5)), []), (np.empty((0, 5)), np.empty((0, 5), object))],
+)
+def test_threshold_search_no_queries(distances, metadata):
+    assert FAISS.apply_threshold(distances, metadata, 1.5) == ([], [])
+
+
+def test_build_speaker_index():
+    vstore = FAISS(2)
+    vstore.add([[0, 0], [10, 10], [0, 2], [10, 12]], ["a", "b", "a", "b"])
+    vstore.build_speaker_index()
+
+    assert vstore._speaker_labels == ["a", "b"]
+    assert vstore._speaker_vstore.ntotal == 2
+    centroids = vstore._speaker_vstore.reconstruct_n(0, 2)
+    assert (centroids == np.array([[0, 1], [10, 11]])).all()
+
+    # adding vectors invalidates the centroids
+    vstore.add([[5, 5]], ["c"])
+    assert vstore._speaker_vstore is None
+
+
+@pytest.mark.parametrize(
+    "aggregation, queries, lengths, k, expected_metadata",
+    [
+        ("mean", [[0, 1], [1, 1]], None, 2, [["a", "b"]]),
+        ("mean", [[0, 1], [10, 10]], [1, 1], 1, [["a"], ["b"]]),
+        # two of three windows are closer to "b"
+        ("vote", [[9, 9], [9, 9], [0, 1]], None, 2, [["b", "a"]]),
+        ("vote", [[9, 9], [0, 1], [0, 0]], [1, 2], 1, [["b"], ["a"]]),
+    ],
+)
+def test_search_speakers(aggregation, queries, lengths, k, expected_metadata):
+    vstore = FAISS(2)
+    vstore.add([[0, 0], [0, 2], [10, 10]], ["a", "a", "b"])
+    scores, metadata = vstore.search_speakers(queries, k, aggregation, lengths)
+    assert metadata == expected_metadata
+    assert len(scores) == len(expected_metadata)
+    assert all(len(s) == k for s in scores)
+
+
+@pytest.mark.parametrize("aggregation", FAISS.AGGREGATIONS)
+@pytest.mark.parametrize("removed", [False, True])
+def test_search_speakers_empty(aggregation, removed, monkeypatch):
+    # removed vectors purged from the index or only marked
+    monkeypatch.setattr(FAISS, "MAX_DEAD_RATIO", 1.0)
+    vstore = FAISS(2)
+    if removed:
+        vstore.add([[0, 0], [10, 10]], ["a", "a"])
+        vstore.remove("a")
+
+    scores, metadata = vstore.search_speakers([[0, 1], [1, 1]], 2, aggregation, [1, 1])
+    assert metadata == [[], []]
+    assert [len(s) for s in scores] == [0, 0]
+    distances, speakers = vstore.speaker_distances([[0, 1]])
+    assert distances.shape == (1, 0) and speakers == []
+
+
+@pytest.mark.parametrize(
+    "aggregation, lengths",
+    [
+        ("median", None),  # unknown aggregation
+        ("mean", [1]),  # lengths do not cover all windows
+        ("mean", [2, 0]),  # empty query
+    ],
+)
+def test_search_speakers_invalid(aggregation, lengths):
+    vstore = FAISS(2)
+    vstore.add([[0, 0], [10, 10]], ["a", "b"])
+    with pytest.raises(ValueError):
+        vstore.search_speakers([[0, 1], [1, 1]], 1, aggregation, lengths)
+
+
+@pytest.mark.parametrize(
+    "index_type, index_params",
+    [
+        ("flat", {}),
+        ("ivf_flat", {"nlist": 4}),
+        ("ivf_pq", {"nlist": 4, "pq_m": 4, "pq_bits": 4}),
+        ("hnsw", {"hnsw_m": 8}),
+        ("sq_fp16", {}),
+        ("sq8", {}),
+    ],
+)
+def test_index_types(index_type, index_params):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(256, 8)).astype(np.float32)
+    metadata = [f"s{i}" for i in range(len(vectors))]
+
+    vstore = FAISS(8, index_type, **index_params)
+    vstore.build(vectors, metadata)
+    if index_type.startswith("ivf"):
+        # visit all clusters to make the search exhaustive
+        vstore.set_search_params(nprobe=4)
+
+    assert vstore.is_trained
+    assert vstore._vstore.ntotal == len(vectors)
+    # lossy PQ codes need not return the query as the nearest vector
+    if index_type != "ivf_pq":
+        _, found = vstore.search(vectors[:10], 1)
+        assert found == [[m] for m in metadata[:10]]
+
+
+def test_add_untrained():
+    vstore = FAISS(2, "ivf_flat", nlist=2)
+    assert not vstore.is_trained
+    with pytest.raises(ValueError):
+        vstore.add([[1, 2], [3, 4]], ["a", "b"])
+
+
+@pytest.mark.parametrize(
+    "index_type, index_params, search_params",
+    [
+        ("flat", {"nlist": 2}, {"nprobe": 2}),  # nprobe needs IVF index
+        ("ivf_flat", {"nlist": 2}, {"ef_search": 2}),  # ef_search needs HNSW index
+        ("pq", {}, {}),  # unknown index type
+        ("flat", {"unknown": 2}, {}),  # unknown index parameter
+    ],
+)
+def test_index_params_invalid(index_type, index_params, search_params):
+    with pytest.raises(ValueError):
+        vstore = FAISS(2, index_type, **index_params)
+        vstore.set_search_params(**search_params)
+
+
+@pytest.mark.parametrize(
+    "index_type, index_params, search_params",
+    [
+        ("ivf_flat", {"nlist": 2}, {"nprobe": 2}),
+        ("hnsw", {"hnsw_m": 4}, {"ef_search": 32}),
+    ],
+)
+def test_save_load_index_type(tmp_path, index_type, index_params, search_params):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(100, 4)).astype(np.float32)
+
+    vstore = FAISS(4, index_type, **index_params)
+    vstore.build(vectors)
+    vstore.set_search_params(**search_params)
+    vstore.save(tmp_path)
+
+    vstore2 = FAISS.load(tmp_path)
+
+    assert vstore2._index_type == index_type
+    assert vstore2._index_params == vstore._index_params
+    assert vstore2._search_params == search_params
+    assert vstore2._vstore.ntotal == len(vectors)
+    assert vstore2._vstore.d == 4
+
+
+def test_save_load_mmap(tmp_path):
+    vectors = np.array([[1, 2], [3, 4], [5, 6]])
+    metadata = ["a", "b", "a"]
+
+    vstore = FAISS(2)
+    vstore.add(vectors, metadata)
+    vstore.save(tmp_path)
+
+    vstore2 = FAISS.load(tmp_path, mmap=True)
+
+    assert vstore2.metadata == metadata
+    assert FAISS.read_labels(tmp_path) == ["a", "b"]
+    assert isinstance(vstore2._codes, np.memmap)
+    _, found = vstore2.search([[5, 6], [3, 4]], 2)
+    assert found == [["a", "b"], ["b", "a"]]
+    # memory-mapped store is read-only
+    with pytest.raises(ValueError):
+        vstore2.add([[7, 8]], ["c"])
+
+
+def test_load_legacy_metadata(tmp_path):
+    vstore = FAISS(2)
+    vstore.add([[1, 2], [3, 4]])
+    vstore.save(tmp_path)
+    # stores saved with a metadata.json list and no config
+    for name in ["labels.json", "codes.npy", "config.json"]:
+        (tmp_path / name).unlink()
+    (tmp_path / "metadata.json").write_text('["a", "b"]')
+
+    vstore2 = FAISS.load(tmp_path)
+
+    assert vstore2.metadata == ["a", "b"]
+    assert vstore2.search([[3, 4]], 1)[1] == [["b"]]
+
+
+def test_search_less_than_k():
+    vstore = FAISS(2)
+    vstore.add([[1, 2], [3, 4]], ["a", "b"])
+    distances, metadata = vstore.search([[1, 2], [3, 4]], 3)
+    # FAISS pads missing results with -1, they should not map to any metadata
+    assert metadata == [["a", "b"], ["b", "a"]]
+    assert [len(d) for d in distances] == [2, 2]
+
+    distances, metadata = vstore.search([[1, 2], [3, 4]], 3, threshold=5)
+    assert metadata == [["a"], ["b"]]
+
+
+@pytest.mark.parametrize(
+    "queries, radius, expected_lims, expected_metadata",
+    [
+        ([[1, 2]], 1, [0, 1], ["a"]),
+        ([[1, 2], [3, 4]], 10, [0, 3, 6], ["a", "c", "b", "b", "c", "a"]),
+        ([[1, 2], [100, 100]], 10, [0, 3, 3], ["a", "c", "b"]),
+        ([[100, 100]], 10, [0, 0], []),
+    ],
+)
+def test_range_search(queries, radius, expected_lims, expected_metadata):
+    vstore = FAISS(2)
+    vstore.add([[1, 2], [3, 4], [3, 2]], ["a", "b", "c"])
+    lims, distances, metadata = vstore.range_search(queries, radius)
+
+    assert lims.tolist() == expected_lims
+    assert metadata.tolist() == expected_metadata
+    assert (distances < radius).all()
+    # results of each query are ordered by distance
+    for start, end in zip(lims[:-1], lims[1:]):
+        assert (np.diff(distances[start:end]) >= 0).all()
+
+
+@pytest.mark.parametrize(
+    "index_type, index_params",
+    [("flat", {}), ("ivf_flat", {"nlist": 2}), ("hnsw", {"hnsw_m": 4}), ("sq8", {})],
+)
+@pytest.mark.parametrize("max_dead_ratio", [0.0, 1.0])  # purged or marked only
+def test_remove_upsert(index_type, index_params, max_dead_ratio, monkeypatch):
+    monkeypatch.setattr(FAISS, "MAX_DEAD_RATIO", max_dead_ratio)
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(60, 4)).astype(np.float32)
+    metadata = [f"s{i % 3}" for i in range(len(vectors))]
+
+    vstore = FAISS(4, index_type, **index_params)
+    vstore.train(vectors)
+    ids = vstore.add(vectors, metadata)
+    if index_type.startswith("ivf"):
+        vstore.set_search_params(nprobe=2)
+
+    assert vstore.remove("s0") == 20
+    assert vstore.remove("s0") == 0
+    assert vstore.remove("unknown") == 0
+    assert len(vstore.metadata) == 40
+    _, found = vstore.search(vectors[:6], 3)
+    assert [len(row) for row in found] == [3] * 6
+    assert all("s0" not in row for row in found)
+    _, _, found = vstore.range_search(vectors[:6], 1e6)
+    assert "s0" not in found
+
+    new_ids = vstore.upsert("s1", vectors[:5] + 100)
+    # ids are never reused
+    assert new_ids.tolist() == list(range(len(ids), len(ids) + 5))
+    assert sorted(vstore.metadata) == ["s1"] * 5 + ["s2"] * 20
+    # every upserted vector is its own nearest neighbour, sq8 clips the shifted
+    # vectors to the range it was trained on
+    distances, found = vstore.search(vectors[:5] + 100, 1)
+    assert found == [["s1"]] * 5
+    if index_type != "sq8":
+        np.testing.assert_allclose(distances, 0, atol=1e-3)
+    _, speakers = vstore.search_speakers(vectors[:5] + 100, 2)
+    assert speakers == [["s1", "s2"]]
+
+
+@pytest.mark.parametrize(
+    "index_type, index_params, search_params",
+    [
+        ("flat", {}, {}),
+        ("ivf_flat", {"nlist": 4}, {"nprobe": 4}),
+        ("hnsw", {"hnsw_m": 8}, {"ef_search": 200}),
+    ],
+)
+def test_remove_filters_in_index(index_type, index_params, search_params, monkeypatch):
+    monkeypatch.setattr(FAISS, "MAX_DEAD_RATIO", 1.0)
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(200, 8)).astype(np.float32)
+    metadata = [f"s{i % 4}" for i in range(len(vectors))]
+    vstore = FAISS(8, index_type, **index_params)
+    vstore.train(vectors)
+    vstore.add(vectors, metadata)
+    vstore.set_search_params(**search_params)
+    vstore.remove("s0")
+
+    # removed vectors are skipped inside the index, with the search parameters of
+    # the store, so exhaustive settings give the exact results of the rest
+    alive = [i for i, m in enumerate(metadata) if m != "s0"]
+    exact = FAISS(8)
+    exact.add(vectors[alive], [metadata[i] for i in alive])
+    distances, found = vstore.search_padded(vectors[:10], 5)
+    expected_distances, expected = exact.search_padded(vectors[:10], 5)
+    assert found.tolist() == expected.tolist()
+    assert np.allclose(distances, expected_distances, atol=1e-4)
+
+
+def test_save_delta(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(30, 4)).astype(np.float32)
+
+    vstore = FAISS(4)
+    vstore.add(vectors, [f"s{i % 3}" for i in range(len(vectors))])
+    vstore.save(tmp_path)
+    codes = (tmp_path / "codes.npy").read_bytes()
+
+    vstore.remove("s0")
+    vstore.upsert("s1", vectors[:2] + 10)
+    vstore.add(vectors[:3] + 20, ["s3"] * 3)
+    vstore.remove("s3")  # added and removed again, not written
+    vstore.save(tmp_path, delta=True)
+
+    # the snapshot is unchanged, the changes are in one segment
+    assert (tmp_path / "codes.npy").read_bytes() == codes
+    assert [p.name for p in (tmp_path / "deltas").iterdir()] == ["000001.npz"]
+
+    vstore2 = FAISS.load(tmp_path)
+    assert vstore2.metadata == vstore.metadata
+    assert vstore2.search(vectors, 4)[1] == vstore.search(vectors, 4)[1]
+    with pytest.raises(ValueError):
+        FAISS.load(tmp_path, mmap=True)
+
+    # ids continue after the ids of the reloaded store
+    assert vstore2.add(vectors[:1], ["s4"]).tolist() == [len(vstore._codes)]
+    vstore2.compact(tmp_path)
+
+    assert list((tmp_path / "deltas").iterdir()) == []
+    vstore3 = FAISS.load(tmp_path)
+    assert vstore3.metadata == vstore2.metadata
+    assert vstore3.search(vectors, 4)[1] == vstore2.search(vectors, 4)[1]
+
+
+def test_save_delta_background_compaction(tmp_path, monkeypatch):
+    monkeypatch.setattr(FAISS, "MAX_DELTAS", 2)
+    vstore = FAISS(2)
+    vstore.add([[1, 2], [3, 4]], ["a", "b"])
+    vstore.save(tmp_path)
+
+    vstore.upsert("a", [[5, 6]])
+    vstore.save(tmp_path, delta=True)
+    assert vstore._compaction is None
+    vstore.upsert("c", [[7, 8]])
+    vstore.save(tmp_path, delta=True)
+    vstore._compaction.join()
+
+    assert list((tmp_path / "deltas").iterdir()) == []
+    assert FAISS.load(tmp_path).metadata == ["b", "a", "c"]
+
+
+def test_load_without_ids(tmp_path):
+    vstore = FAISS(2)
+    vstore.add([[1, 2], [3, 4], [5, 6]], ["a", "b", "a"])
+    vstore.save(tmp_path)
+    # stores saved before stable ids keep the plain index
+    index = faiss.IndexFlatL2(2)
+    index.add(np.array([[1, 2], [3, 4], [5, 6]], dtype=np.float32))
+    faiss.write_index(index, str(tmp_path / "vector_store.index"))
+
+    vstore2 = FAISS.load(tmp_path)
+    assert vstore2.remove("a") == 2
+    assert vstore2.add([[7, 8]], ["c"]).tolist() == [3]
+    assert vstore2.search([[1, 2]], 2)[1] == [["b", "c"]]
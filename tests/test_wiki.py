@@ -0,0 +1,145 @@
+import json
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+
+from kth_sr import loaddata
+from kth_sr.wiki import EMPTY_INFO, TokenBucket, WikiFetcher
+
+
+def summary(title: str) -> dict:
+    return {
+        "title": title,
+        "extract": f"{title} is a   person.",
+        "originalimage": {"source": f"https://images/{title}.svg"},
+        "thumbnail": {"source": f"https://images/{title}.jpg"},
+        "content_urls": {"desktop": {"page": f"https://wiki/{title}"}},
+    }
+
+
+@pytest.fixture
+def server():
+    """Stub of the page summary API, "Flaky" fails twice and "Broken" always."""
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            title = urllib.parse.unquote(self.path.rsplit("/", 1)[1])
+            requests.append(title)
+            if title == "Missing":
+                status, body = 404, {}
+            elif title == "Broken" or (title == "Flaky" and requests.count(title) < 3):
+                status, body = 503, {}
+            else:
+                status, body = 200, summary(title)
+            self.send_response(status)
+            self.end_headers()
+            self.wfile.write(json.dumps(body).encode())
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}/summary/", requests
+    httpd.shutdown()
+
+
+def fetcher(api_url: str, cache_path=None, **kwargs) -> WikiFetcher:
+    return WikiFetcher(cache_path, api_url=api_url, backoff_s=0.01, **kwargs)
+
+
+def test_fetch_all(server, tmp_path):
+    api_url, requests = server
+    cache_path = tmp_path / "wiki.jsonl"
+    names = ["Ada Lovelace", "Flaky", "Missing", "Broken", "Ada Lovelace"]
+
+    info = fetcher(api_url, cache_path, workers=4).fetch_all(names)
+
+    assert info["Ada Lovelace"] == {
+        "image_url": "https://images/Ada_Lovelace.jpg",
+        "wiki_description": "Ada_Lovelace is a person....",
+        "wiki_url": "https://wiki/Ada_Lovelace",
+    }
+    assert info["Flaky"]["wiki_url"] == "https://wiki/Flaky"
+    assert info["Missing"] == info["Broken"] == EMPTY_INFO
+    assert requests.count("Ada_Lovelace") == 1
+    assert requests.count("Flaky") == 3
+    assert requests.count("Broken") == 4
+
+    # found and missing pages are cached, failed ones are fetched again
+    requests.clear()
+    cached = fetcher(api_url, cache_path).fetch_all(names)
+    assert cached == info
+    assert requests == ["Broken"] * 4
+
+
+def test_interrupted_cache(server, tmp_path):
+    api_url, requests = server
+    cache_path = tmp_path / "wiki.jsonl"
+    fetcher(api_url, cache_path).fetch_all(["Ada", "Alan"])
+    with open(cache_path, "a") as f:
+        f.write('{"name": "Grace", "in')
+
+    requests.clear()
+    info = fetcher(api_url, cache_path).fetch_all(["Ada", "Grace"])
+    assert requests == ["Grace"]
+    assert info["Grace"]["wiki_url"] == "https://wiki/Grace"
+    assert len(cache_path.read_text().splitlines()) == 3
+
+
+def test_injected_client():
+    urls = []
+
+    def client(url):
+        urls.append(url)
+        return 200, json.dumps(summary("Alan")).encode()
+
+    info = WikiFetcher(client=client, api_url="stub/").fetch("Alan Turing")
+    assert urls == ["stub/Alan_Turing"]
+    assert info["wiki_url"] == "https://wiki/Alan"
+
+
+@pytest.mark.parametrize("rate, capacity", [(50, 1), (100, 5)])
+def test_token_bucket(rate, capacity):
+    bucket = TokenBucket(rate, capacity)
+    begin = time.monotonic()
+    for _ in range(capacity + 10):
+        bucket.acquire()
+    # the burst is free, the rest is limited to the rate
+    assert time.monotonic() - begin >= 10 / rate * 0.9
+
+
+def test_get_celeb_data(server, tmp_path, monkeypatch):
+    api_url, _ = server
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data").mkdir()
+    pd.DataFrame(
+        {
+            "VoxCeleb2_ID": ["id00001", "id00002"],
+            "VGGFace2_ID": ["n1", "n2"],
+            "Name": ["Ada", "Alan"],
+            "Gender": ["f", "m"],
+            "Set": ["dev", "dev"],
+        }
+    ).to_csv("data/vox2_meta.csv", index=False)
+    pd.DataFrame(
+        {"speaker": ["id00001", "id00002"], "video": ["v1", "v2"], "start_time": 0}
+    ).to_csv("data/dev.csv", index=False)
+    (tmp_path / "store").mkdir()
+    (tmp_path / "store" / "labels.json").write_text('["id00001"]')
+
+    df = loaddata.get_celeb_data(str(tmp_path / "store"), fetcher(api_url))
+    assert df["Name"].tolist() == ["Ada"]
+    assert df["wiki_url"].tolist() == ["https://wiki/Ada"]
+
+    # a speaker added to the store is enriched, the cached table is reused otherwise
+    (tmp_path / "store" / "labels.json").write_text('["id00001", "id00002"]')
+    df = loaddata.get_celeb_data(str(tmp_path / "store"), fetcher(api_url))
+    assert df["Name"].tolist() == ["Ada", "Alan"]
+    assert loaddata.get_celeb_data(str(tmp_path / "store")).equals(df)